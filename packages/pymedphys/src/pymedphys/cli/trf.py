@@ -59,4 +59,21 @@ def trf_to_csv(dicom_subparsers):
         ),
     )
 
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="The number of files to convert in parallel. Defaults to 1.",
+    )
+
+    parser.add_argument(
+        "--skip-if-up-to-date",
+        action="store_true",
+        help=(
+            "Skip any ``.trf`` file whose ``.csv`` files already exist and "
+            "were modified after the ``.trf`` file."
+        ),
+    )
+
     parser.set_defaults(func=trf2csv_cli)
@@ -1,4 +1,9 @@
-from pymedphys_gamma.implementation import gamma_shell, gamma_filter_numpy
+from pymedphys_gamma.implementation import (
+    gamma_shell,
+    gamma_filter_numpy,
+    gamma_pass_rate,
+    GammaPassRate,
+)
 
 from pymedphys_gamma.api import gamma_dicom, gamma_percent_pass
 
@@ -3,7 +3,10 @@
 from pymedphys_databases.msq import (
     mosaiq_connect,
     multi_mosaiq_connect,
+    multi_mosaiq_pool,
+    MosaiqConnectionPool,
     multi_fetch_and_verify_mosaiq,
+    delivery_data_from_mosaiq_bulk,
     get_qcls_by_date,
     get_staff_name,
 )
@@ -1,6 +1,9 @@
 from pymedphys_fileformats.trf import (
     decode_header_from_file,
+    scan_headers,
     trf2csv_by_directory,
     trf2csv,
     trf2pandas,
+    read_trf_columns,
+    TrfStream,
 )
@@ -61,6 +61,21 @@ def remove_irrelevant_control_points(monitor_units, *args):
 
 
 def to_tuple(a):
+    # Fast path for non-empty numeric arrays of at least one dimension,
+    # equivalent to the generic recursion below. The flattened items are
+    # grouped back into nested tuples from the innermost dimension outwards.
+    if (
+        isinstance(a, np.ndarray)
+        and a.ndim >= 1
+        and a.size != 0
+        and a.dtype.kind in "biufc"
+    ):
+        items = iter(list(a.reshape(-1)))
+        for length in a.shape[:0:-1]:
+            items = zip(*[items] * length)
+
+        return tuple(items)
+
     # https://stackoverflow.com/a/10016613/3912576
     try:
         return tuple(to_tuple(i) for i in a)
@@ -0,0 +1,53 @@
+# Copyright (C) 2015-2018 Simon Biggs
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+
+"""Test the conversion of delivery data to nested tuples."""
+
+import numpy as np
+
+from pymedphys_base.delivery.utilities import to_tuple
+
+
+def generic_to_tuple(a):
+    try:
+        return tuple(generic_to_tuple(i) for i in a)
+    except TypeError:
+        return a
+
+
+def test_to_tuple_agrees_with_generic_recursion():
+    for a in [
+        np.array(3.5),
+        np.array(2),
+        np.array([]),
+        np.arange(4),
+        np.arange(24.0).reshape(2, 3, 4),
+        [[1, 2], [3, 4]],
+    ]:
+        result = to_tuple(a)
+        expected = generic_to_tuple(a)
+
+        assert result == expected
+        assert type(result) is type(expected)
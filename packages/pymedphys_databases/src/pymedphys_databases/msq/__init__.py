@@ -35,12 +35,18 @@ Examples:
 """
 
 from .connect import mosaiq_connect, multi_mosaiq_connect
+from .pool import multi_mosaiq_pool, MosaiqConnectionPool, PoolStatistics, PoolTimeout
 from .delivery import (
     delivery_data_from_mosaiq,
+    delivery_data_from_mosaiq_bulk,
     multi_fetch_and_verify_mosaiq,
+    IsolationLevels,
     get_mosaiq_delivery_details,
+    get_mosaiq_delivery_candidates,
+    match_mosaiq_delivery_details,
     OISDeliveryDetails,
     NoMosaiqEntries,
+    MultipleMosaiqEntries,
 )
 
 from .helpers import get_qcls_by_date, get_staff_name
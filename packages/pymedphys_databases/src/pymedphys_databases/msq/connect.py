@@ -27,12 +27,19 @@
 """A toolbox for connecting to Mosaiq SQL.
 """
 
+import datetime
+import decimal
 from contextlib import contextmanager
 from getpass import getpass
 
+import numpy as np
+import pandas as pd
+
 import keyring
 import pymssql
 
+DEFAULT_FETCH_BATCH_SIZE = 5000
+
 
 def execute_sql(cursor, sql_string, parameters=None):
     """Executes a given SQL string on an SQL cursor.
@@ -55,6 +62,126 @@ def execute_sql(cursor, sql_string, parameters=None):
     return data
 
 
+def execute_sql_columns(
+    cursor,
+    sql_string,
+    parameters=None,
+    columns=None,
+    batch_size=DEFAULT_FETCH_BATCH_SIZE,
+    as_dataframe=False,
+):
+    """Executes a given SQL string and returns the results column by column.
+
+    Rows are fetched ``batch_size`` at a time and each column is converted
+    to a typed numpy array. Integer, float and decimal columns become
+    ``int64`` or ``float64`` arrays, with missing values as ``nan``, and
+    date times become ``datetime64``. Binary columns where every value has
+    the same length, such as the Mosaiq leaf positions, become a contiguous
+    array of fixed size void items. Any other column is left as an array of
+    Python objects.
+
+    Args:
+        cursor: A pymssql cursor pointing to the Mosaiq SQL server
+        sql_string: The SQL to execute.
+        parameters: The parameters of the SQL string.
+        columns: The names to give the returned columns. Defaults to the
+            names given within the cursor description.
+        batch_size: The number of rows to fetch at a time.
+        as_dataframe: Return a ``pandas.DataFrame`` rather than a
+            dictionary of numpy arrays.
+
+    Returns:
+        A dictionary mapping each column name to a numpy array, or a
+        dataframe if ``as_dataframe`` is set.
+    """
+    try:
+        cursor.execute(sql_string, parameters)
+    except Exception:
+        print("sql_string:\n    {}\nparameters:\n    {}".format(sql_string, parameters))
+        raise
+
+    if columns is None:
+        columns = [description[0] for description in cursor.description]
+
+    column_values = [[] for _ in columns]
+
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+
+        for values, new_values in zip(column_values, zip(*rows)):
+            values.extend(new_values)
+
+    results = {
+        name: convert_to_column_array(values)
+        for name, values in zip(columns, column_values)
+    }
+
+    if as_dataframe:
+        return pd.DataFrame(
+            {
+                name: column.tolist() if column.dtype.kind == "V" else column
+                for name, column in results.items()
+            },
+            columns=columns,
+        )
+
+    return results
+
+
+def convert_to_column_array(values):
+    types = {type(value) for value in values}
+
+    if not types:
+        return np.array([], dtype=object)
+
+    if types <= {bytes, bytearray}:
+        lengths = {len(value) for value in values}
+        if len(lengths) == 1 and lengths != {0}:
+            return np.frombuffer(
+                b"".join(values), dtype="V{}".format(lengths.pop())
+            ).copy()
+    elif types == {bool}:
+        return np.array(values, dtype=bool)
+    elif types == {int}:
+        try:
+            return np.array(values, dtype=np.int64)
+        except OverflowError:
+            pass
+    elif types <= {int, float, decimal.Decimal, type(None)}:
+        return np.array(
+            [np.nan if value is None else float(value) for value in values],
+            dtype=np.float64,
+        )
+    elif types <= {datetime.datetime, type(None)}:
+        return np.array(values, dtype="datetime64[us]")
+
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+
+    return column
+
+
+def execute_sql_result_sets(cursor, sql_string, parameters=None):
+    """Executes an SQL batch that returns multiple result sets.
+
+    Returns:
+        A list containing the rows of each result set in turn.
+    """
+    try:
+        cursor.execute(sql_string, parameters)
+    except Exception:
+        print("sql_string:\n    {}\nparameters:\n    {}".format(sql_string, parameters))
+        raise
+
+    result_sets = [cursor.fetchall()]
+    while cursor.nextset():
+        result_sets.append(cursor.fetchall())
+
+    return result_sets
+
+
 def get_username_password(storage_name):
 
     user = keyring.get_password("MosaiqSQL_username", storage_name)
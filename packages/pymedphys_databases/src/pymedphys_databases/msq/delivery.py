@@ -27,18 +27,44 @@
 """Uses Mosaiq SQL to extract patient delivery details.
 """
 
-import struct
+import threading
+import traceback
+from datetime import datetime, timedelta
 
 import attr
 import numpy as np
 
+import pymssql
+
 from pymedphys_utilities.transforms import convert_IEC_angle_to_bipolar
 
 from ..delivery import DeliveryDatabases
 
-from .connect import execute_sql
+from .connect import execute_sql, execute_sql_result_sets
 from .constants import FIELD_TYPES
 
+MOSAIQ_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+SNAPSHOT = "SNAPSHOT"
+REPEATABLE_READ = "REPEATABLE READ"
+DEFAULT_ISOLATION_LEVELS = (SNAPSHOT, REPEATABLE_READ)
+DEFAULT_ATTEMPTS = 3
+
+# The errors raised by the server when an isolation level is not supported
+ISOLATION_LEVEL_ERRORS = (pymssql.DatabaseError,)
+
+# SQL Server accepts at most 2100 parameters within a single query
+DEFAULT_BULK_CHUNK_SIZE = 1000
+
+TXFIELDPOINT_COLUMNS = """
+            TxFieldPoint.[Index],
+            TxFieldPoint.A_Leaf_Set,
+            TxFieldPoint.B_Leaf_Set,
+            TxFieldPoint.Gantry_Ang,
+            TxFieldPoint.Coll_Ang,
+            TxFieldPoint.Coll_Y1,
+            TxFieldPoint.Coll_Y2"""
+
 
 @attr.s
 class OISDeliveryDetails(object):
@@ -61,6 +87,46 @@ class NoMosaiqEntries(Exception):
     """Raise an exception when no entry is found"""
 
 
+class InconsistentMosaiqData(Exception):
+    """Raise an exception when Mosaiq data changed while it was being read"""
+
+
+class IsolationLevels:
+    """The isolation levels still to be tried, in order, when reading the
+    delivery data of fields from a single Mosaiq server.
+
+    A level is rejected once the server refused it but a following read on
+    the same cursor succeeded, so later fields go straight to a level that
+    works. Once every level has been rejected the single round trip is no
+    longer attempted. An instance may be shared by threads reading from the
+    same server.
+
+    Args:
+        isolation_levels: The isolation levels to try, in order.
+    """
+
+    def __init__(self, isolation_levels=DEFAULT_ISOLATION_LEVELS):
+        self._isolation_levels = list(isolation_levels)
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        with self._lock:
+            return iter(tuple(self._isolation_levels))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._isolation_levels)
+
+    def reject(self, isolation_levels):
+        """Stop trying the given isolation levels."""
+        with self._lock:
+            self._isolation_levels = [
+                isolation_level
+                for isolation_level in self._isolation_levels
+                if isolation_level not in isolation_levels
+            ]
+
+
 def get_field_type(cursor, field_id):
     execute_string = """
         SELECT
@@ -176,6 +242,141 @@ def get_mosaiq_delivery_details(
     return delivery_details
 
 
+def get_mosaiq_delivery_candidates(cursor, machine, start_time, end_time):
+    """Retrieve every treatment record on a machine within a time window.
+
+    A single query is made for the whole window. The returned rows are to
+    be matched against individual logfiles with
+    ``match_mosaiq_delivery_details``.
+
+    Args:
+        cursor: A pymssql cursor pointing to the Mosaiq SQL server
+        machine: The name of the machine the deliveries occured on
+        start_time: The start of the time window
+        end_time: The end of the time window
+
+    Returns:
+        candidates: A list of rows. The first seven items of each row are
+            the fields of ``OISDeliveryDetails``, followed by the field
+            label, field name, record create time and record edit time.
+    """
+    execute_string = """
+        SELECT
+            Ident.IDA,
+            TxField.FLD_ID,
+            Patient.Last_Name,
+            Patient.First_Name,
+            Tracktreatment.WasQAMode,
+            TxField.Type_Enum,
+            Tracktreatment.WasBeamComplete,
+            TxField.Field_Label,
+            TxField.Field_Name,
+            TrackTreatment.Create_DtTm,
+            TrackTreatment.Edit_DtTm
+        FROM TrackTreatment, Ident, Patient, TxField, Staff
+        WHERE
+            TrackTreatment.Pat_ID1 = Ident.Pat_ID1 AND
+            Patient.Pat_ID1 = Ident.Pat_ID1 AND
+            TrackTreatment.FLD_ID = TxField.FLD_ID AND
+            Staff.Staff_ID = TrackTreatment.Machine_ID_Staff_ID AND
+            REPLACE(Staff.Last_Name, ' ', '') = %(machine)s AND
+            TrackTreatment.Create_DtTm <= %(end_time)s AND
+            TrackTreatment.Edit_DtTm >= %(start_time)s
+        """
+
+    parameters = {
+        "machine": machine,
+        "start_time": convert_to_mosaiq_time_string(start_time),
+        "end_time": convert_to_mosaiq_time_string(end_time),
+    }
+
+    return execute_sql(cursor, execute_string, parameters)
+
+
+def match_mosaiq_delivery_details(
+    candidates, delivery_time, field_label, field_name, buffer=0
+) -> OISDeliveryDetails:
+    """Identifies the patient details for a given delivery time from rows
+    previously retrieved with ``get_mosaiq_delivery_candidates``.
+
+    The matching undertaken is the same as that of
+    ``get_mosaiq_delivery_details``, without a round trip to the server.
+
+    Args:
+        candidates: The rows returned by ``get_mosaiq_delivery_candidates``
+            for a window containing the delivery time plus and minus the
+            buffer.
+        delivery_time: The time of the treatment delivery
+        field_label: The beam field label, called Field ID within Monaco
+        field_name: The beam field name, called Description within Monaco
+        buffer: The number of seconds either side of the treatment record
+            within which the delivery time may fall.
+
+    Returns:
+        delivery_details: The identified delivery details
+    """
+    delivery_time = convert_to_datetime(delivery_time)
+    earliest = delivery_time - timedelta(seconds=buffer)
+    latest = delivery_time + timedelta(seconds=buffer)
+
+    label_to_match = _normalise_for_comparison(field_label)
+    name_to_match = _normalise_for_comparison(field_name)
+
+    results = [
+        tuple(row[0:7])
+        for row in candidates
+        if _normalise_for_comparison(row[7]) == label_to_match
+        and _normalise_for_comparison(row[8]) == name_to_match
+        and convert_to_datetime(row[9]) <= latest
+        and convert_to_datetime(row[10]) >= earliest
+    ]
+
+    for result in results[1::]:
+        if result != results[0]:
+            if buffer != 0:
+                return match_mosaiq_delivery_details(
+                    candidates, delivery_time, field_label, field_name, buffer=0
+                )
+
+            raise MultipleMosaiqEntries("Disagreeing entries were found.")
+
+    if not results:
+        raise NoMosaiqEntries(
+            "No Mosaiq entries were found for {}/{} at {}".format(
+                field_label, field_name, convert_to_mosaiq_time_string(delivery_time)
+            )
+        )
+
+    delivery_details = OISDeliveryDetails(*results[0])
+
+    delivery_details.field_type = FIELD_TYPES[delivery_details.field_type]
+
+    return delivery_details
+
+
+def _normalise_for_comparison(value):
+    # Mosaiq's default collation compares strings case insensitively and
+    # ignores trailing spaces.
+    if value is None:
+        return None
+
+    return value.rstrip().lower()
+
+
+def convert_to_datetime(time):
+    if isinstance(time, datetime):
+        return time
+
+    return datetime.strptime(time.split(".")[0], MOSAIQ_TIME_FORMAT)
+
+
+def convert_to_mosaiq_time_string(time):
+    if isinstance(time, datetime):
+        return time.strftime(MOSAIQ_TIME_FORMAT)
+
+    return time
+
+
 def mosaiq_mlc_missing_byte_workaround(raw_bytes_list):
     """This function checks if there is an odd number of bytes in the mlc list
     and appends a \\x00 if the byte number is odd.
@@ -194,13 +395,7 @@ def mosaiq_mlc_missing_byte_workaround(raw_bytes_list):
 
 
 def append_x00_byte_to_all(raw_bytes_list):
-    appended_bytes_list = []
-    for item in raw_bytes_list:
-        bytes_as_list = list(item)
-        bytes_as_list.append(0)
-        appended_bytes_list.append(bytes(bytes_as_list))
-
-    return appended_bytes_list
+    return [bytes(item) + b"\x00" for item in raw_bytes_list]
 
 
 def check_all_items_equal_length(items, name):
@@ -214,24 +409,47 @@ def check_all_items_equal_length(items, name):
 
 def decode_msq_mlc(raw_bytes):
     """Convert MLCs from Mosaiq SQL byte format to cm floats.
-    """
-    raw_bytes = mosaiq_mlc_missing_byte_workaround(raw_bytes)
 
-    length = check_all_items_equal_length(raw_bytes, "mlc bytes")
+    The leaf positions of every control point are joined into a single
+    buffer and decoded at once as little-endian 16 bit integers. Should every
+    control point have an odd number of bytes, the missing trailing
+    ``\\x00`` byte is restored as within
+    ``mosaiq_mlc_missing_byte_workaround``.
 
-    if length % 2 == 1:
-        raise Exception("There should be an even number of bytes within an MLC record.")
+    Args:
+        raw_bytes: The leaf set bytes of each control point. A numpy array
+            of fixed size void items, as returned by ``execute_sql_columns``,
+            is decoded directly from its buffer.
+
+    Returns:
+        An array of the leaf positions in cm of shape
+        ``(control points, leaves, 1)``.
+    """
+    number_of_control_points = len(raw_bytes)
+
+    if (
+        isinstance(raw_bytes, np.ndarray)
+        and raw_bytes.dtype.kind == "V"
+        and raw_bytes.dtype.itemsize % 2 == 0
+    ):
+        length = raw_bytes.dtype.itemsize
+        buffer = np.ascontiguousarray(raw_bytes).tobytes()
+    else:
+        raw_bytes = [bytes(item) for item in raw_bytes]
+        length = check_all_items_equal_length(raw_bytes, "mlc bytes")
+
+        if length % 2 == 1:
+            # Joining with a \x00 separator, and then appending one more,
+            # appends a \x00 to every control point.
+            buffer = b"\x00".join(raw_bytes) + b"\x00"
+            length += 1
+        else:
+            buffer = b"".join(raw_bytes)
 
     mlc_pos = (
-        np.array(
-            [
-                [
-                    struct.unpack("<h", control_point[2 * i : 2 * i + 2])
-                    for i in range(len(control_point) // 2)
-                ]
-                for control_point in raw_bytes
-            ]
-        )
+        np.frombuffer(buffer, dtype="<i2")
+        .astype(np.int64)
+        .reshape(number_of_control_points, length // 2, 1)
         / 100
     )
 
@@ -279,18 +497,13 @@ def delivery_data_sql(cursor, field_id):
         execute_sql(
             cursor,
             """
-        SELECT
-            TxFieldPoint.[Index],
-            TxFieldPoint.A_Leaf_Set,
-            TxFieldPoint.B_Leaf_Set,
-            TxFieldPoint.Gantry_Ang,
-            TxFieldPoint.Coll_Ang,
-            TxFieldPoint.Coll_Y1,
-            TxFieldPoint.Coll_Y2
+        SELECT {}
         FROM TxFieldPoint
         WHERE
             TxFieldPoint.FLD_ID = %(field_id)s
-        """,
+        """.format(
+                TXFIELDPOINT_COLUMNS
+            ),
             {"field_id": field_id},
         )
     )
@@ -298,6 +511,310 @@ def delivery_data_sql(cursor, field_id):
     return txfield_results, txfieldpoint_results
 
 
+def delivery_data_sql_single_round_trip(cursor, field_id, isolation_level=SNAPSHOT):
+    """Get the treatment delivery data from Mosaiq within a single batch.
+
+    The ``TxField`` and ``TxFieldPoint`` tables are read once within a
+    transaction at the given isolation level. The row count and
+    ``CHECKSUM_AGG`` of the control points, along with the meterset, are
+    then compared against the latest committed values within the same
+    batch. This replaces repeating the full queries to detect data that
+    was changing while it was being read.
+
+    Args:
+        cursor: A pymssql cursor pointing to the Mosaiq SQL server
+        field_id: The Mosaiq SQL field ID
+        isolation_level: Either ``"SNAPSHOT"``, which requires snapshot
+            isolation to be allowed on the database, or
+            ``"REPEATABLE READ"``.
+
+    Returns:
+        txfield_results: The results from the TxField table.
+        txfieldpoint_results: The results from the TxFieldPoint table.
+
+    Raises:
+        InconsistentMosaiqData: The data changed while it was being read.
+    """
+    if isolation_level not in DEFAULT_ISOLATION_LEVELS:
+        raise ValueError("Unsupported isolation level: {}".format(isolation_level))
+
+    verification_string = """
+        SELECT
+            COUNT(*),
+            CHECKSUM_AGG(BINARY_CHECKSUM({columns})),
+            (
+                SELECT TxField.Meterset
+                FROM TxField
+                WHERE TxField.FLD_ID = %(field_id)s
+            )
+        FROM TxFieldPoint
+        WHERE
+            TxFieldPoint.FLD_ID = %(field_id)s;
+        """.format(
+        columns=TXFIELDPOINT_COLUMNS
+    )
+
+    # pymssql holds an implicit transaction open between queries. It is
+    # committed first so that the isolation level applies to the explicit
+    # transaction that follows.
+    execute_string = """
+        SET NOCOUNT ON;
+        IF @@TRANCOUNT > 0 COMMIT TRANSACTION;
+        SET TRANSACTION ISOLATION LEVEL {isolation_level};
+        BEGIN TRANSACTION;
+
+        SELECT
+            TxField.Meterset
+        FROM TxField
+        WHERE
+            TxField.FLD_ID = %(field_id)s;
+
+        SELECT {columns}
+        FROM TxFieldPoint
+        WHERE
+            TxFieldPoint.FLD_ID = %(field_id)s;
+
+        {verification}
+
+        COMMIT TRANSACTION;
+        SET TRANSACTION ISOLATION LEVEL READ COMMITTED;
+
+        {verification}
+        """.format(
+        isolation_level=isolation_level,
+        columns=TXFIELDPOINT_COLUMNS,
+        verification=verification_string,
+    )
+
+    try:
+        result_sets = execute_sql_result_sets(
+            cursor, execute_string, {"field_id": field_id}
+        )
+    except Exception:
+        end_transaction(cursor)
+        raise
+
+    txfield_results, txfieldpoint_results, within_transaction, committed = result_sets
+
+    number_of_rows = len(txfieldpoint_results)
+    if number_of_rows != within_transaction[0][0] or within_transaction != committed:
+        raise InconsistentMosaiqData(
+            "The Mosaiq data for field {} changed while it was being read.".format(
+                field_id
+            )
+        )
+
+    return txfield_results, np.array(txfieldpoint_results)
+
+
+def end_transaction(cursor):
+    """Roll back any transaction left open by a failed batch and return the
+    connection to the default isolation level."""
+    try:
+        cursor.execute(
+            "IF @@TRANCOUNT > 0 ROLLBACK TRANSACTION; "
+            "SET TRANSACTION ISOLATION LEVEL READ COMMITTED;"
+        )
+    except Exception:  # pylint: disable=broad-except
+        pass
+
+
+def delivery_data_sql_bulk(cursor, field_ids):
+    """Get the treatment delivery data of many fields with two queries.
+
+    Args:
+        cursor: A pymssql cursor pointing to the Mosaiq SQL server
+        field_ids: The Mosaiq SQL field IDs
+
+    Returns:
+        txfield_results: The results from the TxField table, each row
+            starting with its field ID.
+        txfieldpoint_results: The results from the TxFieldPoint table, each
+            row starting with its field ID, ordered by field ID and then by
+            control point.
+    """
+    parameters = {
+        "field_id_{}".format(i): field_id for i, field_id in enumerate(field_ids)
+    }
+    placeholders = ", ".join("%({})s".format(key) for key in parameters)
+
+    txfield_results = execute_sql(
+        cursor,
+        """
+        SELECT
+            TxField.FLD_ID,
+            TxField.Meterset
+        FROM TxField
+        WHERE
+            TxField.FLD_ID IN ({})
+        """.format(
+            placeholders
+        ),
+        parameters,
+    )
+
+    txfieldpoint_results = execute_sql(
+        cursor,
+        """
+        SELECT
+            TxFieldPoint.FLD_ID, {}
+        FROM TxFieldPoint
+        WHERE
+            TxFieldPoint.FLD_ID IN ({})
+        ORDER BY
+            TxFieldPoint.FLD_ID,
+            TxFieldPoint.[Index]
+        """.format(
+            TXFIELDPOINT_COLUMNS, placeholders
+        ),
+        parameters,
+    )
+
+    return txfield_results, txfieldpoint_results
+
+
+def delivery_data_summary_sql_bulk(cursor, field_ids):
+    """Get the meterset, control point count and control point checksum of
+    many fields.
+
+    Args:
+        cursor: A pymssql cursor pointing to the Mosaiq SQL server
+        field_ids: The Mosaiq SQL field IDs
+
+    Returns:
+        A dictionary mapping each field ID found within ``TxField`` to a
+        tuple of its meterset, number of control points, and the
+        ``CHECKSUM_AGG`` of its control points.
+    """
+    parameters = {
+        "field_id_{}".format(i): field_id for i, field_id in enumerate(field_ids)
+    }
+    placeholders = ", ".join("%({})s".format(key) for key in parameters)
+
+    summary_results = execute_sql(
+        cursor,
+        """
+        SELECT
+            TxField.FLD_ID,
+            TxField.Meterset,
+            COUNT(TxFieldPoint.FLD_ID),
+            CHECKSUM_AGG(BINARY_CHECKSUM({}))
+        FROM TxField
+        LEFT JOIN TxFieldPoint ON TxFieldPoint.FLD_ID = TxField.FLD_ID
+        WHERE
+            TxField.FLD_ID IN ({})
+        GROUP BY
+            TxField.FLD_ID,
+            TxField.Meterset
+        """.format(
+            TXFIELDPOINT_COLUMNS, placeholders
+        ),
+        parameters,
+    )
+
+    return {row[0]: tuple(row[1::]) for row in summary_results}
+
+
+def group_rows_by_field_id(rows):
+    """Group rows by their first column, keeping the order of the rows
+    within each group.
+    """
+    if not rows:
+        return {}
+
+    field_ids = np.array([row[0] for row in rows])
+    sort_reference = np.argsort(field_ids, kind="stable")
+    sorted_field_ids = field_ids[sort_reference]
+
+    group_starts = np.flatnonzero(sorted_field_ids[1::] != sorted_field_ids[0:-1]) + 1
+    groups = np.split(sort_reference, group_starts)
+
+    return {rows[group[0]][0]: [tuple(rows[i][1::]) for i in group] for group in groups}
+
+
+def delivery_data_from_mosaiq_bulk(
+    cursor, field_ids, chunk_size=DEFAULT_BULK_CHUNK_SIZE, attempts=DEFAULT_ATTEMPTS
+):
+    """Get the delivery data of many fields with a few set based queries.
+
+    The field IDs are queried ``chunk_size`` at a time. The meterset,
+    control point count and ``CHECKSUM_AGG`` of each field are read both
+    before and after its data. Fields whose summary changed, or whose
+    number of control points read disagrees with it, are read again, up to
+    ``attempts`` times.
+
+    Args:
+        cursor: A pymssql cursor pointing to the Mosaiq SQL server
+        field_ids: The Mosaiq SQL field IDs
+        chunk_size: The number of field IDs within each query.
+        attempts: The number of times fields that were changing are read.
+
+    Returns:
+        A dictionary mapping each field ID to its delivery data. Field IDs
+        without any control points within Mosaiq are left out.
+
+    Raises:
+        InconsistentMosaiqData: The data of a field was still changing
+            after every attempt.
+    """
+    field_ids = list(dict.fromkeys(field_ids))
+
+    deliveries = {}
+    for i in range(0, len(field_ids), chunk_size):
+        deliveries.update(
+            read_bulk_until_consistent(cursor, field_ids[i : i + chunk_size], attempts)
+        )
+
+    return {
+        field_id: deliveries[field_id]
+        for field_id in field_ids
+        if field_id in deliveries
+    }
+
+
+def read_bulk_until_consistent(cursor, field_ids, attempts):
+    deliveries = {}
+
+    for _ in range(attempts):
+        summary_before = delivery_data_summary_sql_bulk(cursor, field_ids)
+        txfield_results, txfieldpoint_results = delivery_data_sql_bulk(
+            cursor, field_ids
+        )
+        summary_after = delivery_data_summary_sql_bulk(cursor, field_ids)
+
+        txfield_by_field_id = group_rows_by_field_id(txfield_results)
+        txfieldpoint_by_field_id = group_rows_by_field_id(txfieldpoint_results)
+
+        changing = []
+        for field_id in field_ids:
+            summary = summary_after.get(field_id)
+            txfieldpoints = txfieldpoint_by_field_id.get(field_id, [])
+
+            if summary_before.get(field_id) != summary or (
+                summary is not None and summary[1] != len(txfieldpoints)
+            ):
+                changing.append(field_id)
+            elif field_id in txfield_by_field_id and txfieldpoints:
+                deliveries[field_id] = delivery_data_from_sql_results(
+                    txfield_by_field_id[field_id], np.array(txfieldpoints)
+                )
+
+        if not changing:
+            return deliveries
+
+        print(
+            "The Mosaiq data for fields {} changed while it was being "
+            "read.".format(changing)
+        )
+        print("Trying again...")
+        field_ids = changing
+
+    raise InconsistentMosaiqData(
+        "The Mosaiq data for fields {} kept changing while it was being "
+        "read.".format(field_ids)
+    )
+
+
 def fetch_and_verify_mosaiq_sql(cursor, field_id):
     reference_results = delivery_data_sql(cursor, field_id)
     test_results = delivery_data_sql(cursor, field_id)
@@ -324,6 +841,73 @@ def delivery_data_from_mosaiq(cursor, field_id):
         cursor, field_id
     )
 
+    return delivery_data_from_sql_results(txfield_results, txfieldpoint_results)
+
+
+def delivery_data_from_mosaiq_single_round_trip(
+    cursor,
+    field_id,
+    isolation_levels=DEFAULT_ISOLATION_LEVELS,
+    attempts=DEFAULT_ATTEMPTS,
+):
+    """Get the delivery data of a field with one verified round trip.
+
+    Each isolation level is tried in turn until one is supported by the
+    server. Should the data be found to be changing it is read again, up to
+    ``attempts`` times.
+
+    Args:
+        isolation_levels: Either the isolation levels to try, in order, or
+            an ``IsolationLevels`` shared between calls. The latter stops
+            trying the levels the server has refused.
+
+    Raises:
+        InconsistentMosaiqData: The data was still changing after every
+            attempt.
+    """
+    if not isinstance(isolation_levels, IsolationLevels):
+        isolation_levels = IsolationLevels(isolation_levels)
+
+    isolation_levels_to_try = tuple(isolation_levels)
+    if not isolation_levels_to_try:
+        raise ValueError("Every isolation level has been refused by the server")
+
+    for i, isolation_level in enumerate(isolation_levels_to_try):
+        try:
+            results = read_until_consistent(cursor, field_id, isolation_level, attempts)
+        except ISOLATION_LEVEL_ERRORS as e:
+            if i == len(isolation_levels_to_try) - 1:
+                raise
+
+            print(
+                "{} isolation failed ({}), trying {} isolation.".format(
+                    isolation_level, e, isolation_levels_to_try[i + 1]
+                )
+            )
+            continue
+
+        # The connection works, so the levels that failed are unsupported
+        isolation_levels.reject(isolation_levels_to_try[0:i])
+        return delivery_data_from_sql_results(*results)
+
+
+def read_until_consistent(cursor, field_id, isolation_level, attempts):
+    for _ in range(attempts):
+        try:
+            return delivery_data_sql_single_round_trip(
+                cursor, field_id, isolation_level=isolation_level
+            )
+        except InconsistentMosaiqData as e:
+            print(e)
+            print("Trying again...")
+
+    raise InconsistentMosaiqData(
+        "The Mosaiq data for field {} kept changing while it was being "
+        "read.".format(field_id)
+    )
+
+
+def delivery_data_from_sql_results(txfield_results, txfieldpoint_results):
     total_mu = np.array(txfield_results[0]).astype(float)
     cumulative_percentage_mu = txfieldpoint_results[:, 0].astype(float)
 
@@ -359,7 +943,34 @@ def delivery_data_from_mosaiq(cursor, field_id):
     return mosaiq_delivery_data
 
 
-def multi_fetch_and_verify_mosaiq(cursor, field_id):
+def multi_fetch_and_verify_mosaiq(
+    cursor, field_id, single_round_trip=True, isolation_levels=DEFAULT_ISOLATION_LEVELS
+):
+    """Get the delivery data of a field, verifying it wasn't changing while
+    it was read.
+
+    By default the data is read once and verified within a single round
+    trip to the server. Should that not be possible, or with
+    ``single_round_trip=False``, the data is instead read repeatedly until
+    consecutive reads agree. Passing the same ``IsolationLevels`` as
+    ``isolation_levels`` for every field read from a server stops the
+    refused isolation levels, or the single round trip altogether, from
+    being attempted for each field.
+    """
+    if not isinstance(isolation_levels, IsolationLevels):
+        isolation_levels = IsolationLevels(isolation_levels)
+
+    single_round_trip_failed = False
+    if single_round_trip and len(isolation_levels) != 0:
+        try:
+            return delivery_data_from_mosaiq_single_round_trip(
+                cursor, field_id, isolation_levels=isolation_levels
+            )
+        except ISOLATION_LEVEL_ERRORS:
+            print(traceback.format_exc())
+            print("Falling back to verifying with repeated reads.")
+            single_round_trip_failed = True
+
     mosaiq_delivery_data = delivery_data_from_mosaiq(cursor, field_id)
     reference_data = (
         mosaiq_delivery_data.monitor_units,
@@ -393,4 +1004,9 @@ def multi_fetch_and_verify_mosaiq(cursor, field_id):
                 delivery_data.jaw,
             )
 
+    # The repeated reads worked on this connection, so the single round trip
+    # is unsupported by the server
+    if single_round_trip_failed:
+        isolation_levels.reject(tuple(isolation_levels))
+
     return delivery_data
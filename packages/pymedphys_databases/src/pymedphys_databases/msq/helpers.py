@@ -30,7 +30,7 @@ import datetime
 
 import pandas as pd
 
-from .connect import execute_sql
+from .connect import execute_sql, execute_sql_columns
 from .constants import FIELD_TYPES
 
 
@@ -60,7 +60,7 @@ def get_patient_fields(cursor, patient_id):
     """
     patient_id = str(patient_id)
 
-    patient_field_results = execute_sql(
+    table = execute_sql_columns(
         cursor,
         """
         SELECT
@@ -78,10 +78,6 @@ def get_patient_fields(cursor, patient_id):
             Ident.IDA = %(patient_id)s
         """,
         {"patient_id": patient_id},
-    )
-
-    table = pd.DataFrame(
-        data=patient_field_results,
         columns=[
             "field_id",
             "field_label",
@@ -91,6 +87,7 @@ def get_patient_fields(cursor, patient_id):
             "field_type",
             "site",
         ],
+        as_dataframe=True,
     )
 
     table.drop_duplicates(inplace=True)
@@ -101,7 +98,7 @@ def get_patient_fields(cursor, patient_id):
 
 
 def get_treatments(cursor, start, end, machine):
-    treatment_results = execute_sql(
+    table = execute_sql_columns(
         cursor,
         """
         SELECT
@@ -129,10 +126,6 @@ def get_treatments(cursor, start, end, machine):
             TrackTreatment.Create_DtTm <= %(end)s
         """,
         {"machine": machine, "start": start, "end": end},
-    )
-
-    table = pd.DataFrame(
-        data=treatment_results,
         columns=[
             "patient_id",
             "last_name",
@@ -148,6 +141,7 @@ def get_treatments(cursor, start, end, machine):
             "start",
             "end",
         ],
+        as_dataframe=True,
     )
 
     table["field_type"] = [FIELD_TYPES[item] for item in table["field_type"]]
@@ -0,0 +1,439 @@
+# Copyright (C) 2019 Cancer Care Associates
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+
+"""A pool of reconnecting Mosaiq SQL connections.
+
+Usage example:
+    with multi_mosaiq_pool(['nbccc-msq', 'msqsql'], size=4) as pools:
+        with pools['msqsql'].cursor() as cursor:
+            do_something(cursor)
+
+        pools['nbccc-msq'].run(do_something)
+"""
+
+import time
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import keyring
+import pymssql
+
+from .connect import get_username_password, separate_server_port_string
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_ATTEMPTS = 5
+DEFAULT_BACKOFF = 1
+DEFAULT_MAX_BACKOFF = 60
+DEFAULT_HEALTH_CHECK_INTERVAL = 30
+HEALTH_CHECK_SQL = "SELECT 1"
+RECONNECT_ERRORS = (pymssql.OperationalError, pymssql.InterfaceError)
+
+PoolStatistics = namedtuple(
+    "PoolStatistics",
+    [
+        "checkouts",
+        "wait_time",
+        "reconnects",
+        "failed_health_checks",
+        "open_connections",
+        "idle_connections",
+    ],
+)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def connect_with_saved_credentials(sql_server_and_port):
+    """Connect to the Mosaiq server with the credentials saved in keyring.
+
+    Unlike ``mosaiq_connect`` this never prompts for a username or
+    password, so it is safe to call from worker threads.
+    """
+    server, port = separate_server_port_string(sql_server_and_port)
+    user = keyring.get_password("MosaiqSQL_username", sql_server_and_port)
+    password = keyring.get_password("MosaiqSQL_password", sql_server_and_port)
+
+    if user is None or user == "" or password is None:
+        raise ValueError(
+            "No saved credentials for `{}`. Connect once with `mosaiq_connect` "
+            "to save them.".format(sql_server_and_port)
+        )
+
+    try:
+        return pymssql.connect(server, user, password, "MOSAIQ", port=port)
+    except pymssql.OperationalError as error:
+        error_message = error.args[0][1]
+        if error_message.startswith(b"Login failed for user"):
+            # Retrying a failed login would only risk locking the account.
+            raise ValueError(
+                "Login failed with the saved credentials for `{}`. Connect "
+                "once with `mosaiq_connect` to update them.".format(sql_server_and_port)
+            )
+        raise
+
+
+class MosaiqConnectionPool:
+    """A thread safe pool of connections to a single Mosaiq server.
+
+    Connections are opened as they are needed, up to ``size`` of them.
+    A connection that has been idle for longer than the health check
+    interval is tested before it is handed out and replaced if it no longer
+    responds. A connection that raised one of the ``reconnect_errors``
+    while checked out is discarded, and connecting is retried with
+    exponential backoff.
+
+    Args:
+        sql_server_and_port: The Mosaiq SQL server, as given to
+            ``mosaiq_connect``.
+        size: The maximum number of open connections.
+        connect: A function that takes ``sql_server_and_port`` and returns
+            a new DB-API connection. Defaults to connecting with the
+            credentials saved in keyring.
+        reconnect_errors: The exceptions that mean a connection has been
+            lost and that the operation is worth retrying.
+        attempts: The number of attempts made to connect, and to run a
+            function with ``run``, before giving up.
+        backoff: The wait in seconds after the first failed attempt. It is
+            doubled after each subsequent failure.
+        max_backoff: The longest wait in seconds between attempts.
+        health_check_interval: The time in seconds a connection may sit
+            idle before it is checked. Set to 0 to check every checkout.
+        health_check_sql: The SQL run to check a connection.
+    """
+
+    def __init__(
+        self,
+        sql_server_and_port,
+        size=DEFAULT_POOL_SIZE,
+        connect=connect_with_saved_credentials,
+        reconnect_errors=RECONNECT_ERRORS,
+        attempts=DEFAULT_ATTEMPTS,
+        backoff=DEFAULT_BACKOFF,
+        max_backoff=DEFAULT_MAX_BACKOFF,
+        health_check_interval=DEFAULT_HEALTH_CHECK_INTERVAL,
+        health_check_sql=HEALTH_CHECK_SQL,
+        sleep=time.sleep,
+        clock=time.monotonic,
+    ):
+        if size < 1:
+            raise ValueError("The pool size needs to be at least 1")
+        if attempts < 1:
+            raise ValueError("The number of attempts needs to be at least 1")
+
+        self.sql_server_and_port = sql_server_and_port
+        self.size = size
+        self.reconnect_errors = tuple(reconnect_errors)
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.health_check_interval = health_check_interval
+        self.health_check_sql = health_check_sql
+
+        self._connect_function = connect
+        self._sleep = sleep
+        self._clock = clock
+
+        self._condition = threading.Condition()
+        self._idle = deque()
+        self._open = 0
+        self._lost = 0
+        self._closed = False
+
+        self._checkouts = 0
+        self._wait_time = 0.0
+        self._reconnects = 0
+        self._failed_health_checks = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def statistics(self):
+        """A ``PoolStatistics`` snapshot of the pool usage so far."""
+        with self._condition:
+            return PoolStatistics(
+                checkouts=self._checkouts,
+                wait_time=self._wait_time,
+                reconnects=self._reconnects,
+                failed_health_checks=self._failed_health_checks,
+                open_connections=self._open,
+                idle_connections=len(self._idle),
+            )
+
+    def open(self):
+        """Open the first connection ahead of the first checkout.
+
+        Used to connect to a server up front so that an unreachable server
+        is reported before any work begins.
+        """
+        with self._condition:
+            if self._closed:
+                raise ValueError("The connection pool has been closed")
+            if self._open:
+                return
+            self._open += 1
+
+        try:
+            connection = self._connect()
+        except BaseException:
+            self._forget()
+            raise
+
+        self._release(connection)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Check out a connection, waiting up to ``timeout`` seconds.
+
+        Raises:
+            PoolTimeout: No connection became free within ``timeout``.
+        """
+        connection = self._acquire(timeout)
+        try:
+            yield connection
+        except self.reconnect_errors:
+            self._discard(connection)
+            raise
+        except BaseException:
+            self._release(connection)
+            raise
+        else:
+            self._release(connection)
+
+    @contextmanager
+    def cursor(self, timeout=None):
+        """Check out a connection and yield a new cursor upon it."""
+        with self.connection(timeout) as connection:
+            cursor = connection.cursor()
+            try:
+                yield cursor
+            finally:
+                _close_quietly(cursor)
+
+    def run(self, function, *args, timeout=None, **kwargs):
+        """Call ``function(cursor, *args, **kwargs)`` with a pooled cursor.
+
+        If the connection is lost part way through, the function is called
+        again upon a new connection, backing off between attempts. The
+        function therefore needs to be safe to repeat, as read only
+        queries are.
+        """
+        for attempt in range(self.attempts):
+            try:
+                with self.cursor(timeout) as cursor:
+                    return function(cursor, *args, **kwargs)
+            except self.reconnect_errors:
+                if attempt == self.attempts - 1:
+                    raise
+
+            self._sleep(self._backoff_time(attempt))
+
+    def close(self):
+        """Close the idle connections, and those in use once returned."""
+        with self._condition:
+            self._closed = True
+            idle = [connection for connection, _ in self._idle]
+            self._idle.clear()
+            self._open -= len(idle)
+            self._condition.notify_all()
+
+        for connection in idle:
+            _close_quietly(connection)
+
+    def _backoff_time(self, attempt):
+        return min(self.backoff * 2 ** attempt, self.max_backoff)
+
+    def _connect(self):
+        for attempt in range(self.attempts):
+            try:
+                return self._connect_function(self.sql_server_and_port)
+            except self.reconnect_errors:
+                if attempt == self.attempts - 1:
+                    raise
+
+            self._sleep(self._backoff_time(attempt))
+
+    def _acquire(self, timeout):
+        start = self._clock()
+
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise ValueError("The connection pool has been closed")
+
+                if self._idle:
+                    connection, last_used = self._idle.pop()
+                    replacing = False
+                    break
+
+                if self._open < self.size:
+                    self._open += 1
+                    connection, last_used = None, None
+                    replacing = self._lost > 0
+                    if replacing:
+                        self._lost -= 1
+                    break
+
+                if timeout is None:
+                    self._condition.wait()
+                else:
+                    remaining = timeout - (self._clock() - start)
+                    if remaining <= 0:
+                        raise PoolTimeout(
+                            "No connection to `{}` became free within {} "
+                            "seconds".format(self.sql_server_and_port, timeout)
+                        )
+                    self._condition.wait(remaining)
+
+            self._checkouts += 1
+            self._wait_time += self._clock() - start
+
+        try:
+            if connection is None:
+                connection = self._connect()
+                if replacing:
+                    with self._condition:
+                        self._reconnects += 1
+            elif self._clock() - last_used >= self.health_check_interval:
+                replacing = True
+                connection = self._check_health(connection)
+        except BaseException:
+            self._forget(lost=replacing)
+            raise
+
+        return connection
+
+    def _check_health(self, connection):
+        if _is_healthy(connection, self.health_check_sql):
+            return connection
+
+        _close_quietly(connection)
+        with self._condition:
+            self._failed_health_checks += 1
+
+        connection = self._connect()
+        with self._condition:
+            self._reconnects += 1
+
+        return connection
+
+    def _release(self, connection):
+        with self._condition:
+            if not self._closed:
+                self._idle.append((connection, self._clock()))
+                self._condition.notify()
+                return
+
+            self._open -= 1
+
+        _close_quietly(connection)
+
+    def _discard(self, connection):
+        _close_quietly(connection)
+        self._forget(lost=True)
+
+    def _forget(self, lost=False):
+        with self._condition:
+            self._open -= 1
+            if lost:
+                self._lost += 1
+            self._condition.notify()
+
+
+def _is_healthy(connection, health_check_sql):
+    try:
+        cursor = connection.cursor()
+        try:
+            cursor.execute(health_check_sql)
+            cursor.fetchall()
+        finally:
+            _close_quietly(cursor)
+    except Exception:  # pylint: disable = broad-except
+        return False
+
+    return True
+
+
+def _close_quietly(item):
+    try:
+        item.close()
+    except Exception:  # pylint: disable = broad-except
+        pass
+
+
+@contextmanager
+def multi_mosaiq_pool(
+    sql_server_and_ports, size=DEFAULT_POOL_SIZE, connect=None, **kwargs
+):
+    """Create a connection pool for each of multiple Mosaiq servers.
+
+    Any missing credentials are asked for one server at a time, after which
+    the first connection to every server is opened concurrently. All of the
+    pools are closed on exit.
+
+    Args:
+        sql_server_and_ports: The Mosaiq SQL servers.
+        size: The maximum number of open connections per server.
+        connect: A function that takes a server and returns a new DB-API
+            connection. Defaults to connecting with the credentials saved
+            in keyring.
+        **kwargs: Passed on to ``MosaiqConnectionPool``.
+
+    Returns:
+        A dictionary mapping each server to its ``MosaiqConnectionPool``.
+    """
+    sql_server_and_ports = list(sql_server_and_ports)
+
+    if connect is None:
+        for sql_server_and_port in sql_server_and_ports:
+            get_username_password(sql_server_and_port)
+
+        connect = connect_with_saved_credentials
+
+    pools = {
+        sql_server_and_port: MosaiqConnectionPool(
+            sql_server_and_port, size=size, connect=connect, **kwargs
+        )
+        for sql_server_and_port in sql_server_and_ports
+    }
+
+    try:
+        if pools:
+            with ThreadPoolExecutor(max_workers=len(pools)) as executor:
+                for future in [executor.submit(pool.open) for pool in pools.values()]:
+                    future.result()
+
+        yield pools
+    finally:
+        for pool in pools.values():
+            pool.close()
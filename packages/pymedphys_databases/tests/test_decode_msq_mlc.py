@@ -0,0 +1,94 @@
+# Copyright (C) 2019 Simon Biggs
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+
+"""Compare the vectorised Mosaiq MLC decoder to the item by item decoder."""
+
+import struct
+
+import numpy as np
+import pytest
+
+from pymedphys_databases.msq.delivery import (
+    check_all_items_equal_length,
+    decode_msq_mlc,
+    mosaiq_mlc_missing_byte_workaround,
+)
+
+
+def item_by_item_decode_msq_mlc(raw_bytes):
+    raw_bytes = mosaiq_mlc_missing_byte_workaround(raw_bytes)
+    check_all_items_equal_length(raw_bytes, "mlc bytes")
+
+    return (
+        np.array(
+            [
+                [
+                    struct.unpack("<h", control_point[2 * i : 2 * i + 2])
+                    for i in range(len(control_point) // 2)
+                ]
+                for control_point in raw_bytes
+            ]
+        )
+        / 100
+    )
+
+
+def create_leaf_sets(number_of_control_points, number_of_leaves=80):
+    random_state = np.random.RandomState(7)
+    positions = random_state.randint(
+        -2000, 2000, size=(number_of_control_points, number_of_leaves)
+    )
+
+    # A numpy bytes array strips trailing \x00 bytes, which both decoders
+    # are only able to restore if every leaf set loses exactly one.
+    positions[:, -1] = -1 - np.abs(positions[:, -1])
+
+    return [row.astype("<i2").tobytes() for row in positions]
+
+
+def test_vectorised_decode_agrees():
+    leaf_sets = create_leaf_sets(180)
+
+    # Leaf sets as they are returned by `np.array(rows).astype(bytes)`
+    as_numpy_bytes = np.array(leaf_sets, dtype=object).astype(bytes)
+
+    # Every leaf set ending in \x00 has it stripped within a numpy bytes array
+    odd_leaf_sets = [leaf_set[0:-1] + b"\x00" for leaf_set in leaf_sets]
+    odd_as_numpy_bytes = np.array(odd_leaf_sets, dtype=object).astype(bytes)
+    assert len(odd_as_numpy_bytes[0]) % 2 == 1
+
+    for raw_bytes in [leaf_sets, as_numpy_bytes, odd_as_numpy_bytes]:
+        vectorised = decode_msq_mlc(raw_bytes)
+        item_by_item = item_by_item_decode_msq_mlc(raw_bytes)
+
+        assert vectorised.shape == item_by_item.shape
+        assert vectorised.dtype == item_by_item.dtype
+        assert np.array_equal(vectorised, item_by_item)
+
+    void_array = np.frombuffer(b"".join(leaf_sets), dtype="V160")
+    assert np.array_equal(decode_msq_mlc(void_array), decode_msq_mlc(leaf_sets))
+
+    with pytest.raises(AssertionError):
+        decode_msq_mlc([b"\x01\x02", b"\x01\x02\x03\x04"])
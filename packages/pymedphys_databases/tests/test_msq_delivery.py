@@ -0,0 +1,435 @@
+# Copyright (C) 2019 Simon Biggs
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+
+"""Test retrieving delivery data from Mosaiq with a stand in cursor."""
+
+import datetime
+import decimal
+import hashlib
+import re
+import sqlite3
+
+import numpy as np
+import pytest
+
+import pymssql
+
+from pymedphys_databases.msq.connect import (
+    convert_to_column_array,
+    execute_sql,
+    execute_sql_columns,
+)
+from pymedphys_databases.msq.delivery import (
+    delivery_data_from_mosaiq,
+    delivery_data_from_mosaiq_bulk,
+    delivery_data_from_mosaiq_single_round_trip,
+    multi_fetch_and_verify_mosaiq,
+    InconsistentMosaiqData,
+    IsolationLevels,
+)
+
+
+def leaf_bytes(positions):
+    return np.array(positions, dtype="<i2").tobytes()
+
+
+TXFIELD_ROWS = [(200.0,)]
+TXFIELDPOINT_ROWS = [
+    (0.0, leaf_bytes([100, 200, 300]), leaf_bytes([-100, 0, 50]), 180.0, 0.0, 5.0, 5.0),
+    (
+        50.0,
+        leaf_bytes([110, 210, 310]),
+        leaf_bytes([-90, 10, 60]),
+        270.0,
+        0.0,
+        5.0,
+        4.5,
+    ),
+    (100.0, leaf_bytes([120, 220, 320]), leaf_bytes([-80, 20, 70]), 0.0, 0.0, 5.0, 4.0),
+]
+SUMMARY = [(3, 123456, 200.0)]
+
+
+class StandInMosaiqCursor:
+    """Answers the delivery queries with fixed rows.
+
+    ``batches`` lists what each single round trip batch returns: either
+    the committed summary that follows the transaction, or an exception to
+    raise.
+    """
+
+    def __init__(self, batches=()):
+        self.batches = list(batches)
+        self.executed = []
+        self._result_sets = []
+
+    def execute(self, sql_string, parameters=None):
+        self.executed.append(sql_string)
+
+        if "ROLLBACK" in sql_string:
+            self._result_sets = []
+        elif "BEGIN TRANSACTION" in sql_string:
+            batch = self.batches.pop(0)
+            if isinstance(batch, Exception):
+                raise batch
+
+            self._result_sets = [TXFIELD_ROWS, TXFIELDPOINT_ROWS, SUMMARY, batch]
+        elif "TxFieldPoint" in sql_string:
+            self._result_sets = [TXFIELDPOINT_ROWS]
+        else:
+            self._result_sets = [TXFIELD_ROWS]
+
+        self._rows = iter(self._result_sets[0] if self._result_sets else [])
+
+    def fetchone(self):
+        return next(self._rows, None)
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def nextset(self):
+        self._result_sets = self._result_sets[1::]
+        if not self._result_sets:
+            return None
+
+        self._rows = iter(self._result_sets[0])
+        return True
+
+
+def assert_deliveries_equal(first, second):
+    for name in ["monitor_units", "gantry", "collimator", "mlc", "jaw"]:
+        assert np.array_equal(getattr(first, name), getattr(second, name))
+
+
+def test_single_round_trip_agrees():
+    cursor = StandInMosaiqCursor([SUMMARY])
+    delivery = delivery_data_from_mosaiq_single_round_trip(cursor, 1)
+
+    assert len(cursor.executed) == 1
+    assert_deliveries_equal(
+        delivery, delivery_data_from_mosaiq(StandInMosaiqCursor(), 1)
+    )
+
+
+def test_changing_data_is_read_again():
+    changed = [(3, 654321, 200.0)]
+
+    cursor = StandInMosaiqCursor([changed, SUMMARY])
+    delivery_data_from_mosaiq_single_round_trip(cursor, 1)
+    assert len(cursor.executed) == 2
+
+    cursor = StandInMosaiqCursor([changed] * 3)
+    with pytest.raises(InconsistentMosaiqData):
+        delivery_data_from_mosaiq_single_round_trip(cursor, 1, attempts=3)
+
+
+def test_fallbacks():
+    isolation_levels = IsolationLevels()
+    cursor = StandInMosaiqCursor(
+        [pymssql.OperationalError("Snapshot isolation is not allowed"), SUMMARY]
+    )
+    delivery_data_from_mosaiq_single_round_trip(
+        cursor, 1, isolation_levels=isolation_levels
+    )
+    assert "SNAPSHOT" in cursor.executed[0]
+    assert "ROLLBACK" in cursor.executed[1]
+    assert "REPEATABLE READ" in cursor.executed[2]
+
+    # The refused isolation level isn't tried again
+    assert tuple(isolation_levels) == ("REPEATABLE READ",)
+    cursor.batches.append(SUMMARY)
+    delivery_data_from_mosaiq_single_round_trip(
+        cursor, 2, isolation_levels=isolation_levels
+    )
+    assert len(cursor.executed) == 4
+    assert "REPEATABLE READ" in cursor.executed[3]
+
+    # Nothing is rejected when no level worked, as the connection itself may
+    # have been lost
+    isolation_levels = IsolationLevels()
+    cursor = StandInMosaiqCursor([pymssql.OperationalError("Connection lost")] * 2)
+    with pytest.raises(pymssql.OperationalError):
+        delivery_data_from_mosaiq_single_round_trip(
+            cursor, 1, isolation_levels=isolation_levels
+        )
+    assert len(isolation_levels) == 2
+
+    cursor = StandInMosaiqCursor([pymssql.OperationalError("Not SQL Server")] * 2)
+    delivery = multi_fetch_and_verify_mosaiq(
+        cursor, 1, isolation_levels=isolation_levels
+    )
+    assert_deliveries_equal(
+        delivery, delivery_data_from_mosaiq(StandInMosaiqCursor(), 1)
+    )
+
+    # The repeated reads need at least eight queries
+    assert len(cursor.executed) - 4 >= 8
+
+    # Once the repeated reads have worked the single round trip isn't tried
+    # again
+    assert len(isolation_levels) == 0
+    number_of_queries = len(cursor.executed)
+    multi_fetch_and_verify_mosaiq(cursor, 2, isolation_levels=isolation_levels)
+    assert not any(
+        "BEGIN TRANSACTION" in sql_string
+        for sql_string in cursor.executed[number_of_queries::]
+    )
+
+
+def test_unexpected_errors_are_raised():
+    cursor = StandInMosaiqCursor([TypeError("Not a database error")])
+    with pytest.raises(TypeError):
+        multi_fetch_and_verify_mosaiq(cursor, 1)
+
+    assert len(cursor.executed) == 2
+
+
+class SqliteCursor:
+    """Runs the Mosaiq queries on an SQLite database with the same tables."""
+
+    def __init__(self, connection):
+        self.cursor = connection.cursor()
+        self.number_of_queries = 0
+
+    def execute(self, sql_string, parameters=None):
+        self.number_of_queries += 1
+        self.cursor.execute(
+            re.sub(r"%\((\w+)\)s", r":\1", sql_string), parameters or {}
+        )
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchmany(self, size):
+        return self.cursor.fetchmany(size)
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+
+class ChecksumAggregate:
+    """A stand in for the SQL Server ``CHECKSUM_AGG`` aggregate."""
+
+    def __init__(self):
+        self.checksum = 0
+
+    def step(self, value):
+        self.checksum ^= value
+
+    def finalize(self):
+        return self.checksum
+
+
+def binary_checksum(*values):
+    return int.from_bytes(hashlib.sha1(repr(values).encode()).digest()[0:4], "little")
+
+
+def create_mosaiq_stand_in(field_ids, shuffle=False):
+    connection = sqlite3.connect(":memory:")
+    connection.create_function("BINARY_CHECKSUM", -1, binary_checksum)
+    connection.create_aggregate("CHECKSUM_AGG", 1, ChecksumAggregate)
+    connection.executescript(
+        """
+        CREATE TABLE TxField (FLD_ID INTEGER, Meterset REAL);
+        CREATE TABLE TxFieldPoint (
+            FLD_ID INTEGER, [Index] REAL, A_Leaf_Set BLOB, B_Leaf_Set BLOB,
+            Gantry_Ang REAL, Coll_Ang REAL, Coll_Y1 REAL, Coll_Y2 REAL
+        );
+        """
+    )
+
+    random_state = np.random.RandomState(42)
+    points = []
+    for field_id in field_ids:
+        connection.execute(
+            "INSERT INTO TxField VALUES (?, ?)", (field_id, 100.0 + field_id)
+        )
+
+        number_of_points = random_state.randint(2, 6)
+        for i, index in enumerate(np.linspace(0, 100, number_of_points)):
+            points.append(
+                (
+                    field_id,
+                    float(index),
+                    leaf_bytes(random_state.randint(-100, -1, size=4)),
+                    leaf_bytes(random_state.randint(-100, -1, size=4)),
+                    float(random_state.choice([0, 90, 180, 270])),
+                    0.0,
+                    5.0,
+                    5.0 - i / 2,
+                )
+            )
+
+    # Interleave the fields' control points
+    random_state.shuffle(points)
+    if not shuffle:
+        points.sort(key=lambda point: point[1])
+    connection.executemany(
+        "INSERT INTO TxFieldPoint VALUES (?, ?, ?, ?, ?, ?, ?, ?)", points
+    )
+
+    return connection
+
+
+def test_bulk_delivery_data_agrees():
+    field_ids = [11, 12, 13, 14, 15]
+    connection = create_mosaiq_stand_in(field_ids)
+
+    cursor = SqliteCursor(connection)
+    deliveries = delivery_data_from_mosaiq_bulk(cursor, field_ids + [99], chunk_size=2)
+
+    assert list(deliveries.keys()) == field_ids
+    assert cursor.number_of_queries == 12
+
+    for field_id in field_ids:
+        assert_deliveries_equal(
+            deliveries[field_id],
+            delivery_data_from_mosaiq(SqliteCursor(connection), field_id),
+        )
+
+
+def test_bulk_delivery_data_is_ordered_by_control_point():
+    field_ids = [11, 12, 13, 14, 15]
+    shuffled_connection = create_mosaiq_stand_in(field_ids, shuffle=True)
+    ordered_connection = create_mosaiq_stand_in(field_ids)
+
+    deliveries = delivery_data_from_mosaiq_bulk(
+        SqliteCursor(shuffled_connection), field_ids
+    )
+
+    for field_id in field_ids:
+        assert_deliveries_equal(
+            deliveries[field_id],
+            delivery_data_from_mosaiq(SqliteCursor(ordered_connection), field_id),
+        )
+
+
+class ChangingSqliteCursor(SqliteCursor):
+    """Changes a control point of a field just before the given queries."""
+
+    def __init__(self, connection, change_before_queries, field_id):
+        super().__init__(connection)
+        self.connection = connection
+        self.change_before_queries = change_before_queries
+        self.field_id = field_id
+
+    def execute(self, sql_string, parameters=None):
+        if self.number_of_queries + 1 in self.change_before_queries:
+            self.connection.execute(
+                "UPDATE TxFieldPoint SET Gantry_Ang = Gantry_Ang + 1 "
+                "WHERE FLD_ID = ?",
+                (self.field_id,),
+            )
+
+        super().execute(sql_string, parameters)
+
+
+def test_bulk_delivery_data_is_read_again_when_changing():
+    field_ids = [11, 12, 13]
+    connection = create_mosaiq_stand_in(field_ids)
+
+    cursor = ChangingSqliteCursor(connection, [3], 12)
+    deliveries = delivery_data_from_mosaiq_bulk(cursor, field_ids)
+
+    assert cursor.number_of_queries == 8
+    for field_id in field_ids:
+        assert_deliveries_equal(
+            deliveries[field_id],
+            delivery_data_from_mosaiq(SqliteCursor(connection), field_id),
+        )
+
+    cursor = ChangingSqliteCursor(connection, [3, 6], 12)
+    with pytest.raises(InconsistentMosaiqData):
+        delivery_data_from_mosaiq_bulk(cursor, field_ids, attempts=2)
+
+
+def test_execute_sql_columns():
+    connection = create_mosaiq_stand_in([11, 12, 13])
+    sql_string = "SELECT * FROM TxFieldPoint WHERE FLD_ID >= %(field_id)s"
+
+    rows = execute_sql(SqliteCursor(connection), sql_string, {"field_id": 12})
+    columns = execute_sql_columns(
+        SqliteCursor(connection), sql_string, {"field_id": 12}, batch_size=3
+    )
+
+    assert list(columns.keys()) == [
+        "FLD_ID",
+        "Index",
+        "A_Leaf_Set",
+        "B_Leaf_Set",
+        "Gantry_Ang",
+        "Coll_Ang",
+        "Coll_Y1",
+        "Coll_Y2",
+    ]
+    assert columns["FLD_ID"].dtype == np.int64
+    assert columns["Index"].dtype == np.float64
+    assert columns["A_Leaf_Set"].dtype == np.dtype("V8")
+
+    for i, name in enumerate(columns.keys()):
+        if name.endswith("Leaf_Set"):
+            assert [item.tobytes() for item in columns[name]] == [
+                row[i] for row in rows
+            ]
+            assert columns[name].tobytes() == b"".join(row[i] for row in rows)
+        else:
+            assert columns[name].tolist() == [row[i] for row in rows]
+
+    table = execute_sql_columns(
+        SqliteCursor(connection),
+        sql_string,
+        {"field_id": 100},
+        columns=["field_id", "index", "a", "b", "gantry", "coll", "y1", "y2"],
+        as_dataframe=True,
+    )
+    assert len(table) == 0
+    assert list(table.columns)[0:2] == ["field_id", "index"]
+
+    table = execute_sql_columns(
+        SqliteCursor(connection), sql_string, {"field_id": 0}, as_dataframe=True
+    )
+    assert table["B_Leaf_Set"].tolist() == [
+        row[3]
+        for row in execute_sql(SqliteCursor(connection), sql_string, {"field_id": 0})
+    ]
+
+
+def test_convert_to_column_array():
+    decimals = convert_to_column_array([decimal.Decimal("1.5"), None, 2])
+    assert decimals.dtype == np.float64
+    assert np.isnan(decimals[1])
+
+    times = convert_to_column_array([datetime.datetime(2019, 1, 1, 8), None])
+    assert times.dtype.kind == "M"
+    assert np.isnat(times[1])
+
+    uneven = convert_to_column_array([b"ab", b"abcd"])
+    assert uneven.dtype == object
+    assert uneven.tolist() == [b"ab", b"abcd"]
+
+    strings = convert_to_column_array(["a", "bc", None])
+    assert strings.dtype == object
+    assert strings.tolist() == ["a", "bc", None]
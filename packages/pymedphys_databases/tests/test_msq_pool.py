@@ -0,0 +1,196 @@
+# Copyright (C) 2019 Cancer Care Associates
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+
+"""Test the Mosaiq connection pool with sqlite as a stand in driver."""
+
+from concurrent.futures import ThreadPoolExecutor
+import sqlite3
+import threading
+
+import pytest
+
+from pymedphys_databases.msq import multi_mosaiq_pool, MosaiqConnectionPool, PoolTimeout
+
+RECONNECT_ERRORS = (sqlite3.OperationalError, sqlite3.ProgrammingError)
+
+
+class StandInConnector:
+    """Opens sqlite connections, failing the first ``failures`` attempts."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def __call__(self, sql_server_and_port):
+        with self.lock:
+            if self.failures:
+                self.failures -= 1
+                raise sqlite3.OperationalError("Unable to connect")
+
+            connection = sqlite3.connect(":memory:", check_same_thread=False)
+            self.connections.append(connection)
+
+            return connection
+
+
+def create_pool(connector, sleeps=None, **kwargs):
+    if sleeps is None:
+        sleeps = []
+
+    return MosaiqConnectionPool(
+        "msqsql",
+        connect=connector,
+        reconnect_errors=RECONNECT_ERRORS,
+        sleep=sleeps.append,
+        **kwargs
+    )
+
+
+def select_value(cursor, value):
+    cursor.execute("SELECT ?", (value,))
+    return cursor.fetchone()[0]
+
+
+def test_concurrent_checkouts():
+    connector = StandInConnector()
+    in_use = []
+    most_in_use = []
+    lock = threading.Lock()
+
+    def query(value):
+        with pool.cursor() as cursor:
+            with lock:
+                in_use.append(value)
+                most_in_use.append(len(in_use))
+            result = select_value(cursor, value)
+            with lock:
+                in_use.remove(value)
+
+        return result
+
+    with create_pool(connector, size=2) as pool:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(query, range(40)))
+
+    statistics = pool.statistics
+
+    assert results == list(range(40))
+    assert max(most_in_use) <= 2
+    assert len(connector.connections) <= 2
+    assert statistics.checkouts == 40
+    assert statistics.reconnects == 0
+    assert statistics.open_connections == 0
+
+
+def test_lost_connections_are_replaced():
+    connector = StandInConnector()
+    pool = create_pool(connector, size=1, health_check_interval=0)
+
+    assert pool.run(select_value, 1) == 1
+    connector.connections[0].close()
+
+    assert pool.run(select_value, 2) == 2
+    statistics = pool.statistics
+    assert statistics.failed_health_checks == 1
+    assert statistics.reconnects == 1
+    assert len(connector.connections) == 2
+
+    with pytest.raises(sqlite3.OperationalError):
+        with pool.cursor() as cursor:
+            cursor.execute("SELECT * FROM missing_table")
+
+    assert pool.run(select_value, 3) == 3
+    assert pool.statistics.reconnects == 2
+    assert len(connector.connections) == 3
+
+    pool.close()
+    with pytest.raises(ValueError):
+        pool.run(select_value, 4)
+
+    with pytest.raises(ValueError):
+        create_pool(connector, attempts=0)
+
+
+def test_run_retries_with_backoff():
+    connector = StandInConnector(failures=2)
+    sleeps = []
+    pool = create_pool(connector, sleeps=sleeps, backoff=1, max_backoff=3)
+
+    calls = []
+
+    def drops_twice(cursor):
+        calls.append(cursor)
+        if len(calls) <= 2:
+            raise sqlite3.OperationalError("Connection lost")
+
+        return select_value(cursor, "done")
+
+    assert pool.run(drops_twice) == "done"
+    assert len(calls) == 3
+    assert sleeps == [1, 2, 1, 2]
+    assert pool.statistics.reconnects == 2
+
+    connector.failures = 5
+    pool = create_pool(connector, attempts=3)
+    with pytest.raises(sqlite3.OperationalError):
+        pool.open()
+
+    assert pool.statistics.open_connections == 0
+
+
+def test_checkout_timeout():
+    pool = create_pool(StandInConnector(), size=1)
+
+    with pool.cursor():
+        with pytest.raises(PoolTimeout):
+            with pool.cursor(timeout=0.01):
+                pass
+
+    with pool.cursor(timeout=0.01) as cursor:
+        assert select_value(cursor, 1) == 1
+
+
+def test_multi_mosaiq_pool_connects_concurrently():
+    servers = ["nbccc-msq", "msqsql", "rccc-msq"]
+    all_connecting = threading.Barrier(len(servers), timeout=5)
+    connected = []
+
+    def connect(sql_server_and_port):
+        all_connecting.wait()
+        connected.append(sql_server_and_port)
+        return sqlite3.connect(":memory:", check_same_thread=False)
+
+    with multi_mosaiq_pool(servers, size=2, connect=connect) as pools:
+        assert set(connected) == set(servers)
+        assert list(pools.keys()) == servers
+
+        for server, pool in pools.items():
+            assert pool.statistics.idle_connections == 1
+            assert pool.run(select_value, server) == server
+
+    for pool in pools.values():
+        assert pool.statistics.open_connections == 0
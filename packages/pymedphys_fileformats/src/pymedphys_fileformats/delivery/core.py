@@ -28,7 +28,7 @@ import numpy as np
 from pymedphys_base.delivery import Delivery
 
 from ..trf import (
-    decode_trf,
+    read_trf_columns,
     GANTRY_NAME,
     COLLIMATOR_NAME,
     Y1_LEAF_BANK_NAMES,
@@ -36,17 +36,26 @@ from ..trf import (
     JAW_NAMES,
 )
 
+MONITOR_UNITS_NAME = "Step Dose/Actual Value (Mu)"
+
+DELIVERY_COLUMN_NAMES = (
+    [MONITOR_UNITS_NAME, GANTRY_NAME, COLLIMATOR_NAME]
+    + Y1_LEAF_BANK_NAMES
+    + Y2_LEAF_BANK_NAMES
+    + JAW_NAMES
+)
+
 
 class DeliveryLogfile(Delivery):
     @classmethod
     def from_logfile(cls, filepath):
-        dataframe = decode_trf(filepath)
+        table = read_trf_columns(filepath, DELIVERY_COLUMN_NAMES)
 
-        return cls.from_pandas(dataframe)
+        return cls.from_pandas(table)
 
     @classmethod
     def from_pandas(cls, table):
-        raw_monitor_units = table["Step Dose/Actual Value (Mu)"]
+        raw_monitor_units = table[MONITOR_UNITS_NAME]
 
         diff = np.append([0], np.diff(raw_monitor_units))
         diff[diff < 0] = 0
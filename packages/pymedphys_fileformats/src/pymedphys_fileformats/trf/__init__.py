@@ -32,7 +32,9 @@ Examples:
 
 from .trf2pandas import trf2pandas, decode_trf
 from .trf2csv import trf2csv_by_directory, trf2csv
-from .header import decode_header_from_file, Header
+from .header import decode_header_from_file, scan_headers, Header
+from .columns import read_trf_columns
+from .stream import TrfStream
 
 from .constants import (
     GANTRY_NAME,
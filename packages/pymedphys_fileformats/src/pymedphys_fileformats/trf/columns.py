@@ -0,0 +1,128 @@
+# Copyright (C) 2019 Cancer Care Associates
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+
+"""Reads a selection of columns from a trf file without decoding the rest.
+"""
+
+import mmap
+import traceback
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from .constants import CONFIG
+from .header import determine_header_length_from_buffer
+from .table import (
+    convert_numbers_to_string,
+    convert_numeric_columns,
+    decode_rows,
+    get_column_names,
+    LINAC_STATE_KEY,
+    WEDGE_KEY,
+)
+
+
+def read_trf_columns(filepath, column_names: List[str]) -> Dict[str, np.ndarray]:
+    """Read only the requested columns of a trf file.
+
+    The file is memory mapped and only the requested columns are copied
+    out of it and converted. The returned values are identical to the
+    corresponding columns of the table returned by ``trf2pandas``.
+
+    Args:
+        filepath: The path to the trf file.
+        column_names: The names of the columns to be read, as given
+            within ``CONFIG["column_names"]``.
+
+    Returns:
+        A dictionary mapping each of the requested column names to a
+        numpy array of its values.
+    """
+    with open(filepath, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as trf_mmap:
+            raw_columns, positions = _raw_columns_from_buffer(trf_mmap, column_names)
+
+    return _convert_raw_columns(raw_columns, column_names, positions)
+
+
+def _raw_columns_from_buffer(trf_buffer, column_names):
+    header_length = determine_header_length_from_buffer(trf_buffer)
+
+    with memoryview(trf_buffer) as trf_view:
+        with trf_view[header_length::] as trf_table_view:
+            try:
+                decoded_rows = decode_rows(trf_table_view)
+            except Exception as e:
+                # The frames of the traceback still hold views into the
+                # buffer. Unless they are cleared the views can't be
+                # released and this error would be hidden behind a
+                # BufferError.
+                traceback.clear_frames(e.__traceback__)
+                raise
+
+            # All views into the buffer need to be released before the
+            # memory map is able to be closed. Fancy indexing copies the
+            # selected columns out of the buffer.
+            try:
+                positions = _column_positions(decoded_rows.shape[1], column_names)
+                raw_columns = decoded_rows[:, positions]
+            finally:
+                del decoded_rows
+
+    return raw_columns, positions
+
+
+def _column_positions(number_of_columns, column_names):
+    all_column_names = get_column_names(number_of_columns)
+    lookup = {name: i for i, name in enumerate(all_column_names)}
+
+    try:
+        return np.array([lookup[name] for name in column_names], dtype=int)
+    except KeyError as e:
+        raise ValueError("Unknown trf column name: {}".format(e.args[0]))
+
+
+def _convert_raw_columns(raw_columns, column_names, positions):
+    values = raw_columns.astype(np.float64)
+    converted = convert_numeric_columns(values, pd.Index(column_names), positions)
+
+    result = {}
+    for i, name in enumerate(column_names):
+        if name == LINAC_STATE_KEY:
+            result[name] = convert_numbers_to_string(
+                "linac state", CONFIG["linac_state_codes"], pd.Series(raw_columns[:, i])
+            )
+        elif name == WEDGE_KEY:
+            result[name] = convert_numbers_to_string(
+                "wedge", CONFIG["wedge_codes"], pd.Series(raw_columns[:, i])
+            )
+        elif converted[i]:
+            result[name] = values[:, i]
+        else:
+            result[name] = raw_columns[:, i].astype(np.int64)
+
+    return result
@@ -26,13 +26,58 @@
 
 import re
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
 
 Header = namedtuple(
     "Header", ["machine", "date", "timezone", "field_label", "field_name"]
 )
 
 
-def determine_header_length(trf_contents):
+DEFAULT_SEARCH_LENGTH = 4096
+
+
+def determine_header_length(trf_contents, search_length=DEFAULT_SEARCH_LENGTH):
+    """Determine the header length by only inspecting the start of the
+    contents.
+
+    The inspected prefix is doubled until the end of the header is found,
+    so that the table bytes are not split apart. Bytes, memory maps and
+    memoryviews are all able to be provided.
+    """
+    contents_length = len(trf_contents)
+
+    while True:
+        prefix = bytes(trf_contents[0:search_length])
+
+        try:
+            return header_length_from_prefix(prefix)
+        except StopIteration:
+            if search_length >= contents_length:
+                raise
+
+        search_length *= 2
+
+
+def determine_header_length_from_buffer(
+    trf_buffer, search_length=DEFAULT_SEARCH_LENGTH
+):
+    """Determine the header length of a buffer, such as a memory mapped
+    file, without copying the whole buffer into memory.
+    """
+    return determine_header_length(trf_buffer, search_length=search_length)
+
+
+def header_length_from_prefix(trf_contents):
+    """Determine the header length from contents that include the start
+    of the table.
+
+    If the contents are cut short within the first table item the header
+    length is still correct, as it only depends on the items that precede
+    it. If not enough of the table is included a ``StopIteration`` is
+    raised.
+    """
     test = trf_contents.split(b"\t")
     row_skips = 6
     i = next(i for i, item in enumerate(test[row_skips::]) if len(item) > 3) + row_skips
@@ -80,11 +125,26 @@ def convert_header_section_to_string(section):
     return "".join([chr(item) for item in section[1::]])
 
 
-def raw_header_from_file(filepath):
+def raw_header_from_file(filepath, search_length=DEFAULT_SEARCH_LENGTH):
+    """Read the raw header bytes of a trf file.
+
+    Only a prefix of the file is read, doubling in length until it
+    includes the whole header.
+    """
     with open(filepath, "rb") as file:
-        trf_contents = file.read()
+        trf_contents = file.read(search_length)
+
+        while True:
+            try:
+                header_length = header_length_from_prefix(trf_contents)
+                break
+            except StopIteration:
+                additional_contents = file.read(len(trf_contents))
+                if not additional_contents:
+                    raise
+
+                trf_contents += additional_contents
 
-    header_length = determine_header_length(trf_contents)
     trf_header_contents = trf_contents[0:header_length]
 
     return trf_header_contents
@@ -94,3 +154,27 @@ def decode_header_from_file(filepath):
     trf_header_contents = raw_header_from_file(filepath)
 
     return decode_header(trf_header_contents)
+
+
+def scan_headers(filepaths, workers=1):
+    """Decode the headers of many trf files, without reading their tables.
+
+    Args:
+        filepaths: The paths to the trf files.
+        workers: The number of threads the files are read with.
+
+    Returns:
+        A dataframe with one row per file, indexed by the provided
+        filepaths, with a column for each of the ``Header`` fields.
+    """
+    filepaths = list(filepaths)
+
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            headers = list(executor.map(decode_header_from_file, filepaths))
+    else:
+        headers = [decode_header_from_file(filepath) for filepath in filepaths]
+
+    return pd.DataFrame(
+        headers, columns=Header._fields, index=pd.Index(filepaths, name="filepath")
+    )
@@ -0,0 +1,168 @@
+# Copyright (C) 2019 Cancer Care Associates
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+
+"""Incrementally decodes a trf file that is still being written.
+"""
+
+import numpy as np
+
+from .header import decode_header, determine_header_length
+from .table import (
+    decode_table_bytes,
+    get_column_names,
+    has_valid_linac_state_codes,
+    LINE_GROUPING_OPTIONS,
+)
+
+# A handful of rows can happen to decode into known linac state codes with
+# the wrong line grouping, so the grouping is only settled on once every
+# option has at least this many rows to check.
+DEFAULT_MINIMUM_ROWS = 25
+
+
+class TrfStream:
+    """Decode the rows appended to a trf file since it was last polled.
+
+    The header is parsed, and the line grouping of the table determined,
+    once enough of the file has been written. From then on only the newly
+    appended complete rows are read and decoded on each poll. A trailing
+    partially written row is left to be decoded by a later poll.
+
+    Args:
+        filepath: The path to the trf file being written.
+        minimum_rows: The number of rows that need to have been written
+            before the line grouping is determined. No rows are returned
+            before then.
+
+    Examples:
+        >>> stream = TrfStream(r"a/path/goes/here.trf")  # doctest: +SKIP
+        >>> new_rows = stream.poll()  # doctest: +SKIP
+    """
+
+    def __init__(self, filepath, minimum_rows=DEFAULT_MINIMUM_ROWS):
+        if minimum_rows < 1:
+            raise ValueError("minimum_rows must be at least 1")
+
+        self.filepath = filepath
+        self.minimum_rows = minimum_rows
+
+        self.header = None
+        self.header_length = None
+        self.line_grouping = None
+        self.column_names = None
+        self.number_of_rows = 0
+
+    @property
+    def offset(self):
+        """The byte offset within the file of the next row to be decoded."""
+        if self.header_length is None or self.line_grouping is None:
+            return 0
+
+        return self.header_length + self.number_of_rows * self.line_grouping
+
+    def poll(self) -> np.ndarray:
+        """Decode the complete rows appended since the previous poll.
+
+        Returns:
+            The newly decoded rows, one row per line of the table, in the
+            same form as ``decode_rows``. If the header or the line grouping
+            can not yet be determined, or the file does not exist yet, an
+            empty block is returned.
+        """
+        try:
+            with open(self.filepath, "rb") as file:
+                file.seek(self.offset)
+                new_contents = file.read()
+        except FileNotFoundError:
+            return self._empty_block()
+
+        if self.header_length is None and not self._read_header(new_contents):
+            return self._empty_block()
+
+        if self.line_grouping is None:
+            trf_table_contents = new_contents[self.header_length : :]
+            if not self._determine_line_grouping(trf_table_contents):
+                return self._empty_block()
+        else:
+            trf_table_contents = new_contents
+
+        number_of_new_rows = len(trf_table_contents) // self.line_grouping
+        new_rows = decode_table_bytes(
+            trf_table_contents[0 : number_of_new_rows * self.line_grouping],
+            self.line_grouping,
+        )
+        self.number_of_rows += number_of_new_rows
+
+        return new_rows
+
+    def _empty_block(self):
+        number_of_columns = 0
+        if self.line_grouping is not None:
+            number_of_columns = self.line_grouping // 2
+
+        return np.empty((0, number_of_columns), dtype="<u2")
+
+    def _read_header(self, trf_contents):
+        try:
+            header_length = determine_header_length(trf_contents)
+        except StopIteration:
+            return False
+
+        # Whilst the header itself is still being written its final field
+        # can be mistaken for the start of the table. Waiting for at least
+        # one row of table data avoids this.
+        if len(trf_contents) - header_length < max(LINE_GROUPING_OPTIONS.keys()):
+            return False
+
+        self.header = decode_header(trf_contents[0:header_length])
+        self.header_length = header_length
+
+        return True
+
+    def _determine_line_grouping(self, trf_table_contents):
+        """Only accept a line grouping once it is the sole one that
+        decodes the rows written so far into known linac state codes, with
+        at least ``minimum_rows`` rows for every option.
+        """
+        matching_groupings = []
+        for line_grouping, linac_state_codes_column in LINE_GROUPING_OPTIONS.items():
+            number_of_rows = len(trf_table_contents) // line_grouping
+            if number_of_rows < self.minimum_rows:
+                return False
+
+            rows = decode_table_bytes(
+                trf_table_contents[0 : number_of_rows * line_grouping], line_grouping
+            )
+            if has_valid_linac_state_codes(rows, linac_state_codes_column):
+                matching_groupings.append(line_grouping)
+
+        if len(matching_groupings) != 1:
+            return False
+
+        self.line_grouping = matching_groupings[0]
+        self.column_names = get_column_names(self.line_grouping // 2)
+
+        return True
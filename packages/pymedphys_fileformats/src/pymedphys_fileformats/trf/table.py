@@ -55,22 +55,12 @@ def decode_rows(trf_table_contents):
     if not possible_groupings:
         raise Exception("Unexpected number of bytes within file.")
 
-    reference_state_codes = set(
-        np.array(list(CONFIG["linac_state_codes"].keys())).astype(int)
-    )
-
     decoded_results = []
     for line_grouping, linac_state_codes_column in possible_groupings:
-        rows = [
-            trf_table_contents[i : i + line_grouping]
-            for i in range(0, len(trf_table_contents), line_grouping)
-        ]
-
-        result = decode_table_data(rows, line_grouping)
-        tentative_state_codes = result[:, linac_state_codes_column]
+        result = decode_table_bytes(trf_table_contents, line_grouping)
 
-        if set(tentative_state_codes).issubset(reference_state_codes):
-            decoded_results.append(decode_table_data(rows, line_grouping))
+        if has_valid_linac_state_codes(result, linac_state_codes_column):
+            decoded_results.append(result)
 
     if not decoded_results:
         raise Exception("Decoded table didn't pass shape test")
@@ -83,6 +73,18 @@ def decode_rows(trf_table_contents):
     return decoded_rows
 
 
+def has_valid_linac_state_codes(decoded_rows, linac_state_codes_column):
+    """Whether the column expected to hold the linac state codes only
+    contains known codes.
+    """
+    reference_state_codes = np.array(list(CONFIG["linac_state_codes"].keys())).astype(
+        int
+    )
+    tentative_state_codes = decoded_rows[:, linac_state_codes_column]
+
+    return bool(np.all(np.isin(tentative_state_codes, reference_state_codes)))
+
+
 def decode_rows_from_file(filepath):
     with open(filepath, "rb") as file:
         trf_contents = file.read()
@@ -116,16 +118,28 @@ def decode_trf_table(trf_table_contents):
     column_names = get_column_names(number_of_columns)
 
     table_dataframe = create_dataframe(
-        decoded_rows, column_names, CONFIG["time_increment"]
+        decoded_rows.astype(np.int64), column_names, CONFIG["time_increment"]
     )
 
-    convert_data_table(
+    table_dataframe = convert_data_table(
         table_dataframe, CONFIG["linac_state_codes"], CONFIG["wedge_codes"]
     )
 
     return table_dataframe
 
 
+def decode_table_bytes(trf_table_contents, line_grouping) -> np.ndarray:
+    """Decode the table into integer values.
+
+    The table bytes are viewed in place as little-endian unsigned 16 bit
+    integers and reshaped so that each line grouping forms one row.
+    """
+    number_of_columns = line_grouping // 2
+    decoded = np.frombuffer(trf_table_contents, dtype="<u2")
+
+    return decoded.reshape(-1, number_of_columns)
+
+
 def decode_data_item(row, group, byteorder) -> int:
     """Converts the bytes of data items into an integer."""
     return int.from_bytes(row[group], byteorder=byteorder)
@@ -146,7 +160,11 @@ def decode_column(raw_table_rows: List[str], column_number: int) -> np.ndarray:
 
 
 def decode_table_data(raw_table_rows: List[str], line_grouping) -> np.ndarray:
-    """Decode the table into integer values."""
+    """Decode the table into integer values one item at a time.
+
+    Superseded by ``decode_table_bytes``. Retained as a reference
+    implementation for testing and benchmarking.
+    """
 
     result = []
     for column_number in range(0, line_grouping // 2):
@@ -187,84 +205,128 @@ def convert_numbers_to_string(name, lookup, column: pd.core.series.Series):
     return result
 
 
+LINAC_STATE_KEY = "Linac State/Actual Value (None)"
+WEDGE_KEY = "Wedge Position/Actual Value (None)"
+
+
 def convert_linac_state_codes(dataframe, linac_state_codes):
     name = "linac state"
-    key = "Linac State/Actual Value (None)"
+    key = LINAC_STATE_KEY
     dataframe[key] = convert_numbers_to_string(name, linac_state_codes, dataframe[key])
 
 
 def convert_wedge_codes(dataframe, wedge_codes):
     name = "wedge"
-    key = "Wedge Position/Actual Value (None)"
+    key = WEDGE_KEY
     dataframe[key] = convert_numbers_to_string(name, wedge_codes, dataframe[key])
 
 
-def apply_negative(column):
-    result = (
-        np.ones_like(column).astype(np.float64) * np.nan  # pylint: disable=no-member
-    )
-    negative_values = column.values > 2 ** 15
+APPLY_NEGATIVE_KEYS = [
+    "Control point/Actual Value (None)",
+    "Table Isocentric/Scaled Actual (deg)",
+    "Table Isocentric/Positional Error (deg)",
+]
 
-    result[negative_values] = column[negative_values] - 2 ** 16
-    result[np.invert(negative_values)] = column[np.invert(negative_values)]
+NEGATIVE_AND_DIVIDE_BY_10_KEYS = [
+    "Step Dose/Actual Value (Mu)",
+    "Step Gantry/Scaled Actual (deg)",
+    "Step Gantry/Positional Error (deg)",
+    "Step Collimator/Scaled Actual (deg)",
+    "Step Collimator/Positional Error (deg)",
+]
 
-    if np.any(np.isnan(result)):
-        raise Exception("Not all column values were converted")
+REMAINING_START = 14
+Y2_LEAVES_SLICE = slice(30, 110)
 
-    return result
 
+def apply_negative(values):
+    """Convert unsigned 16 bit values into their signed equivalent.
 
-def convert_applying_negative(dataframe):
-    keys = [
-        "Control point/Actual Value (None)",
-        "Table Isocentric/Scaled Actual (deg)",
-        "Table Isocentric/Positional Error (deg)",
-    ]
+    Accepts either a single column or a block of columns.
+    """
+    result = np.array(values, dtype=np.float64)
+    result[result > 2 ** 15] -= 2 ** 16
 
-    for key in keys:
-        dataframe[key] = apply_negative(dataframe[key])
+    return result
 
 
-def negative_and_divide_by_10(column: pd.core.series.Series):
-    result = apply_negative(column)
+def convert_applying_negative(values: np.ndarray, columns: pd.Index):
+    index = columns.isin(APPLY_NEGATIVE_KEYS)
+    values[:, index] = apply_negative(values[:, index])
+
+
+def negative_and_divide_by_10(values):
+    result = apply_negative(values)
     result = result / 10
 
     return result
 
 
-def convert_negative_and_divide_by_10(dataframe: pd.core.frame.DataFrame):
-    keys = [
-        "Step Dose/Actual Value (Mu)",
-        "Step Gantry/Scaled Actual (deg)",
-        "Step Gantry/Positional Error (deg)",
-        "Step Collimator/Scaled Actual (deg)",
-        "Step Collimator/Positional Error (deg)",
-    ]
+def convert_negative_and_divide_by_10(values: np.ndarray, columns: pd.Index):
+    index = columns.isin(NEGATIVE_AND_DIVIDE_BY_10_KEYS)
+    values[:, index] = negative_and_divide_by_10(values[:, index])
+
+
+def convert_remaining(values: np.ndarray, positions: np.ndarray):
+    remaining = positions >= REMAINING_START
+    values[:, remaining] = negative_and_divide_by_10(values[:, remaining])
 
-    for key in keys:
-        dataframe[key] = negative_and_divide_by_10(dataframe[key])
+    # Y2 leaves need to be multiplied by -1
+    y2_leaves = (positions >= Y2_LEAVES_SLICE.start) & (
+        positions < Y2_LEAVES_SLICE.stop
+    )
+    values[:, y2_leaves] = -values[:, y2_leaves]
 
 
-def convert_remaining(dataframe: pd.core.frame.DataFrame):
-    column_names = dataframe.columns
+def converted_columns_mask(columns: pd.Index, positions: np.ndarray) -> np.ndarray:
+    """Flags the columns that are converted to floats."""
+    mask = columns.isin(APPLY_NEGATIVE_KEYS + NEGATIVE_AND_DIVIDE_BY_10_KEYS)
+    mask[positions >= REMAINING_START] = True
 
-    for key in column_names[14:30]:
-        dataframe[key] = negative_and_divide_by_10(dataframe[key])
+    return mask
 
-    # Y2 leaves need to be multiplied by -1
-    for key in column_names[30:110]:
-        dataframe[key] = -negative_and_divide_by_10(dataframe[key])
 
-    for key in column_names[110::]:
-        dataframe[key] = negative_and_divide_by_10(dataframe[key])
+def convert_numeric_columns(
+    values: np.ndarray, columns: pd.Index, positions: np.ndarray
+) -> np.ndarray:
+    """Applies the numeric conversions in place to a float block of columns.
+
+    Args:
+        values: A float block of raw table values, one column per
+            provided column name.
+        columns: The names of the columns within ``values``.
+        positions: The position of each of these columns within the full
+            trf table.
+
+    Returns:
+        A mask flagging the columns that were converted.
+    """
+    convert_applying_negative(values, columns)
+    convert_negative_and_divide_by_10(values, columns)
+    convert_remaining(values, positions)
+
+    return converted_columns_mask(columns, positions)
 
 
 def convert_data_table(
     dataframe: pd.core.frame.DataFrame, linac_state_codes, wedge_codes
-):
-    convert_linac_state_codes(dataframe, linac_state_codes)
-    convert_wedge_codes(dataframe, wedge_codes)
+) -> pd.core.frame.DataFrame:
+    """Converts the raw integer table into its final values.
+
+    The numeric conversions are undertaken on the table as a whole
+    block, and a new dataframe is returned.
+    """
+    columns = dataframe.columns
+    values = dataframe.values.astype(np.float64)
+
+    mask = convert_numeric_columns(values, columns, np.arange(len(columns)))
 
-    convert_applying_negative(dataframe)
-    convert_negative_and_divide_by_10(dataframe)
-    convert_remaining(dataframe)
+    converted = pd.DataFrame(
+        data=values[:, mask], columns=columns[mask], index=dataframe.index
+    )
+    result = pd.concat([dataframe.loc[:, ~mask], converted], axis=1)[columns]
+
+    convert_linac_state_codes(result, linac_state_codes)
+    convert_wedge_codes(result, wedge_codes)
+
+    return result
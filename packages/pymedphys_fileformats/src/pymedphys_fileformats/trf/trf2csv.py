@@ -23,20 +23,42 @@
 # You should have received a copy of the Apache-2.0 along with this
 # program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
 
-
 """Converts a trf file into a csv file.
+
+The table is written block by block directly from the decoded integer
+array, producing the same csv as ``DataFrame.to_csv`` on the table returned
+by ``trf2pandas`` without building the full dataframe.
 """
 
 
+import csv
 import os
+from concurrent.futures import ProcessPoolExecutor
 from glob import glob
 
-from .trf2pandas import trf2pandas
+import numpy as np
+import pandas as pd
+
+from .constants import CONFIG
+from .table import (
+    convert_numbers_to_string,
+    convert_numeric_columns,
+    decode_rows,
+    get_column_names,
+    LINAC_STATE_KEY,
+    WEDGE_KEY,
+)
+from .trf2pandas import header_as_dataframe, split_into_header_table
 
+DEFAULT_BLOCK_SIZE = 2000
 
-def trf2csv_by_directory(input_directory, output_directory):
+
+def trf2csv_by_directory(
+    input_directory, output_directory, jobs=1, skip_if_up_to_date=False
+):
     filepaths = glob(os.path.join(input_directory, "*.trf"))
 
+    conversions = []
     for filepath in filepaths:
         filename = os.path.basename(filepath)
         new_filename = os.path.join(output_directory, filename)
@@ -44,28 +66,25 @@ def trf2csv_by_directory(input_directory, output_directory):
         header_csv_filepath = "{}.header.csv".format(new_filename)
         table_csv_filepath = "{}.table.csv".format(new_filename)
 
-        print("Converting {}".format(filepath))
+        conversions.append((filepath, header_csv_filepath, table_csv_filepath))
 
-        header, table = trf2pandas(filepath)
-        header.to_csv(header_csv_filepath)
-        table.to_csv(table_csv_filepath)
+    run_conversions(conversions, jobs=jobs, skip_if_up_to_date=skip_if_up_to_date)
 
 
-def trf2csv(trf_filepath, skip_if_exists=False):
+def trf2csv(trf_filepath, skip_if_exists=False, skip_if_up_to_date=False):
     if not os.path.exists(trf_filepath):
         raise Exception("The provided trf filepath cannot be found.")
 
-    extension_removed = os.path.splitext(trf_filepath)[0]
-    header_csv_filepath = "{}_header.csv".format(extension_removed)
-    table_csv_filepath = "{}_table.csv".format(extension_removed)
+    header_csv_filepath, table_csv_filepath = get_csv_filepaths(trf_filepath)
 
     # Skip if conversion has already occured
     if not skip_if_exists or not os.path.exists(table_csv_filepath):
-        print("Converting {}".format(trf_filepath))
-        header, table = trf2pandas(trf_filepath)
-
-        header.to_csv(header_csv_filepath)
-        table.to_csv(table_csv_filepath)
+        convert_trf_to_csv(
+            trf_filepath,
+            header_csv_filepath,
+            table_csv_filepath,
+            skip_if_up_to_date=skip_if_up_to_date,
+        )
     # else:
     #     print("Skipping {}".format(trf_filepath))
 
@@ -73,6 +92,7 @@ def trf2csv(trf_filepath, skip_if_exists=False):
 
 
 def trf2csv_cli(args):
+    conversions = []
 
     for glob_string in args.filepaths:
         glob_string = glob_string.replace("[", "<[>")
@@ -85,4 +105,144 @@ def trf2csv_cli(args):
         filepaths = glob(glob_string)
 
         for filepath in filepaths:
-            trf2csv(filepath)
+            conversions.append((filepath, *get_csv_filepaths(filepath)))
+
+    run_conversions(
+        conversions,
+        jobs=getattr(args, "jobs", 1),
+        skip_if_up_to_date=getattr(args, "skip_if_up_to_date", False),
+    )
+
+
+def get_csv_filepaths(trf_filepath):
+    extension_removed = os.path.splitext(trf_filepath)[0]
+    header_csv_filepath = "{}_header.csv".format(extension_removed)
+    table_csv_filepath = "{}_table.csv".format(extension_removed)
+
+    return header_csv_filepath, table_csv_filepath
+
+
+def run_conversions(conversions, jobs=1, skip_if_up_to_date=False):
+    """Convert each ``(trf_filepath, header_csv_filepath, table_csv_filepath)``
+    item, spreading the conversions over ``jobs`` processes when more than
+    one job is requested.
+    """
+    if jobs > 1 and len(conversions) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [
+                executor.submit(
+                    convert_trf_to_csv,
+                    *conversion,
+                    skip_if_up_to_date=skip_if_up_to_date
+                )
+                for conversion in conversions
+            ]
+
+            for future in futures:
+                future.result()
+    else:
+        for conversion in conversions:
+            convert_trf_to_csv(*conversion, skip_if_up_to_date=skip_if_up_to_date)
+
+
+def is_up_to_date(trf_filepath, *csv_filepaths):
+    """Whether every csv file exists and was modified after the trf file."""
+    trf_modified = os.stat(trf_filepath).st_mtime_ns
+
+    for csv_filepath in csv_filepaths:
+        try:
+            if os.stat(csv_filepath).st_mtime_ns < trf_modified:
+                return False
+        except FileNotFoundError:
+            return False
+
+    return True
+
+
+def convert_trf_to_csv(
+    trf_filepath,
+    header_csv_filepath,
+    table_csv_filepath,
+    skip_if_up_to_date=False,
+    block_size=DEFAULT_BLOCK_SIZE,
+):
+    if skip_if_up_to_date and is_up_to_date(
+        trf_filepath, header_csv_filepath, table_csv_filepath
+    ):
+        print("Skipping {}, it is already up to date".format(trf_filepath))
+        return
+
+    print("Converting {}".format(trf_filepath))
+
+    with open(trf_filepath, "rb") as file:
+        trf_contents = file.read()
+
+    trf_header_contents, trf_table_contents = split_into_header_table(trf_contents)
+
+    header_as_dataframe(trf_header_contents).to_csv(header_csv_filepath)
+    write_table_csv(trf_table_contents, table_csv_filepath, block_size=block_size)
+
+
+def write_table_csv(
+    trf_table_contents, table_csv_filepath, block_size=DEFAULT_BLOCK_SIZE
+):
+    """Write the decoded trf table to csv, ``block_size`` rows at a time."""
+    decoded_rows = decode_rows(trf_table_contents)
+
+    number_of_rows, number_of_columns = np.shape(decoded_rows)
+    column_names = get_column_names(number_of_columns)
+
+    columns = pd.Index(column_names)
+    positions = np.arange(number_of_columns)
+
+    with open(table_csv_filepath, "w", newline="") as table_csv_file:
+        writer = csv.writer(table_csv_file, lineterminator=os.linesep)
+        writer.writerow([""] + column_names)
+
+        for start in range(0, number_of_rows, block_size):
+            block = decoded_rows[start : start + block_size, :]
+            writer.writerows(format_table_block(block, start, columns, positions))
+
+
+def format_table_block(block, start, columns, positions):
+    """Convert a block of decoded rows into rows of csv strings."""
+    values = block.astype(np.float64)
+    converted = convert_numeric_columns(values, columns, positions)
+
+    formatted = np.empty((np.shape(block)[0], len(columns) + 1), dtype=object)
+
+    time = np.round(
+        np.arange(start, start + np.shape(block)[0]) * CONFIG["time_increment"], 2
+    )
+    formatted[:, 0] = time.astype(str)
+
+    formatted[:, 1::][:, converted] = format_as_strings(values[:, converted])
+    formatted[:, 1::][:, ~converted] = format_as_strings(
+        block[:, ~converted].astype(np.int64)
+    )
+
+    for key, name, lookup in (
+        (LINAC_STATE_KEY, "linac state", CONFIG["linac_state_codes"]),
+        (WEDGE_KEY, "wedge", CONFIG["wedge_codes"]),
+    ):
+        i = columns.get_loc(key)
+        formatted[:, i + 1] = convert_numbers_to_string(
+            name, lookup, pd.Series(block[:, i])
+        )
+
+    return formatted.tolist()
+
+
+def format_as_strings(values):
+    """Format an array as strings, only formatting each distinct value once.
+
+    Values are made distinct by their bit pattern so that ``-0.0`` and
+    ``0.0`` are formatted separately.
+    """
+    values = np.ascontiguousarray(values)
+    bit_patterns = values.view(np.dtype((np.void, values.dtype.itemsize)))
+
+    unique_patterns, inverse = np.unique(bit_patterns, return_inverse=True)
+    unique_strings = unique_patterns.view(values.dtype).astype(str).astype(object)
+
+    return unique_strings[inverse].reshape(values.shape)
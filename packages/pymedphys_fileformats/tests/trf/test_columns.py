@@ -0,0 +1,91 @@
+# Copyright (C) 2019 Cancer Care Associates
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+
+"""Test the column selective trf reader."""
+
+from glob import glob
+import os
+
+import numpy as np
+import pytest
+
+from pymedphys_fileformats.delivery import DeliveryLogfile
+from pymedphys_fileformats.trf import trf2pandas, decode_trf, read_trf_columns
+from pymedphys_fileformats.trf.header import determine_header_length
+from pymedphys_fileformats.trf.table import decode_rows_from_file
+
+DATA_DIRECTORY = os.path.join(os.path.dirname(__file__), "data")
+FILEPATHS = glob(os.path.join(DATA_DIRECTORY, "*", "*.trf"))
+
+
+def test_read_trf_columns_agrees_with_trf2pandas():
+    for filepath in FILEPATHS:
+        _, table = trf2pandas(filepath)
+        column_names = list(table.columns[::-3])
+
+        columns = read_trf_columns(filepath, column_names)
+
+        assert list(columns.keys()) == column_names
+        for name in column_names:
+            assert np.array_equal(table[name].values, columns[name])
+            if columns[name].dtype.kind in "fi":
+                assert table[name].dtype == columns[name].dtype
+
+    with pytest.raises(ValueError):
+        read_trf_columns(FILEPATHS[0], ["Not a column name"])
+
+
+def test_delivery_from_logfile():
+    for filepath in FILEPATHS:
+        from_pandas = DeliveryLogfile.from_pandas(decode_trf(filepath))
+        from_logfile = DeliveryLogfile.from_logfile(filepath)
+
+        assert from_logfile == from_pandas
+
+
+def test_malformed_tables_raise_the_decode_error(tmpdir):
+    filepath = FILEPATHS[0]
+    with open(filepath, "rb") as file:
+        trf_contents = file.read()
+
+    header_length = determine_header_length(trf_contents)
+    line_grouping = decode_rows_from_file(filepath).shape[1] * 2
+    _, table = trf2pandas(filepath)
+
+    truncated = str(tmpdir.join("truncated.trf"))
+    with open(truncated, "wb") as file:
+        file.write(trf_contents[0 : header_length + 3 * line_grouping + 5])
+
+    with pytest.raises(Exception, match="Unexpected number of bytes"):
+        read_trf_columns(truncated, [table.columns[0]])
+
+    corrupt = str(tmpdir.join("corrupt.trf"))
+    with open(corrupt, "wb") as file:
+        file.write(trf_contents[0:header_length])
+        file.write(b"\xff" * (3 * line_grouping))
+
+    with pytest.raises(Exception, match="shape test"):
+        DeliveryLogfile.from_logfile(corrupt)
@@ -0,0 +1,78 @@
+# Copyright (C) 2015-2018 Simon Biggs
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+
+"""Test that the header is decoded from a bounded prefix of the file."""
+
+from glob import glob
+import os
+
+import pandas as pd
+
+from pymedphys_fileformats.trf import scan_headers, trf2pandas
+from pymedphys_fileformats.trf.header import (
+    determine_header_length,
+    raw_header_from_file,
+)
+
+DATA_DIRECTORY = os.path.join(os.path.dirname(__file__), "data")
+FILEPATHS = glob(os.path.join(DATA_DIRECTORY, "*", "*.trf"))
+
+
+def full_split_header_length(trf_contents):
+    test = trf_contents.split(b"\t")
+    row_skips = 6
+    i = next(i for i, item in enumerate(test[row_skips::]) if len(item) > 3) + row_skips
+
+    return len(b"\t".join(test[0:i])) + 3
+
+
+def test_header_from_prefix_agrees():
+    for filepath in FILEPATHS:
+        with open(filepath, "rb") as file:
+            trf_contents = file.read()
+
+        header_length = full_split_header_length(trf_contents)
+
+        for search_length in [1, 7, 64, 4096]:
+            assert (
+                determine_header_length(trf_contents, search_length=search_length)
+                == header_length
+            )
+            assert (
+                raw_header_from_file(filepath, search_length=search_length)
+                == trf_contents[0:header_length]
+            )
+
+
+def test_scan_headers():
+    expected = pd.concat(
+        [trf2pandas(filepath)[0] for filepath in FILEPATHS], ignore_index=True
+    )
+
+    for workers in [1, 3]:
+        headers = scan_headers(FILEPATHS, workers=workers)
+
+        assert list(headers.index) == FILEPATHS
+        assert headers.reset_index(drop=True).equals(expected)
@@ -0,0 +1,106 @@
+# Copyright (C) 2015-2018 Simon Biggs
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+
+"""Test the incremental decoding of trf files that are still being written."""
+
+from glob import glob
+import os
+
+import numpy as np
+import pytest
+
+from pymedphys_fileformats.trf import TrfStream
+from pymedphys_fileformats.trf.header import decode_header_from_file
+from pymedphys_fileformats.trf.table import decode_rows_from_file, LINE_GROUPING_OPTIONS
+
+DATA_DIRECTORY = os.path.join(os.path.dirname(__file__), "data")
+FILEPATHS = glob(os.path.join(DATA_DIRECTORY, "*", "*.trf"))
+
+
+def test_stream_agrees_with_decode_rows(tmpdir):
+    for i, filepath in enumerate(FILEPATHS):
+        with open(filepath, "rb") as file:
+            trf_contents = file.read()
+
+        in_progress = str(tmpdir.join("{}.trf".format(i)))
+        stream = TrfStream(in_progress)
+
+        assert stream.poll().shape[0] == 0
+
+        blocks = []
+        chunk_sizes = [50, 200, 1000, 1, 7000, 333]
+        position = 0
+        with open(in_progress, "wb") as writer:
+            while position < len(trf_contents):
+                chunk_size = chunk_sizes[len(blocks) % len(chunk_sizes)]
+                writer.write(trf_contents[position : position + chunk_size])
+                writer.flush()
+                position += chunk_size
+
+                blocks.append(stream.poll())
+
+        blocks.append(stream.poll())
+
+        expected = decode_rows_from_file(filepath)
+        decoded = np.concatenate([block for block in blocks if block.shape[0] != 0])
+
+        assert np.array_equal(decoded, expected)
+        assert stream.header == decode_header_from_file(filepath)
+        assert len(stream.column_names) == expected.shape[1]
+        assert stream.offset == len(trf_contents)
+        assert stream.poll().shape == (0, expected.shape[1])
+
+
+def test_line_grouping_waits_for_minimum_rows(tmpdir):
+    filepath = FILEPATHS[0]
+    with open(filepath, "rb") as file:
+        trf_contents = file.read()
+
+    expected = decode_rows_from_file(filepath)
+    line_grouping = expected.shape[1] * 2
+    header_length = len(trf_contents) - line_grouping * expected.shape[0]
+
+    # Enough bytes for the given number of rows of every line grouping option
+    def written_bytes(number_of_rows):
+        return header_length + number_of_rows * max(LINE_GROUPING_OPTIONS)
+
+    in_progress = str(tmpdir.join("in_progress.trf"))
+    stream = TrfStream(in_progress, minimum_rows=5)
+
+    with open(in_progress, "wb") as writer:
+        writer.write(trf_contents[0 : written_bytes(4)])
+
+    assert stream.poll().shape[0] == 0
+    assert stream.line_grouping is None
+
+    with open(in_progress, "wb") as writer:
+        writer.write(trf_contents[0 : written_bytes(5)])
+
+    number_of_rows = (written_bytes(5) - header_length) // line_grouping
+    assert np.array_equal(stream.poll(), expected[0:number_of_rows])
+    assert stream.line_grouping == line_grouping
+
+    with pytest.raises(ValueError):
+        TrfStream(in_progress, minimum_rows=0)
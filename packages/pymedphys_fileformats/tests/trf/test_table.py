@@ -0,0 +1,100 @@
+# Copyright (C) 2019 Cancer Care Associates
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+
+"""Compare the vectorised table decoder to the item by item decoder."""
+
+from glob import glob
+import os
+import timeit
+
+import numpy as np
+import pytest
+
+from pymedphys_fileformats.trf.header import determine_header_length
+from pymedphys_fileformats.trf.table import decode_rows, decode_table_data
+
+DATA_DIRECTORY = os.path.join(os.path.dirname(__file__), "data")
+
+
+def get_table_contents():
+    filepaths = glob(os.path.join(DATA_DIRECTORY, "*", "*.trf"))
+
+    all_table_contents = []
+    for filepath in filepaths:
+        with open(filepath, "rb") as file:
+            trf_contents = file.read()
+
+        header_length = determine_header_length(trf_contents)
+        all_table_contents.append(trf_contents[header_length::])
+
+    return all_table_contents
+
+
+def item_by_item_decode_rows(trf_table_contents, line_grouping):
+    rows = [
+        trf_table_contents[i : i + line_grouping]
+        for i in range(0, len(trf_table_contents), line_grouping)
+    ]
+
+    return decode_table_data(rows, line_grouping)
+
+
+def test_vectorised_decode_agrees():
+    for trf_table_contents in get_table_contents():
+        vectorised = decode_rows(trf_table_contents)
+        line_grouping = vectorised.shape[1] * 2
+        item_by_item = item_by_item_decode_rows(trf_table_contents, line_grouping)
+
+        assert np.array_equal(vectorised, item_by_item)
+
+
+@pytest.mark.skipif(
+    "PYMEDPHYS_BENCHMARK" not in os.environ,
+    reason="Benchmarks only run when PYMEDPHYS_BENCHMARK is set",
+)
+def test_vectorised_decode_benchmark():
+    """Print the decode times of the largest test logfile. Run with
+    ``PYMEDPHYS_BENCHMARK=1 pytest -s`` to see them.
+    """
+    trf_table_contents = max(get_table_contents(), key=len)
+    line_grouping = decode_rows(trf_table_contents).shape[1] * 2
+
+    vectorised_time = min(
+        timeit.repeat(lambda: decode_rows(trf_table_contents), number=1, repeat=5)
+    )
+    item_by_item_time = min(
+        timeit.repeat(
+            lambda: item_by_item_decode_rows(trf_table_contents, line_grouping),
+            number=1,
+            repeat=1,
+        )
+    )
+
+    print(
+        "\nVectorised: {:.4f} s, item by item: {:.4f} s".format(
+            vectorised_time, item_by_item_time
+        )
+    )
@@ -0,0 +1,75 @@
+# Copyright (C) 2015-2018 Simon Biggs
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+
+"""Test the streaming, parallel csv conversion."""
+
+from glob import glob
+import os
+
+from pymedphys_fileformats.trf import trf2pandas, trf2csv_by_directory
+
+DATA_DIRECTORY = os.path.join(os.path.dirname(__file__), "data")
+FILEPATHS = glob(os.path.join(DATA_DIRECTORY, "*", "*.trf"))
+
+
+def test_streamed_csv_matches_pandas(tmpdir):
+    input_directory = os.path.dirname(FILEPATHS[0])
+    output_directory = str(tmpdir)
+
+    trf2csv_by_directory(input_directory, output_directory, jobs=2)
+
+    for filepath in glob(os.path.join(input_directory, "*.trf")):
+        new_filename = os.path.join(output_directory, os.path.basename(filepath))
+
+        header, table = trf2pandas(filepath)
+        expected_header_csv = str(tmpdir.join("header.csv"))
+        expected_table_csv = str(tmpdir.join("table.csv"))
+        header.to_csv(expected_header_csv)
+        table.to_csv(expected_table_csv)
+
+        for expected, converted in (
+            (expected_header_csv, "{}.header.csv".format(new_filename)),
+            (expected_table_csv, "{}.table.csv".format(new_filename)),
+        ):
+            with open(expected, "rb") as expected_file:
+                with open(converted, "rb") as converted_file:
+                    assert expected_file.read() == converted_file.read()
+
+
+def test_skip_if_up_to_date(tmpdir, capsys):
+    input_directory = os.path.dirname(FILEPATHS[0])
+    output_directory = str(tmpdir)
+
+    trf2csv_by_directory(input_directory, output_directory)
+    capsys.readouterr()
+
+    trf2csv_by_directory(input_directory, output_directory, skip_if_up_to_date=True)
+    assert "Converting" not in capsys.readouterr().out
+
+    table_csv_filepaths = glob(os.path.join(output_directory, "*.table.csv"))
+    os.utime(table_csv_filepaths[0], ns=(0, 0))
+
+    trf2csv_by_directory(input_directory, output_directory, skip_if_up_to_date=True)
+    assert capsys.readouterr().out.count("Converting") == 1
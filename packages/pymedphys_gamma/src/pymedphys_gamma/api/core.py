@@ -24,7 +24,7 @@
 
 from pymedphys_dicom.dicom import zyx_and_dose_from_dataset
 
-from ..implementation import gamma_shell, gamma_filter_numpy
+from ..implementation import gamma_shell, gamma_filter_numpy, gamma_pass_rate
 from ..utilities import calculate_pass_rate
 
 
@@ -58,13 +58,28 @@ def gamma_percent_pass(
     dose_percent_threshold,
     distance_mm_threshold,
     method="shell",
+    pass_rate_only=False,
     **kwargs
 ):
 
     axes_reference, dose_reference = zyx_and_dose_from_dataset(dcm_ref_filepath)
     axes_evaluation, dose_evaluation = zyx_and_dose_from_dataset(dcm_eval_filepath)
 
-    if method == "shell":
+    if method in ("shell", "bounded") and pass_rate_only:
+        pass_rate = gamma_pass_rate(
+            axes_reference,
+            dose_reference,
+            axes_evaluation,
+            dose_evaluation,
+            dose_percent_threshold,
+            distance_mm_threshold,
+            bounded_search=method == "bounded",
+            **kwargs
+        )
+
+        percent_pass = pass_rate.percent_pass
+
+    elif method in ("shell", "bounded"):
         gamma = gamma_shell(
             axes_reference,
             dose_reference,
@@ -72,6 +87,7 @@ def gamma_percent_pass(
             dose_evaluation,
             dose_percent_threshold,
             distance_mm_threshold,
+            bounded_search=method == "bounded",
             **kwargs
         )
 
@@ -88,6 +104,6 @@ def gamma_percent_pass(
             **kwargs
         )
     else:
-        raise ValueError("method should be either `shell` or `filter`")
+        raise ValueError("method should be one of `shell`, `bounded`, or `filter`")
 
     return percent_pass
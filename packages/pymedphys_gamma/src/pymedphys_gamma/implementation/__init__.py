@@ -26,3 +26,4 @@
 
 from .filter import gamma_filter_numpy
 from .shell import gamma_shell
+from .passrate import gamma_pass_rate, GammaPassRate
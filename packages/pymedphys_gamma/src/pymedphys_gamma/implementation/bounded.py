@@ -0,0 +1,397 @@
+# Copyright (C) 2015-2018 Simon Biggs
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+
+"""Lower bounds on gamma used to settle reference point searches early.
+
+The linearly interpolated evaluation dose within a search radius of a
+reference point is bounded in two ways. It lies between the minimum and
+maximum of the surrounding evaluation grid values, and it cannot move away
+from its value at the reference point faster than the largest gradient of
+the surrounding grid cells. Both are found for a ladder of search radii with
+running minimum and maximum filters over the evaluation grid. Once they show
+that no larger search shell could meaningfully lower a reference point's
+gamma, its search is settled without any further shell expansion.
+"""
+
+import numpy as np
+
+
+DEFAULT_NUMBER_OF_LEVELS = 12
+DEFAULT_LEVEL_RATIO = np.sqrt(2)
+
+
+class DoseDifferenceBounds:
+    """Bounds on the evaluation dose within a set of increasing search radii
+    around each reference point.
+
+    Parameters
+    ----------
+    evaluation_interpolation : RegularGridInterpolator
+        The linear interpolation of the evaluation grid. Each axis of its
+        grid must be strictly increasing.
+    flat_mesh_axes_reference : np.ndarray
+        The coordinates of the reference points, one row per dimension.
+    flat_dose_reference : np.ndarray
+        The dose at each of the reference points.
+    reference_points_to_calc : np.ndarray
+        A boolean mask of the reference points for which bounds are needed.
+    minimum_radius : float
+        The smallest search radius for which bounds are calculated. Each
+        subsequent radius is ``level_ratio`` times the one before it, with a
+        final unbounded radius covering the whole evaluation grid.
+    number_of_levels : int, optional
+        The number of finite search radii.
+    level_ratio : float, optional
+        The ratio between consecutive search radii.
+    """
+
+    def __init__(
+        self,
+        evaluation_interpolation,
+        flat_mesh_axes_reference,
+        flat_dose_reference,
+        reference_points_to_calc,
+        minimum_radius,
+        number_of_levels=DEFAULT_NUMBER_OF_LEVELS,
+        level_ratio=DEFAULT_LEVEL_RATIO,
+    ):
+        self.reference_indices = np.where(reference_points_to_calc)[0]
+
+        axes_evaluation = evaluation_interpolation.grid
+        dose_evaluation = np.asarray(evaluation_interpolation.values)
+        dose_reference = np.asarray(flat_dose_reference)[self.reference_indices]
+        coords_reference = np.asarray(flat_mesh_axes_reference)[
+            :, self.reference_indices
+        ]
+
+        self.dose_difference_at_centre = np.abs(
+            evaluation_interpolation(coords_reference.T) - dose_reference
+        )
+
+        spacings = [_minimum_spacing(axis) for axis in axes_evaluation]
+        grid_index = tuple(
+            np.clip(np.searchsorted(axis, coords), 0, len(axis) - 1)
+            for axis, coords in zip(axes_evaluation, coords_reference)
+        )
+
+        radii = minimum_radius * level_ratio ** np.arange(number_of_levels)
+
+        minimum = dose_evaluation
+        maximum = dose_evaluation
+        gradients = [
+            _cell_gradients(dose_evaluation, axis, axis_evaluation)
+            for axis, axis_evaluation in enumerate(axes_evaluation)
+        ]
+        current_half_widths = [0] * dose_evaluation.ndim
+
+        dose_difference = []
+        gradient = []
+        for radius in radii:
+            for axis, spacing in enumerate(spacings):
+                half_width = current_half_widths[axis]
+                target = _half_width_covering_radius(radius, spacing)
+
+                minimum = _grow_running_extreme(
+                    minimum, axis, half_width, target, np.minimum
+                )
+                maximum = _grow_running_extreme(
+                    maximum, axis, half_width, target, np.maximum
+                )
+                gradients = [
+                    _grow_running_extreme(
+                        gradient_along_axis, axis, half_width, target, np.maximum
+                    )
+                    for gradient_along_axis in gradients
+                ]
+
+                current_half_widths[axis] = max(half_width, target)
+
+            dose_difference.append(
+                _distance_outside_range(
+                    dose_reference, minimum[grid_index], maximum[grid_index]
+                )
+            )
+            gradient.append(
+                _magnitude(
+                    [
+                        gradient_along_axis[grid_index]
+                        for gradient_along_axis in gradients
+                    ]
+                )
+            )
+
+        dose_difference.append(
+            _distance_outside_range(
+                dose_reference, np.min(dose_evaluation), np.max(dose_evaluation)
+            )
+        )
+        gradient.append(
+            np.full_like(
+                dose_reference,
+                _magnitude(
+                    [
+                        np.max(gradient_along_axis, initial=0)
+                        for gradient_along_axis in gradients
+                    ]
+                ),
+            )
+        )
+
+        self.radii = np.concatenate([radii, [np.inf]])
+        self.dose_difference = np.array(dose_difference)
+        self.gradient = np.array(gradient)
+
+    def bounds(self, points):
+        """The bounds for each of the reference ``points``.
+
+        ``points`` are flat reference indices, each of which needs to be
+        within ``reference_points_to_calc``.
+
+        Returns
+        -------
+        dose_difference_at_centre : np.ndarray
+            The absolute dose difference at each point.
+        dose_difference : np.ndarray
+            The smallest possible absolute dose difference within each search
+            radius. Axis 0 is the search radius, axis 1 is the point.
+        gradient : np.ndarray
+            The largest possible evaluation dose gradient magnitude within each
+            search radius. Axis 0 is the search radius, axis 1 is the point.
+        """
+        index = np.searchsorted(self.reference_indices, points)
+
+        return (
+            self.dose_difference_at_centre[index],
+            self.dose_difference[:, index],
+            self.gradient[:, index],
+        )
+
+    def subset(self, points):
+        """The bounds of only the given reference ``points``.
+
+        Within the returned bounds the points are renumbered from 0 in the
+        order given, matching reference arrays that have been indexed by
+        ``points``. ``points`` need to be sorted.
+        """
+        index = np.searchsorted(self.reference_indices, points)
+
+        subset = object.__new__(type(self))
+        subset.reference_indices = np.arange(len(points))
+        subset.radii = self.radii
+        subset.dose_difference_at_centre = self.dose_difference_at_centre[index]
+        subset.dose_difference = self.dose_difference[:, index]
+        subset.gradient = self.gradient[:, index]
+
+        return subset
+
+
+def settle_searches(
+    options,
+    dose_difference_bounds,
+    current_gamma,
+    still_searching_for_gamma,
+    distance,
+    to_be_checked,
+    gamma_tolerance,
+):
+    """Stop searching reference points where no larger search distance is
+    able to lower gamma by more than ``gamma_tolerance``.
+
+    Shells beyond ``current_gamma * distance_threshold`` are already unable
+    to lower gamma. The search distances between the current distance and
+    that radius are split into rings by the radii of
+    ``dose_difference_bounds``, and within each ring gamma is bounded below
+    using that ring's dose difference and gradient bounds. A search is only
+    settled when it can no longer change whether the point passes, so pass
+    rates are identical to those of the full search. When ``max_gamma`` is
+    finite, gamma values at or above it are settled in the same way given
+    they are clipped to ``max_gamma`` regardless.
+    """
+    points = np.where(to_be_checked)[0]
+    gamma = current_gamma[points, :, :]
+    target = np.minimum(gamma, options.max_gamma)
+
+    distance_threshold = options.distance_mm_threshold[None, None, :]
+    dose_threshold = options.dose_percent_threshold[None, :, None] / 100
+    search_radius = target * distance_threshold
+
+    if options.local_gamma:
+        normalisation = options.flat_dose_reference[points]
+    else:
+        normalisation = options.global_normalisation
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        centre, ring_dose_differences, ring_gradients = [
+            np.nan_to_num(bound / normalisation, nan=np.inf)
+            for bound in dose_difference_bounds.bounds(points)
+        ]
+
+    centre = centre[:, None, None]
+    outer_radii = dose_difference_bounds.radii
+    inner_radii = np.concatenate([[0], outer_radii[:-1]])
+
+    bound = np.full_like(gamma, np.inf)
+    with np.errstate(invalid="ignore"):
+        for ring_dose_difference, ring_gradient, inner, outer in zip(
+            ring_dose_differences, ring_gradients, inner_radii, outer_radii
+        ):
+            if outer <= distance:
+                continue
+
+            ring_dose_difference = ring_dose_difference[:, None, None]
+            ring_gradient = ring_gradient[:, None, None]
+
+            lower = max(inner, distance)
+            upper = np.minimum(outer, search_radius)
+
+            box_bound = np.sqrt(
+                (ring_dose_difference / dose_threshold) ** 2
+                + (lower / distance_threshold) ** 2
+            )
+
+            # The dose difference at a distance ``s`` is at least
+            # ``centre - ring_gradient * s``. The gamma built from this is
+            # convex in ``s`` so its minimum over the ring is found by
+            # clipping the unconstrained minimiser to the ring.
+            minimiser = np.clip(
+                centre
+                * ring_gradient
+                * distance_threshold ** 2
+                / (ring_gradient ** 2 * distance_threshold ** 2 + dose_threshold ** 2),
+                lower,
+                np.maximum(upper, lower),
+            )
+            gradient_bound = np.sqrt(
+                (np.maximum(centre - ring_gradient * minimiser, 0) / dose_threshold)
+                ** 2
+                + (minimiser / distance_threshold) ** 2
+            )
+            gradient_bound[~np.isfinite(gradient_bound)] = 0
+
+            ring_bound = np.maximum(box_bound, gradient_bound)
+            ring_within_search = lower < search_radius
+
+            bound[ring_within_search] = np.minimum(
+                bound[ring_within_search], ring_bound[ring_within_search]
+            )
+
+        settled = (
+            np.isfinite(gamma)
+            & (bound >= target - gamma_tolerance)
+            & ((target < 1) | (bound >= 1))
+        )
+
+    if options.local_gamma:
+        settled = settled & (normalisation > 0)[:, None, None]
+
+    still_searching_for_gamma[points, :, :] = (
+        still_searching_for_gamma[points, :, :] & ~settled
+    )
+
+    return still_searching_for_gamma
+
+
+def _minimum_spacing(axis):
+    if len(axis) < 2:
+        return np.inf
+
+    return np.min(np.diff(axis))
+
+
+def _half_width_covering_radius(radius, spacing):
+    """The number of grid points either side of a reference point's nearest
+    grid index that need to be included so that every grid cell within
+    ``radius`` is covered.
+    """
+    if np.isinf(spacing):
+        return 0
+
+    return int(np.ceil(radius / spacing)) + 1
+
+
+def _cell_gradients(values, axis, axis_values):
+    """The magnitude of the gradient along an axis for each grid cell edge,
+    padded with zeros so as to match the shape of the grid.
+    """
+    shape = [1] * values.ndim
+    shape[axis] = -1
+
+    with np.errstate(invalid="ignore"):
+        gradient = np.abs(np.diff(values, axis=axis)) / np.reshape(
+            np.diff(axis_values), shape
+        )
+
+    gradient = np.nan_to_num(gradient, nan=np.inf)
+
+    padding = [(0, 0)] * values.ndim
+    padding[axis] = (0, 1)
+
+    return np.pad(gradient, padding, mode="constant")
+
+
+def _grow_running_extreme(values, axis, half_width, target, extreme):
+    """Widen a running minimum or maximum filter along an axis.
+
+    Combining a window of half width ``a`` with copies of itself shifted by
+    ``s <= 2a + 1`` gives a contiguous window of half width ``a + s``, so
+    the window grows geometrically.
+    """
+    length = values.shape[axis]
+
+    while half_width < target:
+        if half_width >= length - 1:
+            return np.broadcast_to(
+                extreme.reduce(values, axis=axis, keepdims=True), values.shape
+            )
+
+        shift = min(target - half_width, 2 * half_width + 1, length - 1)
+        values = _shifted_extreme(values, shift, axis, extreme)
+        half_width += shift
+
+    return values
+
+
+def _shifted_extreme(values, shift, axis, extreme):
+    result = np.array(values)
+
+    lower = [slice(None)] * values.ndim
+    upper = [slice(None)] * values.ndim
+    lower[axis] = slice(None, -shift)
+    upper[axis] = slice(shift, None)
+    lower = tuple(lower)
+    upper = tuple(upper)
+
+    extreme(result[lower], values[upper], out=result[lower])
+    extreme(result[upper], values[lower], out=result[upper])
+
+    return result
+
+
+def _distance_outside_range(values, minimum, maximum):
+    return np.maximum(np.maximum(minimum - values, values - maximum), 0)
+
+
+def _magnitude(components):
+    return np.sqrt(np.sum(np.square(components), axis=0))
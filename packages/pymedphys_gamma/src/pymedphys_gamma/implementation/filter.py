@@ -27,19 +27,22 @@
 
 No interpolation is undergone with these at the moment. Interpolation is
 planned for the future.
+
+When the evaluation grid points coincide with reference grid points, the
+grids are compared for each integer offset vector whose length is within
+the distance threshold. Each comparison is undertaken between two shifted
+views of the dose arrays, so that memory usage scales with the size of the
+grid rather than with the number of point pairs. Other grids fall back to
+comparing point pairs.
 """
 
 
-import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 import numpy as np
 
-from ..utilities import (
-    create_point_combination,
-    convert_to_ravel_index,
-    calculate_pass_rate,
-    run_input_checks,
-)
+from ..utilities import run_input_checks
 
 
 def gamma_filter_numpy(
@@ -50,133 +53,350 @@ def gamma_filter_numpy(
     distance_mm_threshold,
     dose_threshold,
     lower_dose_cutoff=0,
+    workers=1,
+    executor=None,
     **kwargs
 ):
+    """Calculate the percent of evaluation points that pass the gamma filter.
+
+    An evaluation point passes if at least one reference grid point within
+    ``distance_mm_threshold`` of it results in a gamma of less than 1. When
+    both grids are regularly spaced with the same spacing, and the
+    evaluation grid points coincide with reference grid points, each offset
+    vector within the distance threshold is compared across the whole grid
+    at once. Any other pair of grids is compared point pair by point pair.
+
+    Parameters
+    ----------
+    axes_reference, dose_reference, axes_evaluation, dose_evaluation
+        As for `pymedphys.gamma.gamma_shell`_. One, two and three dimensional
+        grids are supported.
+    distance_mm_threshold : float
+        The gamma distance threshold. Units must match those of the axes.
+    dose_threshold : float
+        The gamma dose threshold in the same units as the doses.
+    lower_dose_cutoff : float, optional
+        Only evaluation points with a dose greater than this are included in
+        the pass rate. Defaults to 0.
+    workers : int, optional
+        The number of threads the tiles of the evaluation grid are spread
+        over when the grids are aligned. Defaults to 1.
+    executor : concurrent.futures.Executor, optional
+        An executor to calculate the tiles with instead of creating a thread
+        pool of ``workers`` threads.
+
+    Returns
+    -------
+    gamma_pass_percentage : float
+        The percent of evaluation points above ``lower_dose_cutoff`` that
+        pass.
+    """
+    axes_reference, axes_evaluation = run_input_checks(
+        axes_reference, dose_reference, axes_evaluation, dose_evaluation
+    )
 
-    coord_diffs = [
-        coord_ref[:, None] - coord_eval[None, :]
-        for coord_ref, coord_eval in zip(axes_reference, axes_evaluation)
-    ]
+    dose_reference = np.asarray(dose_reference)
+    dose_evaluation = np.asarray(dose_evaluation)
 
-    all_in_vicinity = [
-        np.where(np.abs(diff) < distance_mm_threshold) for diff in coord_diffs
-    ]
+    try:
+        alignment = [
+            determine_axis_alignment(axis_reference, axis_evaluation)
+            for axis_reference, axis_evaluation in zip(axes_reference, axes_evaluation)
+        ]
+    except ValueError:
+        gamma_pass_array = gamma_filter_pairwise(
+            axes_reference,
+            dose_reference,
+            axes_evaluation,
+            dose_evaluation,
+            distance_mm_threshold,
+            dose_threshold,
+        )
+    else:
+        gamma_pass_array = gamma_filter_aligned(
+            dose_reference,
+            dose_evaluation,
+            alignment,
+            distance_mm_threshold,
+            dose_threshold,
+            workers=workers,
+            executor=executor,
+        )
 
-    ref_coord_points = create_point_combination(
-        [in_vicinity[0] for in_vicinity in all_in_vicinity]
-    )
+    dose_above_cut_off = dose_evaluation > lower_dose_cutoff
 
-    eval_coord_points = create_point_combination(
-        [in_vicinity[1] for in_vicinity in all_in_vicinity]
-    )
+    gamma_pass_percentage = np.mean(gamma_pass_array[dose_above_cut_off]) * 100
 
-    distances = np.sqrt(
-        np.sum(
-            [
-                coord_diff[ref_points, eval_points] ** 2
-                for ref_points, eval_points, coord_diff in zip(
-                    ref_coord_points, eval_coord_points, coord_diffs
-                )
-            ],
-            axis=0,
-        )
-    )
+    return gamma_pass_percentage
 
-    within_distance_threshold = distances < distance_mm_threshold
 
-    distances = distances[within_distance_threshold]
-    ref_coord_points = ref_coord_points[:, within_distance_threshold]
-    eval_coord_points = eval_coord_points[:, within_distance_threshold]
+def gamma_filter_aligned(
+    dose_reference,
+    dose_evaluation,
+    alignment,
+    distance_mm_threshold,
+    dose_threshold,
+    workers=1,
+    executor=None,
+):
+    """Calculate pass or fail for each point of aligned evaluation grids.
 
-    dose_diff = (
-        dose_evaluation[
-            eval_coord_points[0, :], eval_coord_points[1, :], eval_coord_points[2, :]
-        ]
-        - dose_reference[
-            ref_coord_points[0, :], ref_coord_points[1, :], ref_coord_points[2, :]
-        ]
-    )
+    ``alignment`` gives the result of ``determine_axis_alignment`` for each
+    axis.
+    """
+    shifts = [shift for shift, _, _ in alignment]
 
-    gamma = np.sqrt(
-        (dose_diff / dose_threshold) ** 2 + (distances / distance_mm_threshold) ** 2
+    offsets, distances = calculate_offsets_within_distance(
+        alignment, distance_mm_threshold
+    )
+    dose_tolerances = dose_threshold * np.sqrt(
+        1 - (distances / distance_mm_threshold) ** 2
     )
 
-    gamma_pass = gamma < 1
-
-    eval_pass = eval_coord_points[:, gamma_pass]
+    if executor is None and workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return gamma_filter_aligned(
+                dose_reference,
+                dose_evaluation,
+                alignment,
+                distance_mm_threshold,
+                dose_threshold,
+                workers=workers,
+                executor=executor,
+            )
 
-    ravel_index = convert_to_ravel_index(eval_pass)
-    gamma_pass_array = np.zeros_like(  # pylint: disable=no-member
-        dose_evaluation
-    ).astype(np.bool)
+    num_tiles = np.clip(workers, 1, max(np.shape(dose_evaluation)[0], 1))
+    tiles = [
+        (tile[0], tile[-1] + 1)
+        for tile in np.array_split(np.arange(np.shape(dose_evaluation)[0]), num_tiles)
+        if len(tile) != 0
+    ]
 
-    gamma_pass_array = np.ravel(gamma_pass_array)
-    dose_above_cut_off = np.ravel(dose_evaluation) > lower_dose_cutoff
+    filter_tile = partial(
+        gamma_filter_tile,
+        dose_reference,
+        dose_evaluation,
+        shifts,
+        offsets,
+        dose_tolerances,
+    )
 
-    gamma_pass_array[ravel_index] = True
-    gamma_pass_percentage = np.mean(gamma_pass_array[dose_above_cut_off]) * 100
+    if executor is None:
+        tile_results = list(map(filter_tile, tiles))
+    else:
+        tile_results = list(executor.map(filter_tile, tiles))
 
-    return gamma_pass_percentage
+    return np.concatenate(tile_results, axis=0)
 
 
-def gamma_filter_brute_force(
+def gamma_filter_pairwise(
     axes_reference,
     dose_reference,
     axes_evaluation,
     dose_evaluation,
     distance_mm_threshold,
     dose_threshold,
-    lower_dose_cutoff=0,
-    **kwargs
 ):
+    """Calculate pass or fail for each evaluation point of any pair of grids.
+
+    The reference and evaluation coordinates within the distance threshold
+    of each other are found along each axis independently. The point pairs
+    are then built from these one pair of first axis coordinates at a time,
+    so that only a single slab of point pairs is held in memory.
+    """
+    axis_pairs = []
+    for axis_reference, axis_evaluation in zip(axes_reference, axes_evaluation):
+        coordinate_difference = (
+            np.asarray(axis_reference, dtype=float)[:, None]
+            - np.asarray(axis_evaluation, dtype=float)[None, :]
+        )
+        reference_index, evaluation_index = np.where(
+            np.abs(coordinate_difference) < distance_mm_threshold
+        )
+        axis_pairs.append(
+            (
+                reference_index,
+                evaluation_index,
+                coordinate_difference[reference_index, evaluation_index] ** 2,
+            )
+        )
 
-    xx_ref, yy_ref, zz_ref = np.meshgrid(*axes_reference, indexing="ij")
-    gamma_array = (
-        np.ones_like(dose_evaluation).astype(np.float)  # pylint: disable=no-member
-        * np.nan
-    )
-
-    mesh_index = np.meshgrid(
-        *[np.arange(len(coord_eval)) for coord_eval in axes_evaluation]
-    )
+    first_axis_pairs = axis_pairs[0]
+    other_axes_pairs = axis_pairs[1::]
 
-    eval_index = np.reshape(np.array(mesh_index), (3, -1))
-    run_index = np.arange(np.shape(eval_index)[1])
-    np.random.shuffle(run_index)
+    pair_combinations = [
+        np.ravel(item)
+        for item in np.meshgrid(
+            *[np.arange(len(pairs[0])) for pairs in other_axes_pairs], indexing="ij"
+        )
+    ]
+    other_reference_index = [
+        pairs[0][combination]
+        for pairs, combination in zip(other_axes_pairs, pair_combinations)
+    ]
+    other_evaluation_index = [
+        pairs[1][combination]
+        for pairs, combination in zip(other_axes_pairs, pair_combinations)
+    ]
+    number_of_combinations = len(pair_combinations[0]) if pair_combinations else 1
+    other_squared_distance = np.zeros(number_of_combinations)
+    for pairs, combination in zip(other_axes_pairs, pair_combinations):
+        other_squared_distance += pairs[2][combination]
 
-    sys.stdout.write("    ")
+    gamma_pass = np.zeros(np.shape(dose_evaluation), dtype=bool)
 
-    for counter, point_index in enumerate(run_index):
-        i, j, k = eval_index[:, point_index]
-        eval_x = axes_evaluation[0][i]
-        eval_y = axes_evaluation[1][j]
-        eval_z = axes_evaluation[2][k]
+    for reference_first, evaluation_first, squared_first in zip(*first_axis_pairs):
+        squared_distance = squared_first + other_squared_distance
+        within_distance = squared_distance < distance_mm_threshold ** 2
+        number_within = np.count_nonzero(within_distance)
 
-        if dose_evaluation[i, j, k] < lower_dose_cutoff:
+        if number_within == 0:
             continue
 
-        distance = np.sqrt(
-            (xx_ref - eval_x) ** 2 + (yy_ref - eval_y) ** 2 + (zz_ref - eval_z) ** 2
+        reference_index = (np.full(number_within, reference_first),) + tuple(
+            index[within_distance] for index in other_reference_index
+        )
+        evaluation_index = (np.full(number_within, evaluation_first),) + tuple(
+            index[within_distance] for index in other_evaluation_index
         )
 
-        dose_diff = dose_evaluation[i, j, k] - dose_reference
+        dose_tolerance = dose_threshold * np.sqrt(
+            1 - squared_distance[within_distance] / distance_mm_threshold ** 2
+        )
+        passes = (
+            np.abs(dose_evaluation[evaluation_index] - dose_reference[reference_index])
+            < dose_tolerance
+        )
 
-        gamma = np.min(
-            np.sqrt(
-                (dose_diff / dose_threshold) ** 2
-                + (distance / distance_mm_threshold) ** 2
-            )
+        gamma_pass[tuple(index[passes] for index in evaluation_index)] = True
+
+    return gamma_pass
+
+
+def determine_axis_alignment(axis_reference, axis_evaluation):
+    """Determine how an evaluation axis lines up with a reference axis.
+
+    Returns the reference index of the first evaluation point, the grid
+    spacing, and the residual coordinate difference between those two
+    points. The residual is only non-zero when both axes have a single
+    point.
+    """
+    axis_reference = np.asarray(axis_reference, dtype=float)
+    axis_evaluation = np.asarray(axis_evaluation, dtype=float)
+
+    steps = np.concatenate([np.diff(axis_reference), np.diff(axis_evaluation)])
+
+    if len(steps) == 0:
+        return 0, np.inf, axis_reference[0] - axis_evaluation[0]
+
+    spacing = steps[0]
+    if spacing == 0 or not np.allclose(steps, spacing):
+        raise ValueError(
+            "The gamma filter requires regularly spaced axes with the same "
+            "spacing for both the reference and the evaluation grids."
         )
 
-        gamma_array[i, j, k] = gamma
+    shift = (axis_evaluation[0] - axis_reference[0]) / spacing
+    if not np.isclose(shift, np.round(shift), atol=1e-5):
+        raise ValueError(
+            "The gamma filter requires the evaluation grid points to coincide "
+            "with reference grid points. Use `gamma_shell` for grids that "
+            "need interpolation."
+        )
 
-        if counter // 30 == counter / 30:
-            percent_pass = str(np.round(calculate_pass_rate(gamma_array), decimals=1))
-            sys.stdout.write(
-                "\rPercent Pass: {0}% | Percent Complete: {1:.2f}%".format(
-                    percent_pass, counter / np.shape(eval_index)[1] * 100
-                )
+    return int(np.round(shift)), spacing, 0.0
+
+
+def calculate_offsets_within_distance(alignment, distance_mm_threshold):
+    """Determine the reference minus evaluation index offsets to be compared.
+
+    Returns the offsets, one row per offset vector, along with the distance
+    each offset vector corresponds to. Only offsets that are strictly within
+    the distance threshold are included.
+    """
+    offset_ranges = []
+    for _, spacing, residual in alignment:
+        max_steps = int(
+            np.floor((distance_mm_threshold + np.abs(residual)) / np.abs(spacing))
+        )
+        offset_ranges.append(np.arange(-max_steps, max_steps + 1))
+
+    mesh_offsets = np.meshgrid(*offset_ranges, indexing="ij")
+    offsets = np.array([np.ravel(item) for item in mesh_offsets]).T
+
+    with np.errstate(invalid="ignore"):
+        coordinate_differences = [
+            np.where(offsets[:, axis] == 0, 0, offsets[:, axis] * spacing) + residual
+            for axis, (_, spacing, residual) in enumerate(alignment)
+        ]
+    distances = np.sqrt(np.sum(np.square(coordinate_differences), axis=0))
+
+    within_distance_threshold = distances < distance_mm_threshold
+
+    return offsets[within_distance_threshold], distances[within_distance_threshold]
+
+
+def gamma_filter_tile(
+    dose_reference, dose_evaluation, shifts, offsets, dose_tolerances, tile
+):
+    """Calculate pass or fail for a slab of the evaluation grid.
+
+    The slab spans the evaluation indices ``tile[0]`` up to, but not
+    including, ``tile[1]`` along the first axis. Scratch arrays the size of
+    the slab are reused for every offset.
+    """
+    start, stop = tile
+    tile_evaluation = dose_evaluation[start:stop, ...]
+
+    gamma_pass = np.zeros(np.shape(tile_evaluation), dtype=bool)
+    dose_difference = np.empty(
+        np.shape(tile_evaluation),
+        dtype=np.result_type(dose_reference, dose_evaluation, np.float32),
+    )
+    within_tolerance = np.empty(np.shape(tile_evaluation), dtype=bool)
+
+    for offset, dose_tolerance in zip(offsets, dose_tolerances):
+        evaluation_slices = []
+        reference_slices = []
+
+        for axis, (step, shift) in enumerate(zip(offset, shifts)):
+            total_shift = shift + step
+            first = max(0, -total_shift)
+            last = min(
+                np.shape(dose_evaluation)[axis],
+                np.shape(dose_reference)[axis] - total_shift,
             )
-            sys.stdout.flush()
 
-    return calculate_pass_rate(gamma_array)
+            if axis == 0:
+                first = max(first, start)
+                last = min(last, stop)
+
+            evaluation_slices.append(slice(first, last))
+            reference_slices.append(slice(first + total_shift, last + total_shift))
+
+        if any(item.stop <= item.start for item in evaluation_slices):
+            continue
+
+        evaluation_view = dose_evaluation[tuple(evaluation_slices)]
+        reference_view = dose_reference[tuple(reference_slices)]
+
+        tile_slices = tuple(
+            [
+                slice(
+                    evaluation_slices[0].start - start,
+                    evaluation_slices[0].stop - start,
+                )
+            ]
+            + evaluation_slices[1::]
+        )
+
+        difference_view = dose_difference[tile_slices]
+        within_view = within_tolerance[tile_slices]
+        pass_view = gamma_pass[tile_slices]
+
+        np.subtract(evaluation_view, reference_view, out=difference_view)
+        np.abs(difference_view, out=difference_view)
+        np.less(difference_view, dose_tolerance, out=within_view)
+        np.logical_or(pass_view, within_view, out=pass_view)
+
+    return gamma_pass
@@ -0,0 +1,302 @@
+# Copyright (C) 2015-2018 Simon Biggs
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+
+"""Determine the gamma pass rate without calculating the full gamma map.
+
+Whether a reference point passes only requires the search to continue until
+a gamma below 1 is found, or until the search distance reaches the distance
+threshold, beyond which no point can pass. When only a random subset of the
+reference points is calculated the pass rate comes with a confidence
+interval, and the sampling can stop as soon as that interval is narrow
+enough.
+"""
+
+import math
+from dataclasses import dataclass, replace
+from typing import Tuple
+
+import numpy as np
+
+from .bounded import DoseDifferenceBounds
+from .shell import DEFAULT_RAM, GammaInternalFixedOptions, gamma_loop
+
+
+DEFAULT_BATCH_SIZE = 2000
+
+
+@dataclass(frozen=True)
+class GammaPassRate:
+    percent_pass: float
+    confidence_interval: Tuple[float, float]
+    number_of_points: int
+
+
+def gamma_pass_rate(
+    axes_reference,
+    dose_reference,
+    axes_evaluation,
+    dose_evaluation,
+    dose_percent_threshold,
+    distance_mm_threshold,
+    lower_percent_dose_cutoff=20,
+    interp_fraction=10,
+    local_gamma=False,
+    global_normalisation=None,
+    random_subset=None,
+    tolerance=None,
+    confidence_level=0.95,
+    batch_size=DEFAULT_BATCH_SIZE,
+    ram_available=DEFAULT_RAM,
+    quiet=False,
+    **kwargs
+):
+    """Determine the gamma pass rate, stopping each reference point's search
+    as soon as it is known to pass or fail.
+
+    Parameters
+    ----------
+    axes_reference, dose_reference, axes_evaluation, dose_evaluation
+        As for `pymedphys.gamma.gamma_shell`_.
+    dose_percent_threshold, distance_mm_threshold
+        As for `pymedphys.gamma.gamma_shell`_.
+    lower_percent_dose_cutoff, interp_fraction, local_gamma
+        As for `pymedphys.gamma.gamma_shell`_.
+    global_normalisation, ram_available, quiet
+        As for `pymedphys.gamma.gamma_shell`_.
+    random_subset : int, optional
+        The maximum number of randomly chosen reference points to calculate.
+        Defaults to calculating every reference point above the lower dose
+        cutoff.
+    tolerance : float, optional
+        Reference points are calculated in random batches of ``batch_size``,
+        stopping once the width of the confidence interval of every pass rate
+        is no larger than this many percent. Defaults to only stopping once
+        ``random_subset`` points have been calculated.
+    confidence_level : float, optional
+        The confidence level of the returned confidence intervals. Defaults to
+        0.95.
+    batch_size : int, optional
+        The number of reference points calculated between checks of the
+        confidence interval width.
+    **kwargs
+        Passed on to each underlying gamma search, for example ``workers``,
+        ``dtype``, or ``bounded_search``. The search always uses a
+        ``max_gamma`` of 1 and ``skip_once_passed``, so these are not able to
+        be set.
+
+    Returns
+    -------
+    pass_rate : GammaPassRate
+        The percent pass, its Wilson score confidence interval, and the number
+        of reference points calculated. The interval includes a finite
+        population correction so that it collapses to the percent pass once
+        every reference point has been calculated. If more than one dose or
+        distance threshold is given a dictionary keyed by
+        ``(dose_threshold, distance_threshold)`` is returned, as is done by
+        `pymedphys.gamma.gamma_shell`_.
+    """
+    fixed_options = sorted({"max_gamma", "skip_once_passed"} & set(kwargs))
+    if fixed_options:
+        raise ValueError(
+            "`gamma_pass_rate` always searches with `max_gamma=1` and "
+            "`skip_once_passed=True`, so {} cannot be set.".format(
+                ", ".join("`{}`".format(key) for key in fixed_options)
+            )
+        )
+
+    options = GammaInternalFixedOptions.from_user_inputs(
+        axes_reference,
+        dose_reference,
+        axes_evaluation,
+        dose_evaluation,
+        dose_percent_threshold,
+        distance_mm_threshold,
+        lower_percent_dose_cutoff=lower_percent_dose_cutoff,
+        interp_fraction=interp_fraction,
+        max_gamma=1,
+        local_gamma=local_gamma,
+        global_normalisation=global_normalisation,
+        skip_once_passed=True,
+        ram_available=ram_available,
+        quiet=True,
+        **kwargs
+    )
+
+    candidates = np.random.permutation(np.where(options.reference_points_to_calc)[0])
+    population = len(candidates)
+
+    if random_subset is not None:
+        candidates = candidates[0:random_subset]
+
+    # The evaluation grid filters behind the bounds are the costly part, so
+    # they are built once for every candidate and shared between batches.
+    if options.bounded_search:
+        candidates_mask = np.full_like(options.reference_points_to_calc, False)
+        candidates_mask[candidates] = True
+        dose_difference_bounds = DoseDifferenceBounds(
+            options.evaluation_interpolation,
+            options.flat_mesh_axes_reference,
+            options.flat_dose_reference,
+            candidates_mask,
+            np.min(options.distance_mm_threshold) / 2,
+        )
+    else:
+        dose_difference_bounds = None
+
+    if tolerance is None:
+        batch_size = max(len(candidates), 1)
+
+    z_score = _normal_quantile(0.5 + confidence_level / 2)
+
+    shape = (len(options.dose_percent_threshold), len(options.distance_mm_threshold))
+    number_passed = np.zeros(shape, dtype=int)
+    number_valid = np.zeros(shape, dtype=int)
+
+    number_calculated = 0
+    while number_calculated < len(candidates):
+        batch = np.sort(candidates[number_calculated : number_calculated + batch_size])
+        number_calculated += len(batch)
+
+        gamma = _gamma_pass_fail_of_batch(options, batch, dose_difference_bounds)
+        valid = ~np.isnan(gamma)
+
+        number_passed += np.sum(valid & (gamma < 1), axis=0)
+        number_valid += np.sum(valid, axis=0)
+
+        intervals = _wilson_intervals(
+            number_passed, number_valid, number_calculated, population, z_score
+        )
+
+        if not quiet:
+            print(
+                "Points calculated: {} of {} | Widest confidence interval: "
+                "{:.2f}%".format(
+                    number_calculated,
+                    len(candidates),
+                    np.max(intervals[1] - intervals[0]),
+                )
+            )
+
+        if tolerance is not None and np.all(intervals[1] - intervals[0] <= tolerance):
+            break
+
+    with np.errstate(invalid="ignore"):
+        percent_pass = 100 * number_passed / number_valid
+
+    intervals = _wilson_intervals(
+        number_passed, number_valid, number_calculated, population, z_score
+    )
+
+    pass_rate = {}
+    for i, dose_threshold in enumerate(options.dose_percent_threshold):
+        for j, distance_threshold in enumerate(options.distance_mm_threshold):
+            pass_rate[(dose_threshold, distance_threshold)] = GammaPassRate(
+                percent_pass[i, j],
+                (intervals[0][i, j], intervals[1][i, j]),
+                number_calculated,
+            )
+
+    if len(pass_rate.keys()) == 1:
+        pass_rate = next(iter(pass_rate.values()))
+
+    return pass_rate
+
+
+def _gamma_pass_fail_of_batch(options, batch, dose_difference_bounds=None):
+    """Run the gamma search over only the given reference points.
+
+    Gamma values of 1 or more are all returned as 1, and those values below 1
+    are only upper bounds of gamma. Points where gamma could not be found are
+    returned as nan.
+    """
+    batch_options = replace(
+        options,
+        flat_mesh_axes_reference=options.flat_mesh_axes_reference[:, batch],
+        flat_dose_reference=options.flat_dose_reference[batch],
+        reference_points_to_calc=np.full(len(batch), True),
+    )
+
+    if dose_difference_bounds is not None:
+        dose_difference_bounds = dose_difference_bounds.subset(batch)
+
+    gamma = gamma_loop(batch_options, dose_difference_bounds=dose_difference_bounds)
+    gamma[np.isinf(gamma)] = np.nan
+
+    with np.errstate(invalid="ignore"):
+        gamma[gamma > 1] = 1
+
+    return gamma
+
+
+def _wilson_intervals(number_passed, number_valid, number_calculated, population, z):
+    """The Wilson score interval of the percent pass, with the sample size
+    inflated by the finite population correction.
+    """
+    number_valid = np.asarray(number_valid, dtype=float)
+
+    if number_calculated >= population:
+        effective_number = np.full_like(number_valid, np.inf)
+    else:
+        effective_number = (
+            number_valid * (population - 1) / (population - number_calculated)
+        )
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        proportion = number_passed / number_valid
+
+        if np.all(np.isinf(effective_number)):
+            return 100 * proportion, 100 * proportion
+
+        denominator = 1 + z ** 2 / effective_number
+        centre = (proportion + z ** 2 / (2 * effective_number)) / denominator
+        half_width = (
+            z
+            * np.sqrt(
+                proportion * (1 - proportion) / effective_number
+                + z ** 2 / (4 * effective_number ** 2)
+            )
+            / denominator
+        )
+
+    no_valid_points = number_valid == 0
+    lower = np.where(no_valid_points, 0, np.clip(centre - half_width, 0, 1))
+    upper = np.where(no_valid_points, 1, np.clip(centre + half_width, 0, 1))
+
+    return 100 * lower, 100 * upper
+
+
+def _normal_quantile(probability):
+    """The inverse of the standard normal cumulative distribution function,
+    found by bisection.
+    """
+    lower, upper = -10.0, 10.0
+    for _ in range(100):
+        middle = (lower + upper) / 2
+        if 0.5 * (1 + math.erf(middle / math.sqrt(2))) < probability:
+            lower = middle
+        else:
+            upper = middle
+
+    return (lower + upper) / 2
@@ -33,16 +33,21 @@ This module makes use of some of the ideas presented within
 """
 
 import sys
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from typing import Optional
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
+from functools import lru_cache, partial
 
 import numpy as np
 
 from ..interpolate import RegularGridInterpolator
 from ..utilities import run_input_checks
+from .bounded import DoseDifferenceBounds, settle_searches
 
 
 DEFAULT_RAM = int(2 ** 30 * 1.5)  # 1.5 GB
+BOUNDED_SEARCH_TOLERANCE = 0.1
+SHELL_CACHE_SIZE = 128
 
 
 def gamma_shell(
@@ -61,6 +66,10 @@ def gamma_shell(
     random_subset=None,
     ram_available=DEFAULT_RAM,
     quiet=False,
+    bounded_search=False,
+    workers=1,
+    executor=None,
+    dtype=np.float64,
 ):
     """Compare two dose grids with the gamma index.
 
@@ -111,6 +120,36 @@ def gamma_shell(
     quiet : bool, optional
         Used to quiet informational printing during function usage. Defaults to
         False.
+    bounded_search : bool, optional
+        Settle the search of a reference point as soon as a lower bound on the
+        dose difference, taken from running minimum and maximum filters of the
+        evaluation grid, shows that no larger search distance could lower its
+        gamma. In regions of low dose gradient this avoids most of the shell
+        expansion. Pass and fail results are identical to the unbounded
+        search, and gamma values are no more than ``0.1 / interp_fraction``
+        larger. Defaults to False.
+    workers : int, optional
+        The number of reference point slices evaluated concurrently. The
+        ``ram_available`` budget is split evenly between them. Unless an
+        ``executor`` is given a thread pool is used, so that every worker
+        shares the same evaluation interpolator without copying it. The
+        result is identical to that of a single worker. Defaults to 1.
+    executor : concurrent.futures.Executor, optional
+        A thread pool to use instead of one created for each call, for
+        example when running many gamma comparisons in a batch. Process
+        pools are not supported, as they would need the evaluation
+        interpolator and reference mesh to be copied for every slice.
+    dtype : data-type, optional
+        The floating point type used throughout the calculation, including
+        the interpolation of the evaluation grid and the returned gamma.
+        Using ``np.float32`` roughly halves the memory needed, allowing larger
+        slices of reference points per pass. Float32 has a relative precision
+        of about 6e-8, so for coordinates within 1 m of the origin and dose
+        thresholds of at least 1% the gamma values differ from those found
+        with float64 by less than 1e-4. Only reference points with gamma within
+        1e-4 of 1 are able to change between passing and failing, which bounds
+        the change in pass rate by the percentage of such points. Defaults to
+        ``np.float64``.
 
     Returns
     -------
@@ -135,6 +174,10 @@ def gamma_shell(
         random_subset,
         ram_available,
         quiet,
+        bounded_search,
+        workers,
+        executor,
+        dtype,
     )
 
     if not options.quiet:
@@ -212,6 +255,10 @@ class GammaInternalFixedOptions:
     skip_once_passed: bool = False
     ram_available: Optional[int] = DEFAULT_RAM
     quiet: bool = False
+    bounded_search: bool = False
+    workers: int = 1
+    executor: Optional[Executor] = None
+    dtype: np.dtype = np.dtype(np.float64)
 
     def __post_init__(self):
         self.set_defaults()
@@ -244,12 +291,23 @@ class GammaInternalFixedOptions:
         random_subset=None,
         ram_available=None,
         quiet=False,
+        bounded_search=False,
+        workers=1,
+        executor=None,
+        dtype=np.float64,
     ):
 
         axes_reference, axes_evaluation = run_input_checks(
             axes_reference, dose_reference, axes_evaluation, dose_evaluation
         )
 
+        if isinstance(executor, ProcessPoolExecutor):
+            raise ValueError(
+                "Only thread based executors are supported. A process pool "
+                "would copy the evaluation interpolator and reference mesh "
+                "for every slice."
+            )
+
         dose_percent_threshold = expand_dims_to_1d(dose_percent_threshold)
         distance_mm_threshold = expand_dims_to_1d(distance_mm_threshold)
 
@@ -260,11 +318,13 @@ class GammaInternalFixedOptions:
 
         maximum_test_distance = np.max(distance_mm_threshold) * max_gamma
 
+        dtype = np.dtype(dtype)
         evaluation_interpolation = RegularGridInterpolator(
             axes_evaluation,
             np.array(dose_evaluation),
             bounds_error=False,
             fill_value=np.inf,
+            dtype=dtype,
         )
 
         dose_reference = np.array(dose_reference)
@@ -272,7 +332,7 @@ class GammaInternalFixedOptions:
 
         mesh_axes_reference = np.meshgrid(*axes_reference, indexing="ij")
         flat_mesh_axes_reference = np.array(
-            [np.ravel(item) for item in mesh_axes_reference]
+            [np.ravel(item) for item in mesh_axes_reference], dtype=dtype
         )
 
         reference_points_to_calc = reference_dose_above_threshold
@@ -291,7 +351,7 @@ class GammaInternalFixedOptions:
 
             reference_points_to_calc = random_subset_to_calc
 
-        flat_dose_reference = np.ravel(dose_reference)
+        flat_dose_reference = np.ravel(dose_reference).astype(dtype, copy=False)
 
         return cls(
             flat_mesh_axes_reference,
@@ -309,10 +369,24 @@ class GammaInternalFixedOptions:
             skip_once_passed,
             ram_available,
             quiet,
+            bounded_search,
+            workers,
+            executor,
+            dtype,
         )
 
 
-def gamma_loop(options: GammaInternalFixedOptions) -> np.ndarray:
+def gamma_loop(
+    options: GammaInternalFixedOptions,
+    dose_difference_bounds: Optional[DoseDifferenceBounds] = None,
+) -> np.ndarray:
+    if options.executor is None and options.workers > 1:
+        with ThreadPoolExecutor(max_workers=options.workers) as executor:
+            return gamma_loop(
+                replace(options, executor=executor),
+                dose_difference_bounds=dose_difference_bounds,
+            )
+
     still_searching_for_gamma = np.full_like(
         options.flat_dose_reference, True, dtype=bool
     )
@@ -322,7 +396,8 @@ def gamma_loop(options: GammaInternalFixedOptions) -> np.ndarray:
             len(options.flat_dose_reference),
             len(options.dose_percent_threshold),
             len(options.distance_mm_threshold),
-        )
+        ),
+        dtype=options.dtype,
     )
 
     distance_step_size = np.min(options.distance_mm_threshold) / options.interp_fraction
@@ -332,6 +407,16 @@ def gamma_loop(options: GammaInternalFixedOptions) -> np.ndarray:
     distance = 0.0
 
     force_search_distances = np.sort(options.distance_mm_threshold)
+
+    if options.bounded_search and dose_difference_bounds is None:
+        dose_difference_bounds = DoseDifferenceBounds(
+            options.evaluation_interpolation,
+            options.flat_mesh_axes_reference,
+            options.flat_dose_reference,
+            options.reference_points_to_calc,
+            np.min(options.distance_mm_threshold) / 2,
+        )
+
     while distance <= options.maximum_test_distance:
         if not options.quiet:
             sys.stdout.write(
@@ -352,6 +437,17 @@ def gamma_loop(options: GammaInternalFixedOptions) -> np.ndarray:
             to_be_checked,
         )
 
+        if options.bounded_search:
+            still_searching_for_gamma_all = settle_searches(
+                options,
+                dose_difference_bounds,
+                current_gamma,
+                still_searching_for_gamma_all,
+                distance,
+                to_be_checked,
+                BOUNDED_SEARCH_TOLERANCE / options.interp_fraction,
+            )
+
         still_searching_for_gamma = np.any(
             np.any(still_searching_for_gamma_all, axis=-1), axis=-1
         )
@@ -394,14 +490,16 @@ def multi_thresholds_gamma_calc(
     distance,
     to_be_checked,
 ):
+    dose_percent_threshold = options.dose_percent_threshold.astype(options.dtype)
+    distance_mm_threshold = options.distance_mm_threshold.astype(options.dtype)
 
     gamma_at_distance = np.sqrt(
         (
             min_relative_dose_difference[:, None, None]
-            / (options.dose_percent_threshold[None, :, None] / 100)
+            / (dose_percent_threshold[None, :, None] / 100)
         )
         ** 2
-        + (distance / options.distance_mm_threshold[None, None, :]) ** 2
+        + (distance / distance_mm_threshold[None, None, :]) ** 2
     )
 
     current_gamma[to_be_checked, :, :] = np.min(
@@ -416,7 +514,7 @@ def multi_thresholds_gamma_calc(
     )
 
     still_searching_for_gamma = current_gamma > (
-        distance / options.distance_mm_threshold[None, None, :]
+        distance / distance_mm_threshold[None, None, :]
     )
 
     if options.skip_once_passed:
@@ -437,8 +535,11 @@ def calculate_min_dose_difference(options, distance, to_be_checked, distance_ste
 
     num_dimensions = np.shape(options.flat_mesh_axes_reference)[0]
 
-    coordinates_at_distance_shell = calculate_coordinates_shell(
-        distance, num_dimensions, distance_step_size
+    coordinates_at_distance_shell = tuple(
+        coords.astype(options.dtype, copy=False)
+        for coords in calculate_coordinates_shell(
+            distance, num_dimensions, distance_step_size
+        )
     )
 
     num_points_in_shell = np.shape(coordinates_at_distance_shell)[1]
@@ -446,12 +547,20 @@ def calculate_min_dose_difference(options, distance, to_be_checked, distance_ste
     estimated_ram_needed = (
         np.uint64(num_points_in_shell)
         * np.uint64(np.count_nonzero(to_be_checked))
-        * np.uint64(32)
+        * np.uint64(4 * options.dtype.itemsize)
         * np.uint64(num_dimensions)
         * np.uint64(2)
     )
 
-    num_slices = np.floor(estimated_ram_needed / options.ram_available).astype(int) + 1
+    ram_available_per_worker = options.ram_available / options.workers
+    num_slices = (
+        np.floor(estimated_ram_needed / ram_available_per_worker).astype(int) + 1
+    )
+
+    all_checks = np.where(np.ravel(to_be_checked))[0]
+
+    if options.executor is not None:
+        num_slices = np.clip(num_slices, options.workers, max(len(all_checks), 1))
 
     if not options.quiet:
         sys.stdout.write(
@@ -461,47 +570,62 @@ def calculate_min_dose_difference(options, distance, to_be_checked, distance_ste
         )
         sys.stdout.flush()
 
-    all_checks = np.where(np.ravel(to_be_checked))[0]
     index = np.arange(len(all_checks))
     sliced = np.array_split(index, num_slices)
 
     sorted_sliced = [np.sort(current_slice) for current_slice in sliced]
+    reference_points_sliced = [
+        all_checks[current_slice] for current_slice in sorted_sliced
+    ]
+
+    calculate_slice = partial(
+        calculate_min_dose_difference_of_slice,
+        options,
+        coordinates_at_distance_shell=coordinates_at_distance_shell,
+    )
 
-    for current_slice in sorted_sliced:
-        to_be_checked_sliced = np.full_like(to_be_checked, False, dtype=bool)
-        to_be_checked_sliced[  # pylint: disable=unsupported-assignment-operation
-            all_checks[current_slice]
-        ] = True
+    if options.executor is None:
+        slice_results = map(calculate_slice, reference_points_sliced)
+    else:
+        slice_results = options.executor.map(calculate_slice, reference_points_sliced)
 
-        assert np.all(to_be_checked[to_be_checked_sliced])
+    for current_slice, result in zip(sorted_sliced, slice_results):
+        min_relative_dose_difference[current_slice] = result
 
-        axes_reference_to_be_checked = options.flat_mesh_axes_reference[
-            :, to_be_checked_sliced
-        ]
+    return min_relative_dose_difference
 
-        evaluation_dose = interpolate_evaluation_dose_at_distance(
-            options.evaluation_interpolation,
-            axes_reference_to_be_checked,
-            coordinates_at_distance_shell,
-        )
 
-        if options.local_gamma:
-            with np.errstate(divide="ignore"):
-                relative_dose_difference = (
-                    evaluation_dose
-                    - options.flat_dose_reference[to_be_checked_sliced][None, :]
-                ) / (options.flat_dose_reference[to_be_checked_sliced][None, :])
-        else:
+def calculate_min_dose_difference_of_slice(
+    options, reference_points, coordinates_at_distance_shell
+):
+    """Determine the minimum dose difference for a slice of the reference
+    points given by their flat indices.
+    """
+    to_be_checked_sliced = np.full_like(options.flat_dose_reference, False, dtype=bool)
+    to_be_checked_sliced[reference_points] = True
+
+    axes_reference_to_be_checked = options.flat_mesh_axes_reference[
+        :, to_be_checked_sliced
+    ]
+
+    evaluation_dose = interpolate_evaluation_dose_at_distance(
+        options.evaluation_interpolation,
+        axes_reference_to_be_checked,
+        coordinates_at_distance_shell,
+    )
+
+    if options.local_gamma:
+        with np.errstate(divide="ignore"):
             relative_dose_difference = (
                 evaluation_dose
                 - options.flat_dose_reference[to_be_checked_sliced][None, :]
-            ) / options.global_normalisation
-
-        min_relative_dose_difference[current_slice] = np.min(
-            np.abs(relative_dose_difference), axis=0
-        )
+            ) / (options.flat_dose_reference[to_be_checked_sliced][None, :])
+    else:
+        relative_dose_difference = (
+            evaluation_dose - options.flat_dose_reference[to_be_checked_sliced][None, :]
+        ) / options.dtype.type(options.global_normalisation)
 
-    return min_relative_dose_difference
+    return np.min(np.abs(relative_dose_difference), axis=0)
 
 
 def interpolate_evaluation_dose_at_distance(
@@ -545,18 +669,31 @@ def calculate_coordinates_shell(distance, num_dimensions, distance_step_size):
     """Create the shell of coordinate shifts for the given testing distance.
 
     Coordinate shifts are determined to check the evaluation dose for a
-    given distance, dimension, and step size
+    given distance, dimension, and step size. The same distance and step
+    size pairs recur across gamma calculations that use the same thresholds,
+    so the most recently used shells are cached. The returned arrays are
+    read only.
     """
-    if num_dimensions == 1:
-        return calculate_coordinates_shell_1d(distance)
+    return _cached_coordinates_shell(
+        float(distance), int(num_dimensions), float(distance_step_size)
+    )
 
-    if num_dimensions == 2:
-        return calculate_coordinates_shell_2d(distance, distance_step_size)
 
-    if num_dimensions == 3:
-        return calculate_coordinates_shell_3d(distance, distance_step_size)
+@lru_cache(maxsize=SHELL_CACHE_SIZE)
+def _cached_coordinates_shell(distance, num_dimensions, distance_step_size):
+    if num_dimensions == 1:
+        shell = calculate_coordinates_shell_1d(distance)
+    elif num_dimensions == 2:
+        shell = calculate_coordinates_shell_2d(distance, distance_step_size)
+    elif num_dimensions == 3:
+        shell = calculate_coordinates_shell_3d(distance, distance_step_size)
+    else:
+        raise Exception("No valid dimension")
+
+    for coords in shell:
+        coords.setflags(write=False)
 
-    raise Exception("No valid dimension")
+    return shell
 
 
 def calculate_coordinates_shell_1d(distance):
@@ -593,13 +730,15 @@ def calculate_coordinates_shell_3d(distance, distance_step_size):
     row_circumference = 2 * np.pi * row_radii
     amount_in_row = np.ceil(row_circumference / distance_step_size).astype(int) + 1
 
-    x_coords = []
-    y_coords = []
-    z_coords = []
-    for i, phi in enumerate(elevation):
-        azimuth = np.linspace(0, 2 * np.pi, amount_in_row[i] + 1)[:-1:]
-        x_coords.append(distance * np.sin(phi) * np.cos(azimuth))
-        y_coords.append(distance * np.sin(phi) * np.sin(azimuth))
-        z_coords.append(distance * np.cos(phi) * np.ones_like(azimuth))
+    row = np.repeat(np.arange(number_of_rows), amount_in_row)
+    row_start = np.cumsum(amount_in_row) - amount_in_row
+    index_within_row = np.arange(len(row)) - row_start[row]
+
+    azimuth = index_within_row * (2 * np.pi / amount_in_row[row])
+    phi = elevation[row]
+
+    x_coords = distance * np.sin(phi) * np.cos(azimuth)
+    y_coords = distance * np.sin(phi) * np.sin(azimuth)
+    z_coords = distance * np.cos(phi) * np.ones_like(azimuth)
 
-    return (np.hstack(x_coords), np.hstack(y_coords), np.hstack(z_coords))
+    return (x_coords, y_coords, z_coords)
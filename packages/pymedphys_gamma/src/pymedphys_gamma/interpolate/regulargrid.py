@@ -74,6 +74,12 @@ class RegularGridInterpolator(object):
         interpolation domain. If None, values outside
         the domain are extrapolated.
 
+    dtype : data-type, optional
+        If provided, the grid points and values are converted to this
+        floating point type, as are the coordinates given at each
+        evaluation, so that the interpolation is undertaken at this
+        precision. If None, the precision follows the inputs.
+
     Methods
     -------
     __call__
@@ -142,7 +148,13 @@ class RegularGridInterpolator(object):
     # see https://github.com/JohannesBuchner/regulargrid
 
     def __init__(
-        self, points, values, method="linear", bounds_error=True, fill_value=np.nan
+        self,
+        points,
+        values,
+        method="linear",
+        bounds_error=True,
+        fill_value=np.nan,
+        dtype=None,
     ):
         if method not in ["linear", "nearest"]:
             raise ValueError("Method '%s' is not defined" % method)
@@ -160,7 +172,9 @@ class RegularGridInterpolator(object):
             )
 
         if hasattr(values, "dtype") and hasattr(values, "astype"):
-            if not np.issubdtype(values.dtype, np.inexact):
+            if dtype is not None:
+                values = values.astype(dtype, copy=False)
+            elif not np.issubdtype(values.dtype, np.inexact):
                 values = values.astype(float)
 
         self.fill_value = fill_value
@@ -188,8 +202,9 @@ class RegularGridInterpolator(object):
                     "There are %d points and %d values in "
                     "dimension %d" % (len(p), values.shape[i], i)
                 )
-        self.grid = tuple([np.asarray(p) for p in points])
+        self.grid = tuple([np.asarray(p, dtype=dtype) for p in points])
         self.values = values
+        self.dtype = dtype
 
     def __call__(self, xi, method=None):
         """
@@ -218,6 +233,9 @@ class RegularGridInterpolator(object):
                 "dimension %d" % (xi.shape[1], ndim)
             )
 
+        if self.dtype is not None:
+            xi = xi.astype(self.dtype, copy=False)
+
         xi_shape = xi.shape
         xi = xi.reshape(-1, xi_shape[-1])
 
@@ -23,9 +23,4 @@
 # You should have received a copy of the Apache-2.0 along with this
 # program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
 
-from .core import (
-    create_point_combination,
-    convert_to_ravel_index,
-    calculate_pass_rate,
-    run_input_checks,
-)
+from .core import calculate_pass_rate, run_input_checks
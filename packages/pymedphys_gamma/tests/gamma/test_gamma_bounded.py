@@ -0,0 +1,127 @@
+# Copyright (C) 2015-2018 Simon Biggs
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+
+"""Compare the bounded gamma search to the full shell search."""
+
+import numpy as np
+
+from pymedphys.gamma import gamma_shell
+
+from test_gamma_shell import get_dummy_gamma_set
+
+
+def get_smooth_gamma_set():
+    grid_x = np.arange(-30, 30.1, 2)
+    grid_y = np.arange(-30, 30.1, 2)
+    grid_z = np.arange(-20, 20.1, 2)
+    coords = (grid_x, grid_y, grid_z)
+
+    mesh_x, mesh_y, mesh_z = np.meshgrid(*coords, indexing="ij")
+
+    def field(scale, shift):
+        def profile(position, width):
+            return 1 / (1 + np.exp((np.abs(position) - width) / 3))
+
+        return (
+            scale
+            * profile(mesh_x - shift, 20)
+            * profile(mesh_y, 20)
+            * profile(mesh_z, 12)
+            * (1 + 0.002 * mesh_x)
+        )
+
+    return coords, field(2, 0), field(2.05, 1)
+
+
+def assert_bounded_agrees(coords, reference, evaluation, **kwargs):
+    full = gamma_shell(coords, reference, coords, evaluation, quiet=True, **kwargs)
+    bounded = gamma_shell(
+        coords, reference, coords, evaluation, quiet=True, bounded_search=True, **kwargs
+    )
+
+    if not isinstance(full, dict):
+        full = {None: full}
+        bounded = {None: bounded}
+
+    tolerance = 0.1 / kwargs.get("interp_fraction", 10)
+
+    for key, gamma in full.items():
+        assert np.array_equal(np.isnan(gamma), np.isnan(bounded[key]))
+
+        valid = ~np.isnan(gamma)
+        assert np.array_equal(gamma[valid] < 1, bounded[key][valid] < 1)
+        assert np.all(bounded[key][valid] >= gamma[valid] - 1e-10)
+        assert np.all(bounded[key][valid] <= gamma[valid] + tolerance)
+
+
+def test_bounded_agrees_with_dummy_set():
+    coords, reference, evaluation, _ = get_dummy_gamma_set()
+
+    assert_bounded_agrees(
+        coords,
+        reference,
+        evaluation,
+        dose_percent_threshold=3,
+        distance_mm_threshold=0.3,
+    )
+    assert_bounded_agrees(
+        coords[1::],
+        reference[5, :, :],
+        evaluation[5, :, :],
+        dose_percent_threshold=3,
+        distance_mm_threshold=0.3,
+    )
+    assert_bounded_agrees(
+        coords[2],
+        reference[5, 5, :],
+        evaluation[5, 5, :],
+        dose_percent_threshold=3,
+        distance_mm_threshold=0.3,
+    )
+
+
+def test_bounded_agrees_with_smooth_field():
+    coords, reference, evaluation = get_smooth_gamma_set()
+
+    assert_bounded_agrees(
+        coords, reference, evaluation, dose_percent_threshold=3, distance_mm_threshold=3
+    )
+    assert_bounded_agrees(
+        coords,
+        reference,
+        evaluation,
+        dose_percent_threshold=[2, 3],
+        distance_mm_threshold=[2, 3],
+        max_gamma=2,
+    )
+    assert_bounded_agrees(
+        coords,
+        reference,
+        evaluation,
+        dose_percent_threshold=3,
+        distance_mm_threshold=3,
+        local_gamma=True,
+        interp_fraction=5,
+    )
@@ -0,0 +1,159 @@
+# Copyright (C) 2015-2018 Simon Biggs
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+
+"""Compare the offset vector gamma filter to a point by point search."""
+
+import numpy as np
+
+from pymedphys.gamma import gamma_filter_numpy
+
+
+def point_by_point_gamma_filter(
+    axes_reference,
+    dose_reference,
+    axes_evaluation,
+    dose_evaluation,
+    distance_mm_threshold,
+    dose_threshold,
+    lower_dose_cutoff=0,
+):
+    mesh_reference = np.meshgrid(*axes_reference, indexing="ij")
+    mesh_evaluation = np.meshgrid(*axes_evaluation, indexing="ij")
+
+    gamma_pass = []
+    for index in np.ndindex(*np.shape(dose_evaluation)):
+        if dose_evaluation[index] <= lower_dose_cutoff:
+            continue
+
+        distance = np.sqrt(
+            np.sum(
+                [
+                    (reference - evaluation[index]) ** 2
+                    for reference, evaluation in zip(mesh_reference, mesh_evaluation)
+                ],
+                axis=0,
+            )
+        )
+        within_distance = distance < distance_mm_threshold
+
+        gamma = np.sqrt(
+            (
+                (dose_evaluation[index] - dose_reference[within_distance])
+                / dose_threshold
+            )
+            ** 2
+            + (distance[within_distance] / distance_mm_threshold) ** 2
+        )
+        gamma_pass.append(np.any(gamma < 1))
+
+    return np.mean(gamma_pass) * 100
+
+
+def random_smooth_dose(shape):
+    dose = np.random.uniform(0, 1, shape)
+    for axis in range(len(shape)):
+        dose = (dose + np.roll(dose, 1, axis=axis) + np.roll(dose, -1, axis=axis)) / 3
+
+    return dose
+
+
+def test_filter_agrees_with_point_by_point():
+    np.random.seed(3)
+
+    for shape in [(60,), (20, 25), (9, 10, 11)]:
+        axes_reference = tuple(np.arange(length) * 0.5 - 3 for length in shape)
+        axes_evaluation = tuple(
+            axis[2 : len(axis) - 1] for axis in axes_reference[:-1]
+        ) + (axes_reference[-1] - 1,)
+
+        dose_reference = random_smooth_dose(shape)
+        dose_evaluation = random_smooth_dose(
+            tuple(len(axis) for axis in axes_evaluation)
+        )
+
+        for distance_mm_threshold, dose_threshold in [(1, 0.05), (1.6, 0.02)]:
+            expected = point_by_point_gamma_filter(
+                axes_reference,
+                dose_reference,
+                axes_evaluation,
+                dose_evaluation,
+                distance_mm_threshold,
+                dose_threshold,
+                lower_dose_cutoff=0.3,
+            )
+
+            for workers in [1, 3]:
+                percent_pass = gamma_filter_numpy(
+                    axes_reference,
+                    dose_reference,
+                    axes_evaluation,
+                    dose_evaluation,
+                    distance_mm_threshold,
+                    dose_threshold,
+                    lower_dose_cutoff=0.3,
+                    workers=workers,
+                )
+
+                assert np.allclose(percent_pass, expected)
+                assert 0 < percent_pass < 100
+
+
+def test_filter_of_misaligned_grids():
+    np.random.seed(5)
+
+    for shape in [(40,), (15, 18), (8, 9, 10)]:
+        axes_reference = tuple(np.arange(length) * 0.5 - 3 for length in shape)
+        axes_evaluation = tuple(
+            np.arange(length - 2) * 0.7 - 2.85 for length in shape[:-1]
+        ) + (axes_reference[-1][1::] + 0.2,)
+
+        dose_reference = random_smooth_dose(shape)
+        dose_evaluation = random_smooth_dose(
+            tuple(len(axis) for axis in axes_evaluation)
+        )
+
+        for distance_mm_threshold, dose_threshold in [(1, 0.05), (1.6, 0.02)]:
+            expected = point_by_point_gamma_filter(
+                axes_reference,
+                dose_reference,
+                axes_evaluation,
+                dose_evaluation,
+                distance_mm_threshold,
+                dose_threshold,
+                lower_dose_cutoff=0.3,
+            )
+
+            percent_pass = gamma_filter_numpy(
+                axes_reference,
+                dose_reference,
+                axes_evaluation,
+                dose_evaluation,
+                distance_mm_threshold,
+                dose_threshold,
+                lower_dose_cutoff=0.3,
+            )
+
+            assert np.allclose(percent_pass, expected)
+            assert 0 < percent_pass < 100
@@ -0,0 +1,126 @@
+# Copyright (C) 2015-2018 Simon Biggs
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+
+"""Compare the pass rate only gamma search to the full gamma map."""
+
+import numpy as np
+import pytest
+
+from pymedphys.gamma import gamma_pass_rate, gamma_shell, calculate_pass_rate
+from pymedphys_gamma.implementation.bounded import DoseDifferenceBounds
+
+from test_gamma_bounded import get_smooth_gamma_set
+
+
+def test_pass_rate_agrees_with_gamma_shell():
+    coords, reference, evaluation = get_smooth_gamma_set()
+
+    kwargs = {"dose_percent_threshold": [1, 3], "distance_mm_threshold": [2, 3]}
+
+    gamma = gamma_shell(coords, reference, coords, evaluation, quiet=True, **kwargs)
+    pass_rate = gamma_pass_rate(
+        coords, reference, coords, evaluation, quiet=True, **kwargs
+    )
+
+    for key, gamma_map in gamma.items():
+        expected = calculate_pass_rate(gamma_map)
+
+        assert np.allclose(pass_rate[key].percent_pass, expected)
+        assert np.allclose(pass_rate[key].confidence_interval, expected)
+        assert pass_rate[key].number_of_points == np.sum(~np.isnan(gamma_map))
+
+
+def test_adaptive_random_subset():
+    coords, reference, evaluation = get_smooth_gamma_set()
+
+    kwargs = {"dose_percent_threshold": 1, "distance_mm_threshold": 1}
+
+    expected = calculate_pass_rate(
+        gamma_shell(coords, reference, coords, evaluation, quiet=True, **kwargs)
+    )
+
+    np.random.seed(1)
+    pass_rate = gamma_pass_rate(
+        coords,
+        reference,
+        coords,
+        evaluation,
+        random_subset=4000,
+        tolerance=10,
+        batch_size=200,
+        confidence_level=0.999,
+        quiet=True,
+        **kwargs
+    )
+
+    lower, upper = pass_rate.confidence_interval
+
+    assert upper - lower <= 10
+    assert lower <= pass_rate.percent_pass <= upper
+    assert lower <= expected <= upper
+    assert pass_rate.number_of_points < 4000
+
+
+def test_batches_share_the_bounds(monkeypatch):
+    coords, reference, evaluation = get_smooth_gamma_set()
+
+    kwargs = {"dose_percent_threshold": [1, 3], "distance_mm_threshold": [2, 3]}
+
+    gamma = gamma_shell(coords, reference, coords, evaluation, quiet=True, **kwargs)
+
+    bounds_built = []
+    original_init = DoseDifferenceBounds.__init__
+
+    def counting_init(self, *args, **init_kwargs):
+        bounds_built.append(self)
+        original_init(self, *args, **init_kwargs)
+
+    monkeypatch.setattr(DoseDifferenceBounds, "__init__", counting_init)
+
+    pass_rate = gamma_pass_rate(
+        coords,
+        reference,
+        coords,
+        evaluation,
+        tolerance=0,
+        batch_size=500,
+        bounded_search=True,
+        quiet=True,
+        **kwargs
+    )
+
+    assert len(bounds_built) == 1
+    for key, gamma_map in gamma.items():
+        assert np.allclose(pass_rate[key].percent_pass, calculate_pass_rate(gamma_map))
+
+
+def test_fixed_options_are_rejected():
+    coords, reference, evaluation = get_smooth_gamma_set()
+
+    for key, value in [("max_gamma", 2), ("skip_once_passed", False)]:
+        with pytest.raises(ValueError, match=key):
+            gamma_pass_rate(
+                coords, reference, coords, evaluation, 1, 1, quiet=True, **{key: value}
+            )
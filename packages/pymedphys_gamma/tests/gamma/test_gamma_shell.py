@@ -25,11 +25,16 @@
 
 """Tests for npgamma."""
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import pytest
 
 import numpy as np
 from pymedphys.gamma import gamma_shell
-from pymedphys_gamma.implementation.shell import calculate_coordinates_shell
+from pymedphys_gamma.implementation.shell import (
+    calculate_coordinates_shell,
+    calculate_coordinates_shell_3d,
+)
 
 
 def does_gamma_scale_as_expected(
@@ -180,6 +185,64 @@ def test_regression_of_gamma_1d():
     assert np.all(expected_gamma[5, 5, :] == gamma1d)
 
 
+def test_workers_give_identical_results():
+    coords, reference, evaluation, _ = get_dummy_gamma_set()
+
+    def calc_gamma(**kwargs):
+        return gamma_shell(
+            coords,
+            reference,
+            coords,
+            evaluation,
+            [2, 3],
+            [0.2, 0.3],
+            lower_percent_dose_cutoff=0,
+            ram_available=2 ** 20,
+            quiet=True,
+            **kwargs
+        )
+
+    serial = calc_gamma()
+    concurrent = calc_gamma(workers=3)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        given_executor = calc_gamma(workers=2, executor=executor)
+
+    for key, gamma in serial.items():
+        assert np.array_equal(gamma, concurrent[key], equal_nan=True)
+        assert np.array_equal(gamma, given_executor[key], equal_nan=True)
+
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        with pytest.raises(ValueError):
+            calc_gamma(executor=executor)
+
+
+def test_float32_agrees_with_float64():
+    coords, reference, evaluation, _ = get_dummy_gamma_set()
+
+    def calc_gamma(dtype):
+        return gamma_shell(
+            coords,
+            reference,
+            coords,
+            evaluation,
+            [2, 3],
+            [0.2, 0.3],
+            lower_percent_dose_cutoff=0,
+            quiet=True,
+            dtype=dtype,
+        )
+
+    gamma_float64 = calc_gamma(np.float64)
+    gamma_float32 = calc_gamma(np.float32)
+
+    for key, gamma in gamma_float64.items():
+        assert gamma_float32[key].dtype == np.float32
+        assert np.allclose(gamma, gamma_float32[key], atol=1e-4, equal_nan=True)
+
+        changed_pass = (gamma < 1) != (gamma_float32[key] < 1)
+        assert np.all(np.abs(gamma[changed_pass] - 1) < 1e-4)
+
+
 def test_coords_stepsize():
     """Testing correct stepsize implementation.
 
@@ -219,3 +282,46 @@ def test_distance_0_gives_1_point():
     x, y, z = calculate_coordinates_shell(distance, num_dimensions, distance_step_size)
 
     assert len(x) == 1 & len(y) == 1 & len(z) == 1
+
+
+def test_shell_3d_matches_row_by_row_construction():
+    for distance in [0.3, 1, 2.7, 17.3]:
+        for distance_step_size in [0.1, 0.27]:
+            number_of_rows = (
+                np.ceil(np.pi * distance / distance_step_size).astype(int) + 1
+            )
+            elevation = np.linspace(0, np.pi, number_of_rows)
+            amount_in_row = (
+                np.ceil(
+                    2 * np.pi * distance * np.sin(elevation) / distance_step_size
+                ).astype(int)
+                + 1
+            )
+
+            expected = []
+            for phi, amount in zip(elevation, amount_in_row):
+                azimuth = np.linspace(0, 2 * np.pi, amount + 1)[:-1:]
+                expected.append(
+                    [
+                        distance * np.sin(phi) * np.cos(azimuth),
+                        distance * np.sin(phi) * np.sin(azimuth),
+                        distance * np.cos(phi) * np.ones_like(azimuth),
+                    ]
+                )
+
+            expected = np.hstack(expected)
+            vectorised = np.array(
+                calculate_coordinates_shell_3d(distance, distance_step_size)
+            )
+
+            assert np.array_equal(expected, vectorised)
+
+
+def test_shells_are_cached():
+    shell = calculate_coordinates_shell(1.2, 3, 0.3)
+
+    assert calculate_coordinates_shell(np.float64(1.2), 3, 0.3) is shell
+    assert calculate_coordinates_shell(1.2, 2, 0.3) is not shell
+
+    with pytest.raises(ValueError):
+        shell[0][0] = 1
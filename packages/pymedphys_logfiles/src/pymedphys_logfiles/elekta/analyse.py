@@ -28,14 +28,13 @@
 """
 
 import os
+import time
 import traceback
-import json
 
 import numpy as np
 import matplotlib.pyplot as plt
 
 from pymedphys_utilities.utilities import (
-    get_cache_filepaths,
     get_mu_density_parameters,
     get_index,
     get_centre,
@@ -45,7 +44,10 @@ from pymedphys_utilities.utilities import (
 )
 from pymedphys_databases.msq import multi_mosaiq_connect, multi_fetch_and_verify_mosaiq
 from pymedphys_databases.delivery import DeliveryDatabases
-from pymedphys_mudensity.mudensity import calc_mu_density
+from pymedphys_mudensity.mudensity import calc_mu_density_return_grid
+
+from .cache import cached_delivery_from_logfile, delivery_from_index
+from .comparisons import get_machine_and_local_time, open_comparison_store
 
 
 def analyse_single_hash(index, config, filehash, cursors):
@@ -71,25 +73,21 @@ def analyse_single_hash(index, config, filehash, cursors):
 
 
 def load_comparisons_from_cache(config):
-    (comparison_storage_filepath, _) = get_cache_filepaths(config)
-
-    with open(comparison_storage_filepath, "r") as comparisons_file:
-        comparison_storage = json.load(comparisons_file)
-
-    file_hashes = np.array(list(comparison_storage.keys()))
-
-    comparisons = np.array([comparison_storage[file_hash] for file_hash in file_hashes])
-
-    index = get_index(config)
-    file_paths_worst_first = np.array(
-        [get_filepath_from_hash(config, index, file_hash) for file_hash in file_hashes]
-    )
-
-    sort_ref = np.argsort(comparisons)[::-1]
-
-    file_hashes = file_hashes[sort_ref]
-    # comparisons = comparisons[sort_ref]
-    file_paths_worst_first = file_paths_worst_first[sort_ref]
+    with get_index(config) as index:
+        with open_comparison_store(config, index=index) as store:
+            worst_first = store.worst()
+
+        file_hashes = np.array([result["hash"] for result in worst_first])
+        comparison_storage = {
+            result["hash"]: result["comparison"] for result in worst_first
+        }
+
+        file_paths_worst_first = np.array(
+            [
+                get_filepath_from_hash(config, index, file_hash)
+                for file_hash in file_hashes
+            ]
+        )
 
     return file_hashes, comparison_storage, file_paths_worst_first
 
@@ -139,102 +137,112 @@ def random_uncompared_logfiles(index, config, compared_hashes):
     return file_hashes_vmat[shuffle_index], vmat_filepaths[shuffle_index]
 
 
-def mudensity_comparisons(config, plot=True, new_logfiles=False):
-    (comparison_storage_filepath, comparison_storage_scratch) = get_cache_filepaths(
-        config
-    )
-
+def mudensity_comparisons(config, plot=True, new_logfiles=False, workers=1):
     grid_resolution, ram_fraction = get_mu_density_parameters(config)
 
-    index = get_index(config)
-    field_id_key_map = get_field_id_key_map(index)
+    with get_index(config) as index:
+        field_id_key_map = get_field_id_key_map(index)
 
-    (file_hashes, comparisons, _) = load_comparisons_from_cache(config)
+        store = open_comparison_store(config, index=index)
+        comparisons = store.comparisons()
 
-    if new_logfiles:
-        file_hashes, _ = random_uncompared_logfiles(index, config, file_hashes)
+        if new_logfiles:
+            file_hashes, _ = random_uncompared_logfiles(
+                index, config, comparisons.keys()
+            )
+        else:
+            file_hashes = [result["hash"] for result in store.worst()]
 
-    sql_servers_list = get_sql_servers_list(config)
+        sql_servers_list = get_sql_servers_list(config)
 
-    with multi_mosaiq_connect(sql_servers_list) as cursors:
-        for file_hash in file_hashes:
+        with store, multi_mosaiq_connect(sql_servers_list) as cursors:
+            for file_hash in file_hashes:
 
-            try:
-                logfile_filepath = get_filepath(index, config, file_hash)
-                print("\n{}".format(logfile_filepath))
+                try:
+                    logfile_filepath = get_filepath(index, config, file_hash)
+                    print("\n{}".format(logfile_filepath))
 
-                if (new_logfiles) and (file_hash in comparisons):
-                    raise AssertionError(
-                        "A new logfile shouldn't have already been compared"
-                    )
+                    if (new_logfiles) and (file_hash in comparisons):
+                        raise AssertionError(
+                            "A new logfile shouldn't have already been compared"
+                        )
 
-                if index[file_hash]["delivery_details"]["qa_mode"]:
-                    print("Skipping QA field")
-                else:
-                    if file_hash in comparisons:
-                        print(
-                            "Cached comparison value = {}".format(
-                                comparisons[file_hash]
+                    if index[file_hash]["delivery_details"]["qa_mode"]:
+                        print("Skipping QA field")
+                    else:
+                        if file_hash in comparisons:
+                            print(
+                                "Cached comparison value = {}".format(
+                                    comparisons[file_hash]
+                                )
                             )
-                        )
 
-                    results = get_logfile_mosaiq_results(
-                        index,
-                        config,
-                        logfile_filepath,
-                        field_id_key_map,
-                        file_hash,
-                        cursors,
-                        grid_resolution=grid_resolution,
-                    )
-                    new_comparison = calc_comparison(results[2], results[3])
-
-                    if file_hash not in comparisons:
-                        update_comparison_file(
+                        start_time = time.perf_counter()
+                        results = get_logfile_mosaiq_results(
+                            index,
+                            config,
+                            logfile_filepath,
+                            field_id_key_map,
                             file_hash,
-                            new_comparison,
-                            comparison_storage_filepath,
-                            comparison_storage_scratch,
+                            cursors,
+                            grid_resolution=grid_resolution,
+                            workers=workers,
                         )
-                        print(
-                            "Newly calculated comparison value = {}".format(
-                                new_comparison
+                        new_comparison = calc_comparison(results[2], results[3])
+                        computation_time = time.perf_counter() - start_time
+
+                        if file_hash not in comparisons:
+                            record_comparison(
+                                store,
+                                index,
+                                file_hash,
+                                new_comparison,
+                                grid_resolution,
+                                computation_time,
                             )
-                        )
-                    elif np.abs(comparisons[file_hash] - new_comparison) > 0.00001:
-                        print(
-                            "Calced comparison value does not agree with the "
-                            "cached value."
-                        )
-                        print(
-                            "Newly calculated comparison value = {}".format(
-                                new_comparison
+                            print(
+                                "Newly calculated comparison value = {}".format(
+                                    new_comparison
+                                )
                             )
-                        )
-                        update_comparison_file(
-                            file_hash,
-                            new_comparison,
-                            comparison_storage_filepath,
-                            comparison_storage_scratch,
-                        )
-                        print("Overwrote the cache with the new result.")
-                    else:
-                        print("Calced comparison value agrees with the cached value")
-                    if plot:
-                        plot_results(*results)
-            except KeyboardInterrupt:
-                raise
-            except AssertionError:
-                raise
-            except Exception:
-                print(traceback.format_exc())
-
-
-def mu_density_from_delivery_data(delivery_data, grid_resolution=1):
+                        elif np.abs(comparisons[file_hash] - new_comparison) > 0.00001:
+                            print(
+                                "Calced comparison value does not agree with the "
+                                "cached value."
+                            )
+                            print(
+                                "Newly calculated comparison value = {}".format(
+                                    new_comparison
+                                )
+                            )
+                            record_comparison(
+                                store,
+                                index,
+                                file_hash,
+                                new_comparison,
+                                grid_resolution,
+                                computation_time,
+                            )
+                            print("Recorded the new result within the cache.")
+                        else:
+                            print(
+                                "Calced comparison value agrees with the cached value"
+                            )
+                        if plot:
+                            plot_results(*results)
+                except KeyboardInterrupt:
+                    raise
+                except AssertionError:
+                    raise
+                except Exception:
+                    print(traceback.format_exc())
+
+
+def mu_density_from_delivery_data(delivery_data, grid_resolution=1, workers=1):
     mu, mlc, jaw = (delivery_data.monitor_units, delivery_data.mlc, delivery_data.jaw)
 
-    grid_xx, grid_yy, mu_density = calc_mu_density(
-        mu, mlc, jaw, grid_resolution=grid_resolution
+    grid_xx, grid_yy, mu_density = calc_mu_density_return_grid(
+        mu, mlc, jaw, grid_resolution=grid_resolution, workers=workers
     )
 
     return grid_xx, grid_yy, mu_density
@@ -258,12 +266,29 @@ def find_consecutive_logfiles(field_id_key_map, field_id, filehash, index, confi
     return within_4_hours
 
 
-def calc_and_merge_logfile_mudensity(filepaths, grid_resolution=1):
+def calc_and_merge_logfile_mudensity(
+    filepaths, grid_resolution=1, workers=1, cache_directory=None
+):
+    if cache_directory is None:
+        logfile_deliveries = [
+            DeliveryDatabases.from_logfile(filepath) for filepath in filepaths
+        ]
+    else:
+        logfile_deliveries = [
+            cached_delivery_from_logfile(filepath, cache_directory)
+            for filepath in filepaths
+        ]
+
+    return merge_logfile_mudensities(
+        logfile_deliveries, grid_resolution=grid_resolution, workers=workers
+    )
+
+
+def merge_logfile_mudensities(logfile_deliveries, grid_resolution=1, workers=1):
     logfile_results = []
-    for filepath in filepaths:
-        logfile_delivery_data = DeliveryDatabases.from_logfile(filepath)
+    for logfile_delivery_data in logfile_deliveries:
         mu_density_results = mu_density_from_delivery_data(
-            logfile_delivery_data, grid_resolution=grid_resolution
+            logfile_delivery_data, grid_resolution=grid_resolution, workers=workers
         )
 
         logfile_results.append(mu_density_results)
@@ -285,7 +310,14 @@ def calc_and_merge_logfile_mudensity(filepaths, grid_resolution=1):
 
 
 def get_logfile_mosaiq_results(
-    index, config, filepath, field_id_key_map, filehash, cursors, grid_resolution=1
+    index,
+    config,
+    filepath,
+    field_id_key_map,
+    filehash,
+    cursors,
+    grid_resolution=1,
+    workers=1,
 ):
     file_info = index[filehash]
     delivery_details = file_info["delivery_details"]
@@ -296,17 +328,19 @@ def get_logfile_mosaiq_results(
     mosaiq_delivery_data = multi_fetch_and_verify_mosaiq(cursors[server], field_id)
 
     mosaiq_results = mu_density_from_delivery_data(
-        mosaiq_delivery_data, grid_resolution=grid_resolution
+        mosaiq_delivery_data, grid_resolution=grid_resolution, workers=workers
     )
 
     consecutive_keys = find_consecutive_logfiles(
         field_id_key_map, field_id, filehash, index, config
     )
 
-    logfilepaths = [get_filepath(index, config, key) for key in consecutive_keys]
+    logfile_deliveries = [
+        delivery_from_index(index, config, key) for key in consecutive_keys
+    ]
 
-    logile_results = calc_and_merge_logfile_mudensity(
-        logfilepaths, grid_resolution=grid_resolution
+    logile_results = merge_logfile_mudensities(
+        logfile_deliveries, grid_resolution=grid_resolution, workers=workers
     )
 
     try:
@@ -417,15 +451,16 @@ def plot_results(
     plt.show()
 
 
-def update_comparison_file(
-    file_hash, comparison, comparison_storage_filepath, comparison_storage_scratch
+def record_comparison(
+    store, index, file_hash, comparison, grid_resolution, computation_time
 ):
-    with open(comparison_storage_filepath, "r") as comparisons_file:
-        comparison_storage = json.load(comparisons_file)
-
-    comparison_storage[file_hash] = comparison
-
-    with open(comparison_storage_scratch, "w") as comparisons_file:
-        json.dump(comparison_storage, comparisons_file)
-
-    os.replace(comparison_storage_scratch, comparison_storage_filepath)
+    machine, local_time = get_machine_and_local_time(index[file_hash])
+
+    store.add(
+        file_hash,
+        comparison,
+        grid_resolution=grid_resolution,
+        computation_time=computation_time,
+        machine=machine,
+        local_time=local_time,
+    )
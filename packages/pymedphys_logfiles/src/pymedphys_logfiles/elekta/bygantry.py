@@ -26,15 +26,18 @@
 
 import numpy as np
 
-from pymedphys_utilities.utilities import get_filepath, get_gantry_tolerance
+from pymedphys_utilities.utilities import get_gantry_tolerance
 
 from pymedphys_mudensity.mudensity import get_grid
 
 
-from pymedphys_databases.msq import multi_fetch_and_verify_mosaiq
-from pymedphys_databases.delivery import DeliveryDatabases
+from pymedphys_databases.msq import (
+    delivery_data_from_mosaiq_bulk,
+    multi_fetch_and_verify_mosaiq,
+)
 
 from .analyse import calc_comparison, plot_results
+from .cache import delivery_from_index
 
 
 def get_mappings(index, file_hashes):
@@ -128,8 +131,7 @@ def calc_logfile_mu_density_bygantry(
     logfile_mu_density = None
 
     for filehash in logfile_group:
-        filepath = get_filepath(index, config, filehash)
-        logfile_delivery_data = DeliveryDatabases.from_logfile(filepath)
+        logfile_delivery_data = delivery_from_index(index, config, filehash)
 
         a_logfile_mu_density = [
             get_grid(grid_resolution=grid_resolution),
@@ -195,8 +197,7 @@ def get_logfile_delivery_data_bygantry(
         logfile_delivery_data_bygantry[logfile_group] = dict()
 
         for file_hash in logfile_group:
-            filepath = get_filepath(index, config, file_hash)
-            logfile_delivery_data = DeliveryDatabases.from_logfile(filepath)
+            logfile_delivery_data = delivery_from_index(index, config, file_hash)
             mu = np.array(logfile_delivery_data.monitor_units)
 
             filtered = logfile_delivery_data.filter_cps()
@@ -382,7 +383,9 @@ def get_comparison_results(
     return comparison_results
 
 
-def get_mu_densities_for_file_hashes(index, config, cursor, file_hashes):
+def get_mu_densities_for_file_hashes(
+    index, config, cursor, file_hashes, mosaiq_delivery_data=None
+):
     field_ids = {
         index[file_hash]["delivery_details"]["field_id"] for file_hash in file_hashes
     }
@@ -393,7 +396,9 @@ def get_mu_densities_for_file_hashes(index, config, cursor, file_hashes):
     logfile_groups = group_consecutive_logfiles(file_hashes, index)
     logfile_groups = [tuple(group) for group in logfile_groups]
 
-    mosaiq_delivery_data = multi_fetch_and_verify_mosaiq(cursor, field_id)
+    if mosaiq_delivery_data is None:
+        mosaiq_delivery_data = multi_fetch_and_verify_mosaiq(cursor, field_id)
+
     mosaiq_gantry_angles = np.unique(mosaiq_delivery_data.gantry)
 
     logfile_delivery_data_bygantry = get_logfile_delivery_data_bygantry(
@@ -415,10 +420,12 @@ def get_mu_densities_for_file_hashes(index, config, cursor, file_hashes):
 
 
 def get_mu_densities_for_field_id(
-    index, config, cursor, field_id, field_id_grouped_hashes
+    index, config, cursor, field_id, field_id_grouped_hashes, mosaiq_delivery_data=None
 ):
     file_hashes = np.array(field_id_grouped_hashes[field_id])
-    mu_densities = get_mu_densities_for_file_hashes(index, config, cursor, file_hashes)
+    mu_densities = get_mu_densities_for_file_hashes(
+        index, config, cursor, file_hashes, mosaiq_delivery_data=mosaiq_delivery_data
+    )
 
     return mu_densities
 
@@ -426,9 +433,16 @@ def get_mu_densities_for_field_id(
 def get_comparisons_byfield(index, config, cursor, field_ids, field_id_grouped_hashes):
     comparisons_byfield = dict()
 
+    mosaiq_deliveries = delivery_data_from_mosaiq_bulk(cursor, field_ids)
+
     for field_id in field_ids:
         mu_densities = get_mu_densities_for_field_id(
-            index, config, cursor, field_id, field_id_grouped_hashes
+            index,
+            config,
+            cursor,
+            field_id,
+            field_id_grouped_hashes,
+            mosaiq_delivery_data=mosaiq_deliveries.get(field_id),
         )
         comparison_results = get_comparison_results(*mu_densities)
 
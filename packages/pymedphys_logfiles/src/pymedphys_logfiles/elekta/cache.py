@@ -0,0 +1,193 @@
+# Copyright (C) 2018 Cancer Care Associates
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+"""An on disk cache of the delivery data decoded from logfiles.
+
+Cached deliveries are stored as uncompressed ``.npz`` files named after the
+SHA1 hash of the logfile they were decoded from. The hash is the same one
+used as the key of the logfile index, so the cache remains valid no matter
+where the logfile is moved to. The least recently used entries are removed
+once the total cache size exceeds its cap.
+"""
+
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+from pymedphys_utilities.filehash import hash_file
+from pymedphys_utilities.utilities import get_data_directory, get_filepath
+from pymedphys_databases.delivery import DeliveryDatabases
+
+DEFAULT_CACHE_DIRECTORY = os.path.join("cache", "delivery")
+DEFAULT_MAX_CACHE_SIZE_MB = 2048
+
+DELIVERY_FIELDS = ("monitor_units", "gantry", "collimator", "mlc", "jaw")
+
+
+def get_delivery_cache_parameters(config):
+    cache_config = config.get("delivery_cache", {})
+
+    cache_directory = os.path.join(
+        get_data_directory(config),
+        cache_config.get("directory", DEFAULT_CACHE_DIRECTORY),
+    )
+    max_cache_size = int(
+        cache_config.get("max_size_mb", DEFAULT_MAX_CACHE_SIZE_MB) * 1024 ** 2
+    )
+
+    return cache_directory, max_cache_size
+
+
+def delivery_from_index(index, config, filehash):
+    """Load the delivery of an indexed logfile, using the delivery cache
+    configured within ``config``.
+    """
+    filepath = get_filepath(index, config, filehash)
+    cache_directory, max_cache_size = get_delivery_cache_parameters(config)
+
+    return cached_delivery_from_logfile(
+        filepath, cache_directory, filehash=filehash, max_cache_size=max_cache_size
+    )
+
+
+def cached_delivery_from_logfile(
+    filepath,
+    cache_directory,
+    filehash=None,
+    max_cache_size=DEFAULT_MAX_CACHE_SIZE_MB * 1024 ** 2,
+):
+    """Load the delivery data of a logfile, decoding it only if it has not
+    already been cached.
+
+    Parameters
+    ----------
+    filepath : str
+        The path to the ``.trf`` logfile.
+    cache_directory : str
+        The directory the decoded deliveries are stored within. It is created
+        if it does not exist.
+    filehash : str, optional
+        The SHA1 hash of the logfile as given by
+        ``pymedphys_utilities.filehash.hash_file``. If not provided it is
+        calculated.
+    max_cache_size : int, optional
+        The maximum total size of the cache in bytes. Once exceeded, the
+        least recently used deliveries are removed.
+
+    Returns
+    -------
+    delivery : DeliveryDatabases
+    """
+    if filehash is None:
+        filehash = hash_file(filepath)
+
+    cache_filepath = os.path.join(cache_directory, "{}.npz".format(filehash))
+
+    try:
+        delivery = load_cached_delivery(cache_filepath)
+    except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+        delivery = None
+
+    if delivery is not None:
+        # Another thread may have evicted the entry since it was loaded
+        try:
+            os.utime(cache_filepath)
+        except FileNotFoundError:
+            pass
+
+        return delivery
+
+    delivery = DeliveryDatabases.from_logfile(filepath)
+
+    os.makedirs(cache_directory, exist_ok=True)
+    save_cached_delivery(cache_filepath, delivery)
+    evict_least_recently_used(cache_directory, max_cache_size, keep=cache_filepath)
+
+    return delivery
+
+
+def load_cached_delivery(cache_filepath):
+    with np.load(cache_filepath, allow_pickle=False) as cached:
+        arrays = [cached[field] for field in DELIVERY_FIELDS]
+
+    return DeliveryDatabases(*arrays)
+
+
+def save_cached_delivery(cache_filepath, delivery):
+    """Atomically write a delivery to the cache so that a concurrent reader
+    never sees a partially written file.
+    """
+    arrays = {
+        field: np.asarray(getattr(delivery, field), dtype=float)
+        for field in DELIVERY_FIELDS
+    }
+
+    file_descriptor, temp_filepath = tempfile.mkstemp(
+        suffix=".npz.tmp", dir=os.path.dirname(cache_filepath)
+    )
+    try:
+        with os.fdopen(file_descriptor, "wb") as temp_file:
+            np.savez(temp_file, **arrays)
+        os.replace(temp_filepath, cache_filepath)
+    except BaseException:
+        os.remove(temp_filepath)
+        raise
+
+
+def evict_least_recently_used(cache_directory, max_cache_size, keep=None):
+    """Remove the least recently used cached deliveries until the total size
+    of the cache is no larger than ``max_cache_size`` bytes.
+
+    Each cache hit updates the modification time of its file, so the
+    modification time records when each entry was last used.
+    """
+    entries = []
+    for entry in os.scandir(cache_directory):
+        if entry.is_file() and entry.name.endswith(".npz"):
+            # Entries can be removed by a concurrent eviction at any time
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+
+            entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+    total_size = sum(size for _, size, _ in entries)
+
+    for _, size, path in sorted(entries):
+        if total_size <= max_cache_size:
+            break
+
+        if keep is not None and os.path.abspath(path) == os.path.abspath(keep):
+            continue
+
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+        total_size -= size
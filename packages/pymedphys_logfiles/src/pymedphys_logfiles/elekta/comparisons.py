@@ -0,0 +1,296 @@
+# Copyright (C) 2018 Cancer Care Associates
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+
+"""An append-only store of MU density comparison results.
+"""
+
+import datetime
+import json
+import os
+import sqlite3
+
+from pymedphys_utilities.utilities import get_comparison_store_filepaths
+
+from .._version import __version__
+
+COMPARISON_FIELDS = (
+    "hash",
+    "comparison",
+    "grid_resolution",
+    "code_version",
+    "computation_time",
+    "machine",
+    "local_time",
+    "recorded_at",
+)
+
+
+class ComparisonStore:
+    """MU density comparison results stored within an SQLite database.
+
+    Every result is appended as a new row, so recording a result costs the
+    same however many results are already stored. The most recent result
+    for each logfile hash is the current one, with earlier results kept as
+    its history. The comparison value, machine and local time are indexed
+    so that ``worst`` can be answered without reading every result.
+
+    Args:
+        filepath: The path of the SQLite database. It is created if it
+            doesn't exist.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+
+        self._connection = sqlite3.connect(filepath)
+        with self._connection:
+            self._connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS comparisons (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    hash TEXT NOT NULL,
+                    comparison REAL,
+                    grid_resolution REAL,
+                    code_version TEXT,
+                    computation_time REAL,
+                    machine TEXT,
+                    local_time TEXT,
+                    recorded_at TEXT
+                );
+                CREATE INDEX IF NOT EXISTS comparisons_hash
+                    ON comparisons (hash, id);
+                CREATE INDEX IF NOT EXISTS comparisons_comparison
+                    ON comparisons (comparison);
+                CREATE INDEX IF NOT EXISTS comparisons_machine
+                    ON comparisons (machine, local_time);
+                CREATE INDEX IF NOT EXISTS comparisons_local_time
+                    ON comparisons (local_time);
+                CREATE VIEW IF NOT EXISTS latest_comparisons AS
+                    SELECT * FROM comparisons WHERE id IN (
+                        SELECT MAX(id) FROM comparisons GROUP BY hash
+                    );
+                """
+            )
+
+    def add(
+        self,
+        filehash,
+        comparison,
+        grid_resolution=None,
+        computation_time=None,
+        machine=None,
+        local_time=None,
+        code_version=__version__,
+        commit=True,
+    ):
+        """Append a comparison result.
+
+        Args:
+            filehash: The hash of the logfile that was compared.
+            comparison: The comparison value.
+            grid_resolution: The MU density grid resolution used.
+            computation_time: The number of seconds the comparison took.
+            machine: The machine the logfile was delivered on.
+            local_time: The local time of the delivery.
+            code_version: The version of the code that undertook the
+                comparison.
+            commit: Whether or not to commit the result immediately.
+        """
+        recorded_at = datetime.datetime.now().isoformat(sep=" ", timespec="seconds")
+
+        self._connection.execute(
+            "INSERT INTO comparisons ({}) VALUES ({})".format(
+                ", ".join(COMPARISON_FIELDS), ", ".join("?" * len(COMPARISON_FIELDS))
+            ),
+            (
+                filehash,
+                float(comparison),
+                grid_resolution,
+                code_version,
+                computation_time,
+                machine,
+                local_time,
+                recorded_at,
+            ),
+        )
+
+        if commit:
+            self.commit()
+
+    def latest(self, filehash):
+        """The most recent result for a logfile hash as a dictionary, or
+        ``None`` if it has never been compared.
+        """
+        rows = self._query(
+            "SELECT {} FROM comparisons WHERE hash = ? ORDER BY id DESC LIMIT 1",
+            (filehash,),
+        )
+
+        if not rows:
+            return None
+
+        return rows[0]
+
+    def history(self, filehash):
+        """Every result recorded for a logfile hash, oldest first."""
+        return self._query(
+            "SELECT {} FROM comparisons WHERE hash = ? ORDER BY id", (filehash,)
+        )
+
+    def worst(self, number=None, machine=None, start_date=None, end_date=None):
+        """The current results with the largest comparison values.
+
+        Args:
+            number: The maximum number of results to return. Defaults to
+                all of them.
+            machine: Only include deliveries on this machine.
+            start_date: Only include deliveries on or after this date.
+            end_date: Only include deliveries on or before this date.
+
+        Returns:
+            A list of result dictionaries, worst first.
+        """
+        conditions = []
+        parameters = []
+
+        if machine is not None:
+            conditions.append("machine = ?")
+            parameters.append(str(machine))
+        if start_date is not None:
+            conditions.append("local_time >= ?")
+            parameters.append(str(start_date))
+        if end_date is not None:
+            # Dates compare as a prefix of the local time string
+            conditions.append("local_time < ?")
+            parameters.append(str(end_date) + "~")
+
+        query = "SELECT {} FROM latest_comparisons"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY comparison DESC"
+
+        if number is not None:
+            query += " LIMIT ?"
+            parameters.append(int(number))
+
+        return self._query(query, parameters)
+
+    def comparisons(self):
+        """A dictionary mapping each logfile hash to its current comparison
+        value.
+        """
+        return dict(
+            self._connection.execute("SELECT hash, comparison FROM latest_comparisons")
+        )
+
+    def _query(self, query, parameters=()):
+        cursor = self._connection.execute(
+            query.format(", ".join(COMPARISON_FIELDS)), parameters
+        )
+
+        return [dict(zip(COMPARISON_FIELDS, row)) for row in cursor]
+
+    def __contains__(self, filehash):
+        cursor = self._connection.execute(
+            "SELECT 1 FROM comparisons WHERE hash = ? LIMIT 1", (filehash,)
+        )
+
+        return cursor.fetchone() is not None
+
+    def __len__(self):
+        return self._connection.execute(
+            "SELECT COUNT(DISTINCT hash) FROM comparisons"
+        ).fetchone()[0]
+
+    def commit(self):
+        self._connection.commit()
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.commit()
+        self.close()
+
+
+def open_comparison_store(config, index=None):
+    """Open the comparison store of a logfile data directory.
+
+    The first time the store is opened, results within the previous json
+    comparisons cache are migrated across. If an index is provided the
+    machine and delivery time of each migrated result is recorded too. The
+    migration is undertaken within a temporary file that only replaces the
+    store once complete, so that an interrupted migration is retried the
+    next time the store is opened.
+    """
+    store_filepath, json_filepath = get_comparison_store_filepaths(config)
+
+    needs_migration = not os.path.exists(store_filepath) and os.path.exists(
+        json_filepath
+    )
+
+    if needs_migration:
+        temp_filepath = "{}.migrating".format(store_filepath)
+        if os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
+
+        temp_store = ComparisonStore(temp_filepath)
+        try:
+            migrate_json_comparisons(json_filepath, temp_store, index=index)
+        finally:
+            temp_store.close()
+
+        os.replace(temp_filepath, store_filepath)
+
+    return ComparisonStore(store_filepath)
+
+
+def migrate_json_comparisons(json_filepath, store, index=None):
+    with open(json_filepath, "r") as comparisons_file:
+        json_comparisons = json.load(comparisons_file)
+
+    for filehash, comparison in json_comparisons.items():
+        machine, local_time = None, None
+        if index is not None and filehash in index:
+            machine, local_time = get_machine_and_local_time(index[filehash])
+
+        store.add(
+            filehash,
+            comparison,
+            machine=machine,
+            local_time=local_time,
+            code_version=None,
+            commit=False,
+        )
+
+    store.commit()
+
+
+def get_machine_and_local_time(index_entry):
+    return index_entry["logfile_header"]["machine"], index_entry["local_time"]
@@ -24,33 +24,56 @@
 # program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
 
 
+import hashlib
 import os
 import pathlib
 import shutil
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from glob import glob
 
+from pymedphys_utilities.filehash import FileHashCache
+from pymedphys_utilities.utilities import open_logfile_index
 
-def fetch_system_diagnostics(ip, storage_directory, other_directory=None):
+from .index import HASH_CACHE_FILENAME
+
+BACKUP_SHARE_PATH_TEMPLATE = "\\\\{}\\Backup\\TCS\\"
+DEFAULT_WORKERS_PER_HOST = 2
+BLOCKSIZE = 2 ** 20
+
+
+def fetch_system_diagnostics(
+    ip,
+    storage_directory,
+    other_directory=None,
+    workers=DEFAULT_WORKERS_PER_HOST,
+    share_path_template=BACKUP_SHARE_PATH_TEMPLATE,
+):
     r"""Fetches and stores locally Linac system diagnositc files.
 
     For an Elekta Linac the system diagnostic backups are stored at
-    \\IP\Backup\TCS\SDD+*.zip. These are copied to a defined local directory.
+    \\IP\Backup\TCS\SDD+*.zip. These are copied to a defined local directory,
+    at most ``workers`` at a time.
 
     Need to have logged in to this directory and ticked "remember credentials".
     You will need to use a login for the Linac NSS supplied by an Elekta
     engineer to access this file share.
     """
 
-    backup_share_path = "\\\\{}\\Backup\\TCS\\".format(ip)
-    diagnostic_file_search = "{}\\SDD+*.zip".format(backup_share_path)
+    backup_share_path = share_path_template.format(ip)
+    diagnostic_file_search = os.path.join(backup_share_path, "SDD+*.zip")
     diagnostic_filepaths = glob(diagnostic_file_search)
 
-    print("Found {} diagnostic zip files:".format(len(diagnostic_filepaths)))
+    print(
+        "Found {} diagnostic zip files at {}".format(
+            len(diagnostic_filepaths), backup_share_path
+        )
+    )
 
     if other_directory is None:
         other_directory = storage_directory
 
+    to_be_copied = []
     for nss_filepath in diagnostic_filepaths:
         basename = os.path.basename(nss_filepath)
         storage_filepath = os.path.join(storage_directory, basename)
@@ -61,10 +84,25 @@ def fetch_system_diagnostics(ip, storage_directory, other_directory=None):
         ) and not os.path.exists(other_filepath)
 
         if doesnt_exist_in_either_directory:
-            print("    Copying {}...".format(basename))
-            shutil.copyfile(nss_filepath, storage_filepath)
-        else:
-            print("    {} has already been copied.".format(basename))
+            to_be_copied.append((nss_filepath, storage_filepath))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda paths: copy_file_atomically(*paths), to_be_copied))
+
+    return [storage_filepath for _, storage_filepath in to_be_copied]
+
+
+def copy_file_atomically(source, destination):
+    """Copy a file so that it only appears at the destination once complete.
+
+    An interrupted copy therefore never leaves a partial zip behind to be
+    mistaken for one that has already been fetched.
+    """
+    print("    Copying {}...".format(os.path.basename(source)))
+
+    partial_destination = destination + ".partial"
+    shutil.copyfile(source, partial_destination)
+    os.replace(partial_destination, destination)
 
 
 def fetch_system_diagnostics_multi_linac(
@@ -72,10 +110,15 @@ def fetch_system_diagnostics_multi_linac(
     storage_directory,
     to_be_indexed="to_be_indexed",
     already_indexed="already_indexed",
+    workers_per_host=DEFAULT_WORKERS_PER_HOST,
+    share_path_template=BACKUP_SHARE_PATH_TEMPLATE,
 ):
     """Run `fetch_system_diagnostics` for a set of machines and corresponding
     IPs.
 
+    All machines are fetched from concurrently, with no more than
+    ``workers_per_host`` copies running against any one machine at a time.
+
     Won't redownload the diagnostic files if that diagnostics zip filename
     exists in either to_be_indexed or already_indexed.
 
@@ -92,8 +135,9 @@ def fetch_system_diagnostics_multi_linac(
     fetch_system_diagnostics_multi_linac(machine_ip_map, storage_directory)
     """
 
-    for machine, ip in machine_ip_map.items():
-        print("\nFetching diagnostic zip files from {} @ {}".format(machine, ip))
+    def fetch_machine(machine_and_ip):
+        machine, ip = machine_and_ip
+        print("Fetching diagnostic zip files from {} @ {}".format(machine, ip))
         machine_storage_directory = os.path.join(
             storage_directory, to_be_indexed, machine
         )
@@ -103,12 +147,27 @@ def fetch_system_diagnostics_multi_linac(
 
         pathlib.Path(machine_storage_directory).mkdir(parents=True, exist_ok=True)
 
-        fetch_system_diagnostics(
-            ip, machine_storage_directory, already_indexed_directory
+        return fetch_system_diagnostics(
+            ip,
+            machine_storage_directory,
+            already_indexed_directory,
+            workers=workers_per_host,
+            share_path_template=share_path_template,
         )
 
+    machines_and_ips = list(machine_ip_map.items())
+    if not machines_and_ips:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=len(machines_and_ips)) as executor:
+        copied = list(executor.map(fetch_machine, machines_and_ips))
+
     print("")
 
+    return {
+        machine: filepaths for (machine, _), filepaths in zip(machines_and_ips, copied)
+    }
+
 
 def already_indexed_path(current_location, to_be_indexed, already_indexed):
     machine_and_zip_filepath = os.path.relpath(current_location, to_be_indexed)
@@ -118,7 +177,15 @@ def already_indexed_path(current_location, to_be_indexed, already_indexed):
     return os.path.abspath(path_to_be_moved_to)
 
 
-def extract_diagnostic_zips_and_archive(logfile_data_directory):
+def extract_diagnostic_zips_and_archive(logfile_data_directory, index_backend=None):
+    """Extract the trf logfiles from the fetched diagnostics zips.
+
+    Each ``.trf`` member is read and hashed straight from its zip. Members
+    whose contents are already within the logfile index, or which have
+    already been extracted, are skipped without being written to disk. The
+    hash of each extracted logfile is recorded within the file hash cache so
+    that ``index_logfiles`` doesn't need to hash it again.
+    """
     diagnostics_directory = os.path.join(logfile_data_directory, "diagnostics")
     diagnostics_to_be_indexed = os.path.join(diagnostics_directory, "to_be_indexed")
     diagnostics_already_indexed = os.path.join(diagnostics_directory, "already_indexed")
@@ -135,20 +202,84 @@ def extract_diagnostic_zips_and_archive(logfile_data_directory):
         )
     )
 
-    for diagnostic_filepath in diagnostics_filepaths:
-        path_to_be_moved_to = already_indexed_path(
-            diagnostic_filepath, diagnostics_to_be_indexed, diagnostics_already_indexed
-        )
+    hash_cache_filepath = os.path.join(logfile_data_directory, HASH_CACHE_FILENAME)
 
-        pathlib.Path(os.path.dirname(path_to_be_moved_to)).mkdir(
-            parents=True, exist_ok=True
-        )
+    with open_logfile_index(
+        logfile_data_directory, backend=index_backend
+    ) as index, FileHashCache(hash_cache_filepath) as hash_cache:
+        extracted_hashes = set()
+
+        for diagnostic_filepath in diagnostics_filepaths:
+            path_to_be_moved_to = already_indexed_path(
+                diagnostic_filepath,
+                diagnostics_to_be_indexed,
+                diagnostics_already_indexed,
+            )
+
+            pathlib.Path(os.path.dirname(path_to_be_moved_to)).mkdir(
+                parents=True, exist_ok=True
+            )
+
+            print("    Extracting {}".format(diagnostic_filepath))
+
+            number_skipped = 0
+            with zipfile.ZipFile(diagnostic_filepath, "r") as zip_file:
+                for member in zip_file.infolist():
+                    if not member.filename.endswith(".trf"):
+                        continue
+
+                    filehash, contents = read_and_hash_member(zip_file, member)
+                    if filehash in extracted_hashes or filehash in index:
+                        number_skipped += 1
+                        continue
+
+                    extracted_filepath = write_member(
+                        contents, member, logfiles_to_be_indexed
+                    )
+                    hash_cache.add(extracted_filepath, filehash, commit=False)
+                    extracted_hashes.add(filehash)
+
+            hash_cache.commit()
+
+            if number_skipped:
+                print(
+                    "        Skipped {} logfiles which were already "
+                    "extracted or indexed".format(number_skipped)
+                )
+
+            shutil.move(diagnostic_filepath, path_to_be_moved_to)
+
+
+def read_and_hash_member(zip_file, member):
+    hasher = hashlib.sha1()
+    blocks = []
+
+    with zip_file.open(member) as member_file:
+        block = member_file.read(BLOCKSIZE)
+        while block:
+            hasher.update(block)
+            blocks.append(block)
+            block = member_file.read(BLOCKSIZE)
+
+    return hasher.hexdigest(), b"".join(blocks)
+
+
+def write_member(contents, member, directory):
+    """Write out a zip member at the path ``ZipFile.extract`` would use."""
+    relative_path = os.path.join(
+        *[
+            part
+            for part in member.filename.replace("\\", "/").split("/")
+            if part not in ("", ".", "..")
+        ]
+    )
+    filepath = os.path.join(directory, relative_path)
 
-        print("    Extracting {}".format(diagnostic_filepath))
+    pathlib.Path(os.path.dirname(filepath)).mkdir(parents=True, exist_ok=True)
 
-        with zipfile.ZipFile(diagnostic_filepath, "r") as zip_file:
-            for file_name in zip_file.namelist():
-                if file_name.endswith(".trf"):
-                    zip_file.extract(file_name, logfiles_to_be_indexed)
+    partial_filepath = filepath + ".partial"
+    with open(partial_filepath, "wb") as extracted_file:
+        extracted_file.write(contents)
+    os.replace(partial_filepath, filepath)
 
-        shutil.move(diagnostic_filepath, path_to_be_moved_to)
+    return filepath
@@ -27,26 +27,38 @@
 """Index logfiles.
 """
 
+import datetime
 import os
-import json
 import pathlib
 import traceback
+from collections import namedtuple, OrderedDict
 from glob import glob
 
 import attr
 
-from pymedphys_utilities.filehash import hash_file
-from pymedphys_utilities.utilities import get_sql_servers, make_a_valid_directory_name
+from pymedphys_utilities.filehash import FileHashCache, hash_file, hash_files
+from pymedphys_utilities.utilities import (
+    get_sql_servers,
+    make_a_valid_directory_name,
+    open_logfile_index,
+)
 from pymedphys_databases.msq import (
     multi_mosaiq_connect,
     get_mosaiq_delivery_details,
+    get_mosaiq_delivery_candidates,
+    match_mosaiq_delivery_details,
     OISDeliveryDetails,
     NoMosaiqEntries,
 )
+from pymedphys_databases.msq.delivery import convert_to_datetime
 from pymedphys_fileformats.trf import Header, decode_header_from_file
 
 from .identify import date_convert
 
+HASH_CACHE_FILENAME = "filehash_cache.sqlite"
+IDENTIFICATION_BUFFER = 240
+DEFAULT_HASH_WORKERS = 8
+
 
 def create_logfile_directory_name(
     centre, delivery_details: OISDeliveryDetails, header: Header, path_string_time
@@ -105,9 +117,23 @@ def create_index_entry(
     return index_entry
 
 
-def file_already_in_index(indexed_filepath, to_be_indexed_filepath, filehash):
+def file_already_in_index(
+    indexed_filepath, to_be_indexed_filepath, filehash, hash_cache=None
+):
+    if not os.path.exists(indexed_filepath) and os.path.exists(to_be_indexed_filepath):
+        # The index entry was committed but the run was interrupted before
+        # the logfile was moved into place.
+        pathlib.Path(os.path.dirname(indexed_filepath)).mkdir(
+            parents=True, exist_ok=True
+        )
+        os.rename(to_be_indexed_filepath, indexed_filepath)
+        if hash_cache is not None:
+            hash_cache.add(indexed_filepath, filehash)
+        print("Completed an interrupted move of an indexed logfile")
+        return
+
     try:
-        new_hash = hash_file(indexed_filepath)
+        new_hash = hash_file(indexed_filepath, cache=hash_cache)
     except FileNotFoundError:
         raise FileNotFoundError(
             "Indexed logfile can't be found in its declared location."
@@ -122,11 +148,13 @@ def file_already_in_index(indexed_filepath, to_be_indexed_filepath, filehash):
     os.remove(to_be_indexed_filepath)
 
 
-def rename_and_handle_fileexists(old_filepath, new_filepath):
+def rename_and_handle_fileexists(old_filepath, new_filepath, hash_cache=None):
     try:
         os.rename(old_filepath, new_filepath)
     except FileExistsError:
-        files_hashes_match = hash_file(old_filepath) == hash_file(new_filepath)
+        files_hashes_match = hash_file(old_filepath, cache=hash_cache) == hash_file(
+            new_filepath, cache=hash_cache
+        )
         print("    File already exists at {}".format(new_filepath))
         if files_hashes_match:
             os.remove(old_filepath)
@@ -134,7 +162,95 @@ def rename_and_handle_fileexists(old_filepath, new_filepath):
             raise FileExistsError("File already exists and the hash does not match")
 
 
-# TODO Split this function up into smaller functions for easier reuse.
+PendingLogfile = namedtuple(
+    "PendingLogfile",
+    [
+        "filehash",
+        "header",
+        "centre",
+        "server",
+        "mosaiq_string_time",
+        "path_string_time",
+    ],
+)
+
+
+def identify_one_at_a_time(cursors, pending_logfiles, buffer=IDENTIFICATION_BUFFER):
+    """Identify each logfile with its own Mosaiq query.
+
+    Returns:
+        A dictionary mapping each logfile hash to either its delivery
+        details or the ``NoMosaiqEntries`` exception raised for it.
+    """
+    identified = {}
+    for pending_logfile in pending_logfiles:
+        header = pending_logfile.header
+        try:
+            identified[pending_logfile.filehash] = get_mosaiq_delivery_details(
+                cursors[pending_logfile.server],
+                header.machine,
+                pending_logfile.mosaiq_string_time,
+                header.field_label,
+                header.field_name,
+                buffer=buffer,
+            )
+        except NoMosaiqEntries as e:
+            identified[pending_logfile.filehash] = e
+
+    return identified
+
+
+def identify_by_machine_day(cursors, pending_logfiles, buffer=IDENTIFICATION_BUFFER):
+    """Identify logfiles with one Mosaiq query per machine per day.
+
+    The logfiles are grouped by the machine and the local day they were
+    delivered on. All treatment records for each group's time window are
+    retrieved at once and each logfile is then matched against them in
+    memory, giving the same results as ``identify_one_at_a_time``.
+
+    Returns:
+        A dictionary mapping each logfile hash to either its delivery
+        details or the ``NoMosaiqEntries`` exception raised for it.
+    """
+    machine_days = OrderedDict()
+    for pending_logfile in pending_logfiles:
+        key = (
+            pending_logfile.server,
+            pending_logfile.header.machine,
+            pending_logfile.mosaiq_string_time[0:10],
+        )
+        machine_days.setdefault(key, []).append(pending_logfile)
+
+    identified = {}
+    for (server, machine, _), logfiles_on_day in machine_days.items():
+        delivery_times = [
+            convert_to_datetime(pending_logfile.mosaiq_string_time)
+            for pending_logfile in logfiles_on_day
+        ]
+
+        candidates = get_mosaiq_delivery_candidates(
+            cursors[server],
+            machine,
+            min(delivery_times) - datetime.timedelta(seconds=buffer),
+            max(delivery_times) + datetime.timedelta(seconds=buffer),
+        )
+
+        for pending_logfile in logfiles_on_day:
+            header = pending_logfile.header
+            try:
+                identified[pending_logfile.filehash] = match_mosaiq_delivery_details(
+                    candidates,
+                    pending_logfile.mosaiq_string_time,
+                    header.field_label,
+                    header.field_name,
+                    buffer=buffer,
+                )
+            except NoMosaiqEntries as e:
+                identified[pending_logfile.filehash] = e
+
+    return identified
+
+
 def file_ready_to_be_indexed(
     cursors,
     filehash_list,
@@ -143,12 +259,16 @@ def file_ready_to_be_indexed(
     no_mosaiq_record_found,
     no_field_label_in_logfile,
     indexed_directory,
-    index_filepath,
     index,
     machine_map,
     centre_details,
     centre_server_map,
+    hash_cache=None,
+    batched_identification=True,
 ):
+    moves_to_be_made = []
+    pending_logfiles = []
+
     for filehash in filehash_list:
         logfile_basename = os.path.basename(to_be_indexed_dict[filehash])
 
@@ -158,7 +278,9 @@ def file_ready_to_be_indexed(
             if header.field_label == "":
                 print("No field label in logfile")
                 new_filepath = os.path.join(no_field_label_in_logfile, logfile_basename)
-                rename_and_handle_fileexists(to_be_indexed_dict[filehash], new_filepath)
+                rename_and_handle_fileexists(
+                    to_be_indexed_dict[filehash], new_filepath, hash_cache=hash_cache
+                )
                 continue
 
             centre = machine_map[header.machine]["centre"]
@@ -170,22 +292,40 @@ def file_ready_to_be_indexed(
         except Exception as e:
             traceback.print_exc()
             new_filepath = os.path.join(unknown_error_in_logfile, logfile_basename)
-            rename_and_handle_fileexists(to_be_indexed_dict[filehash], new_filepath)
+            rename_and_handle_fileexists(
+                to_be_indexed_dict[filehash], new_filepath, hash_cache=hash_cache
+            )
             continue
 
-        try:
-            delivery_details = get_mosaiq_delivery_details(
-                cursors[server],
-                header.machine,
-                mosaiq_string_time,
-                header.field_label,
-                header.field_name,
-                buffer=240,
+        pending_logfiles.append(
+            PendingLogfile(
+                filehash, header, centre, server, mosaiq_string_time, path_string_time
             )
-        except NoMosaiqEntries as e:
-            print(e)
+        )
+
+    if batched_identification:
+        identified = identify_by_machine_day(cursors, pending_logfiles)
+    else:
+        identified = identify_one_at_a_time(cursors, pending_logfiles)
+
+    for pending_logfile in pending_logfiles:
+        (
+            filehash,
+            header,
+            centre,
+            _,
+            mosaiq_string_time,
+            path_string_time,
+        ) = pending_logfile
+        logfile_basename = os.path.basename(to_be_indexed_dict[filehash])
+
+        delivery_details = identified[filehash]
+        if isinstance(delivery_details, NoMosaiqEntries):
+            print(delivery_details)
             new_filepath = os.path.join(no_mosaiq_record_found, logfile_basename)
-            rename_and_handle_fileexists(to_be_indexed_dict[filehash], new_filepath)
+            rename_and_handle_fileexists(
+                to_be_indexed_dict[filehash], new_filepath, hash_cache=hash_cache
+            )
             continue
 
         logfile_directory_name = create_logfile_directory_name(
@@ -208,28 +348,36 @@ def file_ready_to_be_indexed(
             os.path.join(indexed_directory, new_filepath)
         )
 
-        index_extension_split = os.path.splitext(index_filepath)
-        temp_index_path = "{}_temp{}".format(
-            index_extension_split[0], index_extension_split[1]
+        moves_to_be_made.append(
+            (filehash, to_be_indexed_dict[filehash], abs_new_filepath)
         )
 
-        with open(temp_index_path, "w") as json_data_file:
-            json.dump(index, json_data_file, indent=2)
-
-        os.replace(temp_index_path, index_filepath)
+    # The whole batch of entries is committed before any of the logfiles are
+    # moved. Should the moves be interrupted they are completed by
+    # ``file_already_in_index`` on the next run.
+    index.commit()
 
-        os.rename(to_be_indexed_dict[filehash], abs_new_filepath)
+    for filehash, to_be_indexed_filepath, abs_new_filepath in moves_to_be_made:
+        os.rename(to_be_indexed_filepath, abs_new_filepath)
+        if hash_cache is not None:
+            hash_cache.add(abs_new_filepath, filehash)
 
         print(
             "Indexed logfile:\n    {} -->\n    {}".format(
-                to_be_indexed_dict[filehash], abs_new_filepath
+                to_be_indexed_filepath, abs_new_filepath
             )
         )
 
 
-def index_logfiles(centre_map, machine_map, logfile_data_directory):
+def index_logfiles(
+    centre_map,
+    machine_map,
+    logfile_data_directory,
+    index_backend=None,
+    hash_workers=DEFAULT_HASH_WORKERS,
+    batched_identification=True,
+):
     data_directory = logfile_data_directory
-    index_filepath = os.path.abspath(os.path.join(data_directory, "index.json"))
     to_be_indexed_directory = os.path.abspath(
         os.path.join(data_directory, "to_be_indexed")
     )
@@ -256,17 +404,20 @@ def index_logfiles(centre_map, machine_map, logfile_data_directory):
         for _, details in centre_details.items()
     ]
 
-    with open(index_filepath, "r") as json_data_file:
-        index = json.load(json_data_file)
-
-    indexset = set(index.keys())
+    hash_cache_filepath = os.path.join(data_directory, HASH_CACHE_FILENAME)
 
     print("\nConnecting to Mosaiq SQL servers...")
-    with multi_mosaiq_connect(sql_server_and_ports) as cursors:
+    with open_logfile_index(
+        data_directory, backend=index_backend
+    ) as index, FileHashCache(hash_cache_filepath) as hash_cache, multi_mosaiq_connect(
+        sql_server_and_ports
+    ) as cursors:
 
         print("Globbing index directory...")
-        to_be_indexed = glob(
-            os.path.join(to_be_indexed_directory, "**/*.trf"), recursive=True
+        # Sorting keeps logfiles from the same machine and day together so
+        # that each batch needs as few Mosaiq queries as possible.
+        to_be_indexed = sorted(
+            glob(os.path.join(to_be_indexed_directory, "**/*.trf"), recursive=True)
         )
 
         chunk_size = 50
@@ -282,36 +433,41 @@ def index_logfiles(centre_map, machine_map, logfile_data_directory):
                     i + 1, len(to_be_indexed_chunked)
                 )
             )
-            hashlist = [
-                hash_file(filename, dot_feedback=True)
-                for filename in a_to_be_indexed_chunk
-            ]
+            hashlist = hash_files(
+                a_to_be_indexed_chunk,
+                workers=hash_workers,
+                cache=hash_cache,
+                dot_feedback=True,
+            )
 
             print(" ")
 
             to_be_indexed_dict = dict(zip(hashlist, a_to_be_indexed_chunk))
 
             hashset = set(hashlist)
+            already_indexed = {filehash for filehash in hashset if filehash in index}
 
-            for filehash in list(hashset.intersection(indexset)):
+            for filehash in already_indexed:
                 file_already_in_index(
                     os.path.join(indexed_directory, index[filehash]["filepath"]),
                     to_be_indexed_dict[filehash],
                     filehash,
+                    hash_cache=hash_cache,
                 )
 
             file_ready_to_be_indexed(
                 cursors,
-                list(hashset.difference(indexset)),
+                list(hashset.difference(already_indexed)),
                 to_be_indexed_dict,
                 unknown_error_in_logfile,
                 no_mosaiq_record_found,
                 no_field_label_in_logfile,
                 indexed_directory,
-                index_filepath,
                 index,
                 machine_map,
                 centre_details,
                 centre_server_map,
+                hash_cache=hash_cache,
+                batched_identification=batched_identification,
             )
     print("Complete")
@@ -0,0 +1,421 @@
+# Copyright (C) 2018 Cancer Care Associates
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+
+"""A pipelined runner for the nightly logfile to Mosaiq MU density audit.
+"""
+
+import functools
+import time
+import traceback
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+
+import numpy as np
+
+from pymedphys_utilities.utilities import (
+    get_centre,
+    get_index,
+    get_mu_density_parameters,
+    get_sql_servers,
+    get_sql_servers_list,
+)
+from pymedphys_databases.msq import (
+    multi_mosaiq_pool,
+    multi_fetch_and_verify_mosaiq,
+    IsolationLevels,
+)
+
+from .analyse import (
+    calc_comparison,
+    find_consecutive_logfiles,
+    get_field_id_key_map,
+    merge_logfile_mudensities,
+    mu_density_from_delivery_data,
+)
+from .cache import delivery_from_index
+from .comparisons import get_machine_and_local_time, open_comparison_store
+
+DEFAULT_IO_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 16
+
+FETCH = "fetch"
+READ = "read"
+COMPUTE = "compute"
+RECORD = "record"
+STAGES = (FETCH, READ, COMPUTE, RECORD)
+
+
+class AuditMetrics:
+    """Throughput of each stage of the audit pipeline.
+
+    Each stage records how many logfiles it has completed or failed and
+    the total number of seconds spent on them. The throughput of a stage is
+    the number of logfiles it completed per minute of the run.
+    """
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.end_time = None
+        self.completed = {stage: 0 for stage in STAGES}
+        self.failed = {stage: 0 for stage in STAGES}
+        self.busy_seconds = {stage: 0.0 for stage in STAGES}
+
+    def record(self, stage, seconds):
+        self.completed[stage] += 1
+        self.busy_seconds[stage] += seconds
+
+    def record_failure(self, stage):
+        self.failed[stage] += 1
+
+    def finish(self):
+        self.end_time = time.perf_counter()
+
+    @property
+    def elapsed_seconds(self):
+        end_time = self.end_time
+        if end_time is None:
+            end_time = time.perf_counter()
+
+        return end_time - self.start_time
+
+    def files_per_minute(self):
+        elapsed_minutes = self.elapsed_seconds / 60
+
+        return {
+            stage: completed / elapsed_minutes
+            for stage, completed in self.completed.items()
+        }
+
+    def summary(self):
+        files_per_minute = self.files_per_minute()
+
+        lines = ["Audit ran for {:.1f} s".format(self.elapsed_seconds)]
+        for stage in STAGES:
+            completed = self.completed[stage]
+            mean_seconds = self.busy_seconds[stage] / completed if completed else 0
+
+            lines.append(
+                "    {:<8} {:>6} done, {:>4} failed, {:8.2f} files/min, "
+                "{:7.2f} s per file".format(
+                    stage,
+                    completed,
+                    self.failed[stage],
+                    files_per_minute[stage],
+                    mean_seconds,
+                )
+            )
+
+        return "\n".join(lines)
+
+
+def run_audit_pipeline(
+    filehashes,
+    fetch,
+    read,
+    compute,
+    record,
+    io_workers=DEFAULT_IO_WORKERS,
+    compute_workers=None,
+    compute_executor=None,
+    queue_size=DEFAULT_QUEUE_SIZE,
+):
+    """Run each logfile hash through the fetch, read, compute and record
+    stages, with the stages of different logfiles overlapping.
+
+    ``fetch`` and ``read`` are I/O bound and run on a pool of threads.
+    Once both are complete for a logfile their results are passed to
+    ``compute`` on a process pool. Each result is passed to ``record`` on the
+    calling thread as soon as it is available. No more than ``queue_size``
+    logfiles are within the pipeline at any one time.
+
+    A logfile that fails at any stage has its traceback printed and is
+    dropped without stopping the others.
+
+    Args:
+        filehashes: The logfile hashes to be audited.
+        fetch: Called with a hash, returns the Mosaiq delivery.
+        read: Called with a hash, returns the logfile deliveries.
+        compute: Called with the results of ``fetch`` and ``read``. It needs
+            to be picklable to run on a process pool.
+        record: Called with a hash, the result of ``compute``, and the
+            number of seconds ``compute`` took.
+        io_workers: The number of threads for the I/O bound stages.
+        compute_workers: The number of processes for ``compute``. Defaults
+            to the number of CPUs.
+        compute_executor: An executor to use for ``compute`` in place of
+            creating a process pool.
+        queue_size: The maximum number of logfiles within the pipeline.
+
+    Returns:
+        The ``AuditMetrics`` of the run.
+    """
+    metrics = AuditMetrics()
+    filehashes = iter(filehashes)
+
+    futures = {}
+    loaded = {}
+    outstanding = {}
+
+    owns_compute_executor = compute_executor is None
+    if owns_compute_executor:
+        compute_executor = ProcessPoolExecutor(max_workers=compute_workers)
+
+    def admit(filehash):
+        loaded[filehash] = {}
+        outstanding[filehash] = 2
+        futures[io_executor.submit(_timed_call, fetch, filehash)] = (FETCH, filehash)
+        futures[io_executor.submit(_timed_call, read, filehash)] = (READ, filehash)
+
+    def drop(filehash):
+        loaded.pop(filehash, None)
+        outstanding.pop(filehash, None)
+
+    try:
+        with ThreadPoolExecutor(max_workers=io_workers) as io_executor:
+            exhausted = False
+            while True:
+                while not exhausted and len(outstanding) < queue_size:
+                    filehash = next(filehashes, None)
+                    if filehash is None:
+                        exhausted = True
+                    else:
+                        admit(filehash)
+
+                if not futures:
+                    break
+
+                done, _ = wait(list(futures.keys()), return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    stage, filehash = futures.pop(future)
+
+                    try:
+                        value, seconds = future.result()
+                    except Exception:  # pylint: disable=broad-except
+                        print(
+                            "\n{} failed for {}:\n{}".format(
+                                stage, filehash, traceback.format_exc()
+                            )
+                        )
+                        metrics.record_failure(stage)
+                        outstanding[filehash] -= 1
+                        loaded[filehash] = None
+                        if outstanding[filehash] == 0:
+                            drop(filehash)
+                        continue
+
+                    metrics.record(stage, seconds)
+                    outstanding[filehash] -= 1
+
+                    if stage in (FETCH, READ):
+                        if loaded[filehash] is None:
+                            if outstanding[filehash] == 0:
+                                drop(filehash)
+                            continue
+
+                        loaded[filehash][stage] = value
+                        if outstanding[filehash] == 0:
+                            inputs = loaded[filehash]
+                            loaded[filehash] = None
+                            outstanding[filehash] = 1
+                            compute_future = compute_executor.submit(
+                                _timed_call, compute, inputs[FETCH], inputs[READ]
+                            )
+                            futures[compute_future] = (COMPUTE, filehash)
+                    else:
+                        drop(filehash)
+
+                        start_time = time.perf_counter()
+                        try:
+                            record(filehash, value, seconds)
+                        except Exception:  # pylint: disable=broad-except
+                            print(traceback.format_exc())
+                            metrics.record_failure(RECORD)
+                        else:
+                            metrics.record(RECORD, time.perf_counter() - start_time)
+    finally:
+        if owns_compute_executor:
+            compute_executor.shutdown()
+
+    metrics.finish()
+
+    return metrics
+
+
+def _timed_call(function, *args):
+    start_time = time.perf_counter()
+    result = function(*args)
+
+    return result, time.perf_counter() - start_time
+
+
+def compare_mudensities(mosaiq_delivery, logfile_deliveries, grid_resolution=1):
+    """The MU density comparison between a Mosaiq delivery and the logfile
+    deliveries that make it up.
+    """
+    mosaiq_results = mu_density_from_delivery_data(
+        mosaiq_delivery, grid_resolution=grid_resolution
+    )
+    logfile_results = merge_logfile_mudensities(
+        logfile_deliveries, grid_resolution=grid_resolution
+    )
+
+    if not (
+        np.all(logfile_results[0] == mosaiq_results[0])
+        and np.all(logfile_results[1] == mosaiq_results[1])
+    ):
+        raise ValueError("The logfile and Mosaiq MU density grids disagree.")
+
+    return calc_comparison(logfile_results[2], mosaiq_results[2])
+
+
+def mudensity_audit(
+    config,
+    filehashes=None,
+    resume=True,
+    io_workers=DEFAULT_IO_WORKERS,
+    compute_workers=None,
+    compute_executor=None,
+    queue_size=DEFAULT_QUEUE_SIZE,
+    connect=None,
+):
+    """Compare the logfile and Mosaiq MU densities of many logfiles.
+
+    A pipelined equivalent of ``mudensity_comparisons`` for unattended
+    runs. Mosaiq is queried and logfiles are read on threads while the MU
+    densities of earlier logfiles are calculated on a process pool. Each
+    comparison is appended to the comparison store as soon as it completes.
+
+    Args:
+        config: The logfile audit config.
+        filehashes: The logfile hashes to audit. Defaults to all VMAT
+            logfiles not delivered in QA mode, most recent first.
+        resume: Skip logfiles that already have a comparison stored, so
+            that an interrupted run continues from where it stopped.
+        connect: The function used to open each Mosaiq connection, passed
+            on to ``multi_mosaiq_pool``.
+
+    Returns:
+        The ``AuditMetrics`` of the run.
+    """
+    grid_resolution, _ = get_mu_density_parameters(config)
+
+    # Reading the whole index up front leaves plain dictionaries to be
+    # shared with the worker threads.
+    with get_index(config) as index:
+        index_entries = dict(index.items())
+    field_id_key_map = get_field_id_key_map(index_entries)
+    sql_servers = get_sql_servers(config)
+
+    if filehashes is None:
+        filehashes = [
+            filehash
+            for filehash, entry in sorted(
+                index_entries.items(),
+                key=lambda item: item[1]["local_time"],
+                reverse=True,
+            )
+            if entry["delivery_details"]["field_type"] == "VMAT"
+        ]
+
+    filehashes = [
+        filehash
+        for filehash in filehashes
+        if not index_entries[filehash]["delivery_details"]["qa_mode"]
+    ]
+
+    with open_comparison_store(config, index=index_entries) as store:
+        if resume:
+            already_compared = store.comparisons()
+            filehashes = [
+                filehash for filehash in filehashes if filehash not in already_compared
+            ]
+
+        print("Auditing {} logfiles".format(len(filehashes)))
+
+        with multi_mosaiq_pool(
+            get_sql_servers_list(config), size=io_workers, connect=connect
+        ) as pools:
+            isolation_levels = {server: IsolationLevels() for server in pools}
+
+            def fetch(filehash):
+                file_info = index_entries[filehash]
+                server = sql_servers[get_centre(config, file_info)]
+                field_id = file_info["delivery_details"]["field_id"]
+
+                return pools[server].run(
+                    multi_fetch_and_verify_mosaiq,
+                    field_id,
+                    isolation_levels=isolation_levels[server],
+                )
+
+            def read(filehash):
+                field_id = index_entries[filehash]["delivery_details"]["field_id"]
+                consecutive_keys = find_consecutive_logfiles(
+                    field_id_key_map, field_id, filehash, index_entries, config
+                )
+
+                return [
+                    delivery_from_index(index_entries, config, key)
+                    for key in consecutive_keys
+                ]
+
+            def record(filehash, comparison, computation_time):
+                machine, local_time = get_machine_and_local_time(
+                    index_entries[filehash]
+                )
+                store.add(
+                    filehash,
+                    comparison,
+                    grid_resolution=grid_resolution,
+                    computation_time=computation_time,
+                    machine=machine,
+                    local_time=local_time,
+                )
+                print("{}: {}".format(filehash, comparison))
+
+            metrics = run_audit_pipeline(
+                filehashes,
+                fetch,
+                read,
+                functools.partial(compare_mudensities, grid_resolution=grid_resolution),
+                record,
+                io_workers=io_workers,
+                compute_workers=compute_workers,
+                compute_executor=compute_executor,
+                queue_size=queue_size,
+            )
+
+            for server, pool in pools.items():
+                print("{}: {}".format(server, pool.statistics))
+
+    print(metrics.summary())
+
+    return metrics
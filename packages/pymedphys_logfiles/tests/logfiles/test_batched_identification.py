@@ -0,0 +1,191 @@
+# Copyright (C) 2015-2018 Simon Biggs
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+
+"""Test that identifying logfiles one machine-day at a time agrees with
+identifying them one at a time."""
+
+import datetime
+
+import pytest
+
+from pymedphys_databases.msq import MultipleMosaiqEntries
+from pymedphys_databases.msq.delivery import convert_to_datetime
+from pymedphys_fileformats.trf import Header
+from pymedphys_logfiles.elekta.index import (
+    PendingLogfile,
+    identify_by_machine_day,
+    identify_one_at_a_time,
+)
+
+
+class FakeMosaiqCursor:
+    """Answers the identification queries from a list of treatment records
+    with the same semantics as the Mosaiq SQL server."""
+
+    def __init__(self, records):
+        self.records = records
+        self.number_of_queries = 0
+        self._rows = iter([])
+
+    def execute(self, sql_string, parameters):
+        self.number_of_queries += 1
+        records = [
+            record
+            for record in self.records
+            if record["machine"] == parameters["machine"]
+        ]
+
+        if "field_label" in parameters:
+            delivery_time = convert_to_datetime(parameters["delivery_time"])
+            buffer = datetime.timedelta(seconds=parameters["buffer"])
+            rows = [
+                record["details"]
+                for record in records
+                if record["create"] <= delivery_time + buffer
+                and record["edit"] >= delivery_time - buffer
+                and record["label"] == parameters["field_label"]
+                and record["name"] == parameters["field_name"]
+            ]
+        else:
+            start_time = convert_to_datetime(parameters["start_time"])
+            end_time = convert_to_datetime(parameters["end_time"])
+            rows = [
+                record["details"]
+                + (record["label"], record["name"], record["create"], record["edit"])
+                for record in records
+                if record["create"] <= end_time and record["edit"] >= start_time
+            ]
+
+        self._rows = iter(rows)
+
+    def fetchone(self):
+        return next(self._rows, None)
+
+
+def create_record(machine, patient_id, field_id, label, name, start):
+    return {
+        "machine": machine,
+        "label": label,
+        "name": name,
+        "create": start,
+        "edit": start + datetime.timedelta(minutes=2),
+        "details": (patient_id, field_id, "LAST", "First", False, 13, True),
+    }
+
+
+def create_pending_logfile(filehash, machine, label, name, delivery_time):
+    header = Header(machine, "", "", label, name)
+    mosaiq_string_time = delivery_time.strftime("%Y-%m-%d %H:%M:%S")
+
+    return PendingLogfile(filehash, header, "rccc", "msqsql", mosaiq_string_time, "")
+
+
+def create_schedule():
+    records = []
+    pending_logfiles = []
+    for day in range(3):
+        for machine in ["2619", "2694"]:
+            for i in range(20):
+                start = datetime.datetime(2019, 1, 1 + day, 8) + datetime.timedelta(
+                    minutes=15 * i
+                )
+                label = "{}-{}".format(machine, i % 4)
+                patient_id = "{}{}{}".format(day, machine, i)
+                records.append(
+                    create_record(machine, patient_id, 100 + i, label, "Arc", start)
+                )
+                pending_logfiles.append(
+                    create_pending_logfile(
+                        patient_id,
+                        machine,
+                        label,
+                        "Arc",
+                        start + datetime.timedelta(seconds=30 * (i % 7)),
+                    )
+                )
+
+    # A delivery without a Mosaiq record
+    pending_logfiles.append(
+        create_pending_logfile(
+            "unrecorded", "2619", "2619-0", "Arc", datetime.datetime(2019, 1, 1, 23)
+        )
+    )
+
+    # Two disagreeing records within the buffer but only one at the
+    # delivery time itself.
+    start = datetime.datetime(2019, 1, 2, 18)
+    records.append(create_record("2694", "first", 1, "QA", "Arc", start))
+    records.append(
+        create_record(
+            "2694", "second", 2, "QA", "Arc", start + datetime.timedelta(minutes=4)
+        )
+    )
+    pending_logfiles.append(
+        create_pending_logfile(
+            "ambiguous", "2694", "QA", "Arc", start + datetime.timedelta(minutes=1)
+        )
+    )
+
+    return records, pending_logfiles
+
+
+def test_identify_by_machine_day():
+    records, pending_logfiles = create_schedule()
+
+    one_at_a_time_cursor = FakeMosaiqCursor(records)
+    one_at_a_time = identify_one_at_a_time(
+        {"msqsql": one_at_a_time_cursor}, pending_logfiles
+    )
+
+    by_machine_day_cursor = FakeMosaiqCursor(records)
+    by_machine_day = identify_by_machine_day(
+        {"msqsql": by_machine_day_cursor}, pending_logfiles
+    )
+
+    assert one_at_a_time.keys() == by_machine_day.keys()
+    for filehash, delivery_details in one_at_a_time.items():
+        if isinstance(delivery_details, Exception):
+            assert str(by_machine_day[filehash]) == str(delivery_details)
+        else:
+            assert by_machine_day[filehash] == delivery_details
+
+    assert one_at_a_time["ambiguous"].patient_id == "first"
+    assert str(one_at_a_time["unrecorded"]).startswith("No Mosaiq entries")
+
+    # The ambiguous logfile is queried a second time without a buffer
+    assert one_at_a_time_cursor.number_of_queries == len(pending_logfiles) + 1
+    assert by_machine_day_cursor.number_of_queries == 6
+
+
+def test_disagreeing_entries():
+    start = datetime.datetime(2019, 1, 1, 8)
+    records = [
+        create_record("2619", "first", 1, "QA", "Arc", start),
+        create_record("2619", "second", 2, "QA", "Arc", start),
+    ]
+    pending_logfiles = [create_pending_logfile("a", "2619", "QA", "Arc", start)]
+
+    with pytest.raises(MultipleMosaiqEntries):
+        identify_by_machine_day({"msqsql": FakeMosaiqCursor(records)}, pending_logfiles)
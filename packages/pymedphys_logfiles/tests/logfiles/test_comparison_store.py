@@ -0,0 +1,162 @@
+# Copyright (C) 2015-2018 Simon Biggs
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+
+"""Test the append-only MU density comparison store."""
+
+import json
+import os
+
+import pytest
+
+from pymedphys_utilities.utilities import open_logfile_index
+from pymedphys_logfiles.elekta.analyse import load_comparisons_from_cache
+from pymedphys_logfiles.elekta.comparisons import ComparisonStore, open_comparison_store
+
+
+def create_config(data_directory):
+    return {
+        "linac_logfile_data_directory": data_directory,
+        "mu_density": {
+            "comparisons_cache": {
+                "primary": "comparisons.json",
+                "scratch": "comparisons_scratch.json",
+            }
+        },
+    }
+
+
+def create_index_entry(i):
+    return {
+        "filepath": "logfile_{}.trf".format(i),
+        "delivery_details": {"field_id": i, "qa_mode": False},
+        "logfile_header": {"machine": ["2619", "2694"][i % 2]},
+        "local_time": "2019-04-{:02d} 08:00:00".format(1 + i),
+    }
+
+
+def test_comparison_store(tmpdir):
+    with ComparisonStore(os.path.join(str(tmpdir), "comparisons.sqlite")) as store:
+        for i in range(10):
+            entry = create_index_entry(i)
+            store.add(
+                "hash{}".format(i),
+                i / 100,
+                grid_resolution=1,
+                computation_time=2.5,
+                machine=entry["logfile_header"]["machine"],
+                local_time=entry["local_time"],
+                commit=False,
+            )
+        store.commit()
+
+        store.add("hash3", 0.5, grid_resolution=0.25, machine="2694")
+
+        assert len(store) == 10
+        assert "hash3" in store
+        assert "not a hash" not in store
+        assert store.latest("not a hash") is None
+
+        latest = store.latest("hash3")
+        assert latest["comparison"] == 0.5
+        assert latest["grid_resolution"] == 0.25
+        assert latest["code_version"] is not None
+        assert [result["comparison"] for result in store.history("hash3")] == [
+            0.03,
+            0.5,
+        ]
+
+        assert store.comparisons()["hash3"] == 0.5
+        assert [result["hash"] for result in store.worst(3)] == [
+            "hash3",
+            "hash9",
+            "hash8",
+        ]
+        assert [result["hash"] for result in store.worst(machine="2619")] == [
+            "hash8",
+            "hash6",
+            "hash4",
+            "hash2",
+            "hash0",
+        ]
+        assert [
+            result["hash"]
+            for result in store.worst(start_date="2019-04-03", end_date="2019-04-05")
+        ] == ["hash4", "hash2"]
+
+
+def test_migration_from_json(tmpdir):
+    data_directory = str(tmpdir)
+    config = create_config(data_directory)
+
+    json_comparisons = {"hash{}".format(i): i / 100 for i in range(5)}
+    with open(os.path.join(data_directory, "comparisons.json"), "w") as json_file:
+        json.dump(json_comparisons, json_file)
+
+    with open_logfile_index(data_directory) as index:
+        for i in range(5):
+            index["hash{}".format(i)] = create_index_entry(i)
+
+    file_hashes, comparisons, filepaths = load_comparisons_from_cache(config)
+
+    assert comparisons == json_comparisons
+    assert list(file_hashes) == ["hash4", "hash3", "hash2", "hash1", "hash0"]
+    assert os.path.basename(filepaths[0]) == "logfile_4.trf"
+
+    with open_comparison_store(config) as store:
+        assert store.latest("hash1")["machine"] == "2694"
+        assert store.latest("hash1")["local_time"] == "2019-04-02 08:00:00"
+
+        store.add("hash0", 0.5)
+
+    _, comparisons, _ = load_comparisons_from_cache(config)
+    assert comparisons["hash0"] == 0.5
+
+
+class FailingIndex(dict):
+    def __getitem__(self, filehash):
+        if filehash == "hash3":
+            raise RuntimeError("Interrupted")
+
+        return super().__getitem__(filehash)
+
+
+def test_interrupted_migration_is_retried(tmpdir):
+    data_directory = str(tmpdir)
+    config = create_config(data_directory)
+
+    json_comparisons = {"hash{}".format(i): i / 100 for i in range(5)}
+    with open(os.path.join(data_directory, "comparisons.json"), "w") as json_file:
+        json.dump(json_comparisons, json_file)
+
+    index = {"hash{}".format(i): create_index_entry(i) for i in range(5)}
+
+    with pytest.raises(RuntimeError):
+        open_comparison_store(config, index=FailingIndex(index))
+
+    assert not os.path.exists(os.path.join(data_directory, "comparisons.sqlite"))
+
+    with open_comparison_store(config, index=index) as store:
+        assert store.comparisons() == json_comparisons
+        assert store.latest("hash3")["machine"] == "2694"
@@ -0,0 +1,167 @@
+# Copyright (C) 2015-2018 Simon Biggs
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+
+"""Test the on disk cache of decoded logfile deliveries."""
+
+from glob import glob
+import os
+import shutil
+
+from pymedphys_databases.delivery import DeliveryDatabases
+from pymedphys_logfiles.elekta.cache import (
+    cached_delivery_from_logfile,
+    delivery_from_index,
+    evict_least_recently_used,
+)
+from pymedphys_utilities.filehash import hash_file
+
+TRF_DATA_DIRECTORY = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "..",
+    "..",
+    "pymedphys_fileformats",
+    "tests",
+    "trf",
+    "data",
+    "elekta_reference",
+)
+FILEPATHS = sorted(glob(os.path.join(TRF_DATA_DIRECTORY, "*.trf")))
+
+
+def test_cached_delivery_agrees(tmpdir):
+    cache_directory = str(tmpdir.join("cache"))
+    filepath = FILEPATHS[0]
+    filehash = hash_file(filepath)
+
+    expected = DeliveryDatabases.from_logfile(filepath)
+
+    decoded = cached_delivery_from_logfile(filepath, cache_directory)
+    cache_filepath = os.path.join(cache_directory, "{}.npz".format(filehash))
+
+    assert os.path.exists(cache_filepath)
+    assert decoded == expected
+
+    moved_filepath = str(tmpdir.join("moved.trf"))
+    shutil.copy(filepath, moved_filepath)
+    os.utime(cache_filepath, ns=(0, 0))
+
+    loaded = cached_delivery_from_logfile(moved_filepath, cache_directory)
+
+    assert loaded == expected
+    assert isinstance(loaded, DeliveryDatabases)
+    assert os.stat(cache_filepath).st_mtime_ns > 0
+
+
+def test_corrupt_cache_entry_is_replaced(tmpdir):
+    cache_directory = str(tmpdir)
+    filepath = FILEPATHS[0]
+    filehash = hash_file(filepath)
+
+    cache_filepath = os.path.join(cache_directory, "{}.npz".format(filehash))
+    with open(cache_filepath, "wb") as cache_file:
+        cache_file.write(b"not an npz file")
+
+    delivery = cached_delivery_from_logfile(filepath, cache_directory, filehash)
+
+    assert delivery == DeliveryDatabases.from_logfile(filepath)
+    assert cached_delivery_from_logfile(filepath, cache_directory) == delivery
+
+
+def test_least_recently_used_are_evicted(tmpdir):
+    cache_directory = str(tmpdir.join("cache"))
+    filehashes = [hash_file(filepath) for filepath in FILEPATHS[0:3]]
+
+    for filepath in FILEPATHS[0:3]:
+        cached_delivery_from_logfile(filepath, cache_directory)
+
+    cache_filepaths = [
+        os.path.join(cache_directory, "{}.npz".format(filehash))
+        for filehash in filehashes
+    ]
+    total_size = sum(os.path.getsize(path) for path in cache_filepaths)
+
+    shutil.move(cache_filepaths[2], str(tmpdir))
+    os.utime(cache_filepaths[0], ns=(2, 2))
+    os.utime(cache_filepaths[1], ns=(1, 1))
+
+    cached_delivery_from_logfile(
+        FILEPATHS[2], cache_directory, max_cache_size=total_size - 1
+    )
+
+    assert os.path.exists(cache_filepaths[0])
+    assert not os.path.exists(cache_filepaths[1])
+    assert os.path.exists(cache_filepaths[2])
+
+
+def test_concurrently_evicted_entries(tmpdir, monkeypatch):
+    cache_directory = str(tmpdir.join("cache"))
+    filepath = FILEPATHS[0]
+    expected = cached_delivery_from_logfile(filepath, cache_directory)
+
+    original_utime = os.utime
+
+    def evict_then_utime(path, *args, **kwargs):
+        os.remove(path)
+        original_utime(path, *args, **kwargs)
+
+    monkeypatch.setattr(os, "utime", evict_then_utime)
+    assert cached_delivery_from_logfile(filepath, cache_directory) == expected
+    monkeypatch.setattr(os, "utime", original_utime)
+
+    cached_delivery_from_logfile(filepath, cache_directory)
+    original_scandir = os.scandir
+
+    def scandir_then_evict(path):
+        entries = list(original_scandir(path))
+        for entry in entries:
+            os.remove(entry.path)
+
+        return iter(entries)
+
+    monkeypatch.setattr(os, "scandir", scandir_then_evict)
+    evict_least_recently_used(cache_directory, 0)
+
+
+def test_delivery_from_index(tmpdir):
+    data_directory = str(tmpdir)
+    indexed_directory = os.path.join(data_directory, "indexed")
+    os.makedirs(indexed_directory)
+
+    filepath = shutil.copy(FILEPATHS[0], indexed_directory)
+    filehash = hash_file(filepath)
+
+    index = {filehash: {"filepath": os.path.basename(filepath)}}
+    config = {
+        "linac_logfile_data_directory": data_directory,
+        "delivery_cache": {"directory": "delivery_cache"},
+    }
+
+    delivery = delivery_from_index(index, config, filehash)
+
+    assert delivery == DeliveryDatabases.from_logfile(filepath)
+    assert os.path.exists(
+        os.path.join(data_directory, "delivery_cache", "{}.npz".format(filehash))
+    )
@@ -0,0 +1,134 @@
+# Copyright (C) 2015-2018 Simon Biggs
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+
+"""Test fetching diagnostics zips from a stand in for the linac file shares
+and extracting their logfiles."""
+
+import hashlib
+import os
+import zipfile
+from glob import glob
+
+from pymedphys_utilities.filehash import FileHashCache
+from pymedphys_utilities.utilities import open_logfile_index
+from pymedphys_logfiles.elekta.diagnostics_zips import (
+    extract_diagnostic_zips_and_archive,
+    fetch_system_diagnostics_multi_linac,
+)
+from pymedphys_logfiles.elekta.index import HASH_CACHE_FILENAME
+
+MACHINE_IP_MAP = {"2619": "10.0.0.1", "2694": "10.0.0.2"}
+
+
+def create_zip(filepath, members):
+    with zipfile.ZipFile(filepath, "w") as zip_file:
+        for name, contents in members.items():
+            zip_file.writestr(name, contents)
+
+
+def create_shares(share_directory):
+    for machine, ip in MACHINE_IP_MAP.items():
+        os.makedirs(os.path.join(share_directory, ip))
+
+        for backup in range(3):
+            # Consecutive backups overlap, containing the previous backup's
+            # most recent logfile.
+            members = {
+                "Logfiles/{}_{}.trf".format(machine, i): "{} {}".format(machine, i)
+                for i in range(backup * 2, backup * 2 + 3)
+            }
+            members["Logfiles/notes.txt"] = "Not a logfile"
+
+            create_zip(
+                os.path.join(share_directory, ip, "SDD+{}.zip".format(backup)), members
+            )
+
+
+def test_fetch_and_extract(tmpdir):
+    share_directory = os.path.join(str(tmpdir), "shares")
+    data_directory = os.path.join(str(tmpdir), "data")
+    diagnostics_directory = os.path.join(data_directory, "diagnostics")
+    create_shares(share_directory)
+
+    copied = fetch_system_diagnostics_multi_linac(
+        MACHINE_IP_MAP,
+        diagnostics_directory,
+        workers_per_host=2,
+        share_path_template=os.path.join(share_directory, "{}"),
+    )
+
+    assert {machine: len(filepaths) for machine, filepaths in copied.items()} == {
+        "2619": 3,
+        "2694": 3,
+    }
+    fetched = glob(os.path.join(diagnostics_directory, "to_be_indexed", "*", "*"))
+    assert sorted(os.path.basename(filepath) for filepath in fetched) == sorted(
+        ["SDD+0.zip", "SDD+1.zip", "SDD+2.zip"] * 2
+    )
+
+    already_indexed_hash = hashlib.sha1(b"2619 0").hexdigest()
+    with open_logfile_index(data_directory) as index:
+        index[already_indexed_hash] = {
+            "filepath": "2619_0.trf",
+            "delivery_details": {},
+            "logfile_header": {},
+            "local_time": "2019-01-01 08:00:00",
+        }
+
+    extract_diagnostic_zips_and_archive(data_directory)
+
+    extracted = glob(
+        os.path.join(data_directory, "to_be_indexed", "**", "*"), recursive=True
+    )
+    extracted_files = sorted(
+        os.path.basename(filepath) for filepath in extracted if os.path.isfile(filepath)
+    )
+    expected_files = sorted(
+        "{}_{}.trf".format(machine, i)
+        for machine in MACHINE_IP_MAP
+        for i in range(7)
+        if (machine, i) != ("2619", 0)
+    )
+    assert extracted_files == expected_files
+
+    with FileHashCache(os.path.join(data_directory, HASH_CACHE_FILENAME)) as cache:
+        for filepath in extracted:
+            if os.path.isfile(filepath):
+                with open(filepath, "rb") as a_file:
+                    assert (
+                        cache.get(filepath) == hashlib.sha1(a_file.read()).hexdigest()
+                    )
+
+    assert not glob(os.path.join(diagnostics_directory, "to_be_indexed", "*", "*"))
+    assert (
+        len(glob(os.path.join(diagnostics_directory, "already_indexed", "*", "*"))) == 6
+    )
+
+    copied = fetch_system_diagnostics_multi_linac(
+        MACHINE_IP_MAP,
+        diagnostics_directory,
+        share_path_template=os.path.join(share_directory, "{}"),
+    )
+    assert copied == {"2619": [], "2694": []}
@@ -0,0 +1,184 @@
+# Copyright (C) 2015-2018 Simon Biggs
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+
+"""Test the pipelined MU density audit runner."""
+
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+import os
+import shutil
+import sqlite3
+import threading
+
+from pymedphys_databases.delivery import DeliveryDatabases
+from pymedphys_databases.msq import IsolationLevels
+from pymedphys_utilities.filehash import hash_file
+from pymedphys_utilities.utilities import open_logfile_index
+import pymedphys_logfiles.elekta.pipeline
+from pymedphys_logfiles.elekta.comparisons import open_comparison_store
+from pymedphys_logfiles.elekta.pipeline import mudensity_audit, run_audit_pipeline
+
+TRF_DATA_DIRECTORY = os.path.join(
+    os.path.dirname(__file__),
+    "..",
+    "..",
+    "..",
+    "pymedphys_fileformats",
+    "tests",
+    "trf",
+    "data",
+    "elekta_reference",
+)
+FILEPATHS = sorted(glob(os.path.join(TRF_DATA_DIRECTORY, "*.trf")))[0:2]
+
+
+def add_one(fetched, read):
+    return fetched + read + 1
+
+
+def test_run_audit_pipeline():
+    lock = threading.Lock()
+    in_pipeline = set()
+    largest_in_pipeline = [0]
+    recorded = {}
+
+    def fetch(filehash):
+        with lock:
+            in_pipeline.add(filehash)
+            largest_in_pipeline[0] = max(largest_in_pipeline[0], len(in_pipeline))
+
+        if filehash == 3:
+            raise ValueError("Mosaiq isn't available")
+
+        return filehash
+
+    def read(filehash):
+        return 10 * filehash
+
+    def compute(fetched, read):
+        if fetched == 5:
+            raise ValueError("Grids disagree")
+
+        return fetched + read
+
+    def record(filehash, result, computation_time):
+        with lock:
+            in_pipeline.discard(filehash)
+        recorded[filehash] = result
+
+    with ThreadPoolExecutor(max_workers=2) as compute_executor:
+        metrics = run_audit_pipeline(
+            range(20),
+            fetch,
+            read,
+            compute,
+            record,
+            io_workers=4,
+            compute_executor=compute_executor,
+            queue_size=3,
+        )
+
+    expected = {i: 11 * i for i in range(20) if i not in (3, 5)}
+    assert recorded == expected
+
+    # Logfiles which failed are never recorded so are allowed to be
+    # counted as within the pipeline.
+    assert largest_in_pipeline[0] <= 3 + 2
+
+    assert metrics.completed == {"fetch": 19, "read": 20, "compute": 18, "record": 18}
+    assert metrics.failed == {"fetch": 1, "read": 0, "compute": 1, "record": 0}
+    assert metrics.files_per_minute()["record"] > 0
+    assert "files/min" in metrics.summary()
+
+    recorded.clear()
+    metrics = run_audit_pipeline(
+        [1, 2], fetch, read, add_one, record, compute_workers=1
+    )
+    assert recorded == {1: 12, 2: 23}
+
+
+def test_mudensity_audit(tmpdir, monkeypatch):
+    data_directory = str(tmpdir)
+    indexed_directory = os.path.join(data_directory, "indexed")
+    os.makedirs(indexed_directory)
+
+    deliveries = {}
+    with open_logfile_index(data_directory) as index:
+        for i, filepath in enumerate(FILEPATHS):
+            filepath = shutil.copy(filepath, indexed_directory)
+            filehash = hash_file(filepath)
+            deliveries[i] = DeliveryDatabases.from_logfile(filepath)
+
+            index[filehash] = {
+                "filepath": os.path.basename(filepath),
+                "delivery_details": {
+                    "patient_id": "000",
+                    "field_id": i,
+                    "qa_mode": False,
+                    "field_type": "VMAT",
+                },
+                "logfile_header": {"machine": "2619"},
+                "local_time": "2019-04-17 0{}:00:00".format(i),
+            }
+
+    config = {
+        "linac_logfile_data_directory": data_directory,
+        "centres": {"rccc": {"ois_specific_data": {"sql_server": "msqsql"}}},
+        "machine_map": {"2619": {"centre": "rccc"}},
+        "mu_density": {
+            "grid_resolution": 5,
+            "ram_fraction": 0.8,
+            "comparisons_cache": {"primary": "comparisons.json"},
+        },
+    }
+
+    def multi_fetch_and_verify_mosaiq(cursor, field_id, isolation_levels):
+        assert isinstance(isolation_levels, IsolationLevels)
+        return deliveries[field_id]
+
+    monkeypatch.setattr(
+        pymedphys_logfiles.elekta.pipeline,
+        "multi_fetch_and_verify_mosaiq",
+        multi_fetch_and_verify_mosaiq,
+    )
+
+    def connect(sql_server):
+        assert sql_server == "msqsql"
+        return sqlite3.connect(":memory:", check_same_thread=False)
+
+    metrics = mudensity_audit(config, compute_workers=1, connect=connect)
+    assert metrics.completed["record"] == 2
+
+    with open_comparison_store(config) as store:
+        results = store.worst()
+        assert len(results) == 2
+        for result in results:
+            assert result["comparison"] == 0
+            assert result["grid_resolution"] == 5
+            assert result["machine"] == "2619"
+            assert result["computation_time"] > 0
+
+    metrics = mudensity_audit(config, compute_workers=1, connect=connect)
+    assert metrics.completed["record"] == 0
@@ -36,6 +36,8 @@ class DeliveryMuDensity(Delivery):
         gantry_tolerance=3,
         grid_resolution=1,
         output_always_list=False,
+        workers=1,
+        method="sampled",
     ):
         if gantry_angles is None:
             gantry_angles = 0
@@ -51,6 +53,8 @@ class DeliveryMuDensity(Delivery):
                     delivery_data.mlc,
                     delivery_data.jaw,
                     grid_resolution=grid_resolution,
+                    workers=workers,
+                    method=method,
                 )
             )
 
@@ -25,6 +25,9 @@
 
 # pylint: disable=C0103,C1801
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import matplotlib.pyplot as plt
 
@@ -38,6 +41,12 @@ __DEFAULT_LEAF_PAIR_WIDTHS = AGILITY
 __DEFAULT_GRID_RESOLUTION = 1
 __DEFAULT_MAX_LEAF_GAP = 400
 __DEFAULT_MIN_STEP_PER_PIXEL = 10
+__DEFAULT_WORKERS = 1
+__DEFAULT_RAM = int(2 ** 30 * 1.5)  # 1.5 GB
+__CHUNKS_PER_WORKER = 4
+__DEFAULT_METHOD = "sampled"
+__METHODS = ("sampled", "analytic")
+__NUMBER_OF_BREAKPOINTS = 10  # t = 0, t = 1, and two for each of four edges
 
 
 def calc_mu_density(
@@ -48,6 +57,9 @@ def calc_mu_density(
     max_leaf_gap=__DEFAULT_MAX_LEAF_GAP,
     leaf_pair_widths=__DEFAULT_LEAF_PAIR_WIDTHS,
     min_step_per_pixel=__DEFAULT_MIN_STEP_PER_PIXEL,
+    workers=__DEFAULT_WORKERS,
+    ram_available=__DEFAULT_RAM,
+    method=__DEFAULT_METHOD,
 ):
     """Determine the MU Density.
 
@@ -89,6 +101,26 @@ def calc_mu_density(
         The minimum number of time steps
         used per pixel for each control point. Defaults to 10.
 
+    workers : int, optional
+        The number of processes over which chunks of control points are
+        spread. The result is identical to the serial calculation. When
+        using more than one worker on Windows the calling script needs to
+        be guarded by ``if __name__ == "__main__":``. Defaults to 1.
+
+    ram_available : int, optional
+        The number of bytes of RAM available for use by the workers. Fewer
+        chunks are calculated at once if the estimated memory needed for
+        each worker does not fit. Defaults to 1.5 GB.
+
+    method : str, optional
+        Either ``"sampled"`` or ``"analytic"``. The sampled method averages
+        the open fraction over ``min_step_per_pixel`` time steps per pixel
+        of travel. The analytic method integrates the open fraction over
+        each control point exactly, assuming the leaves and jaws move
+        linearly between control points. Its cost does not depend on how
+        far the leaves travel and ``min_step_per_pixel`` is ignored.
+        Defaults to ``"sampled"``.
+
     Returns
     -------
     mu_density : numpy.ndarray
@@ -224,6 +256,7 @@ def calc_mu_density(
         )
 
     leaf_pair_widths = np.array(leaf_pair_widths)
+    _check_method(method)
 
     if not np.max(np.abs(mlc)) <= max_leaf_gap / 2:
         raise ValueError(
@@ -236,27 +269,168 @@ def calc_mu_density(
 
     mu_density = np.zeros((len(full_grid["jaw"]), len(full_grid["mlc"])))
 
+    if workers == 1:
+        control_point_results = _calc_control_points(
+            mu, mlc, jaw, leaf_pair_widths, grid_resolution, min_step_per_pixel, method
+        )
+    else:
+        control_point_results = _calc_control_points_in_parallel(
+            mu,
+            mlc,
+            jaw,
+            leaf_pair_widths,
+            grid_resolution,
+            min_step_per_pixel,
+            method,
+            len(full_grid["mlc"]),
+            workers,
+            ram_available,
+        )
+
+    # Accumulated in control point order so that the result does not
+    # depend on the number of workers.
+    for grid, mu_density_of_slice in control_point_results:
+        full_grid_mu_density_of_slice = _convert_to_full_grid(
+            grid, full_grid, mu_density_of_slice
+        )
+
+        mu_density += full_grid_mu_density_of_slice
+
+    return mu_density
+
+
+def _calc_control_points(
+    mu, mlc, jaw, leaf_pair_widths, grid_resolution, min_step_per_pixel, method
+):
     for i in range(len(mu) - 1):
         control_point_slice = slice(i, i + 2, 1)
         current_mlc = mlc[control_point_slice, :, :]
         current_jaw = jaw[control_point_slice, :]
         delivered_mu = np.diff(mu[control_point_slice])
 
-        grid, mu_density_of_slice = calc_single_control_point(
+        yield calc_single_control_point(
             current_mlc,
             current_jaw,
             delivered_mu,
             leaf_pair_widths=leaf_pair_widths,
             grid_resolution=grid_resolution,
             min_step_per_pixel=min_step_per_pixel,
+            method=method,
         )
-        full_grid_mu_density_of_slice = _convert_to_full_grid(
-            grid, full_grid, mu_density_of_slice
+
+
+def _calc_control_point_chunk(
+    mu, mlc, jaw, leaf_pair_widths, grid_resolution, min_step_per_pixel, method
+):
+    return list(
+        _calc_control_points(
+            mu, mlc, jaw, leaf_pair_widths, grid_resolution, min_step_per_pixel, method
         )
+    )
 
-        mu_density += full_grid_mu_density_of_slice
 
-    return mu_density
+def _calc_control_points_in_parallel(
+    mu,
+    mlc,
+    jaw,
+    leaf_pair_widths,
+    grid_resolution,
+    min_step_per_pixel,
+    method,
+    number_of_mlc_grid_points,
+    workers,
+    ram_available,
+):
+    """Calculate chunks of control points over a pool of processes.
+
+    Each chunk is given the stacked control points it needs, with
+    neighbouring chunks sharing their boundary control point. Results are
+    yielded in control point order.
+    """
+    number_of_control_point_pairs = len(mu) - 1
+    if number_of_control_point_pairs < 1:
+        return
+
+    estimated_ram_needed = _estimate_control_point_ram(
+        mlc,
+        jaw,
+        leaf_pair_widths,
+        number_of_mlc_grid_points,
+        grid_resolution,
+        min_step_per_pixel,
+        method,
+    )
+    max_chunks_in_flight = int(
+        np.clip(np.floor(ram_available / estimated_ram_needed), 1, workers)
+    )
+
+    number_of_chunks = min(workers * __CHUNKS_PER_WORKER, number_of_control_point_pairs)
+    chunks = np.array_split(np.arange(number_of_control_point_pairs), number_of_chunks)
+
+    with ProcessPoolExecutor(max_workers=max_chunks_in_flight) as executor:
+        in_flight = deque()
+        for chunk in chunks:
+            control_point_slice = slice(chunk[0], chunk[-1] + 2, 1)
+            in_flight.append(
+                executor.submit(
+                    _calc_control_point_chunk,
+                    mu[control_point_slice],
+                    mlc[control_point_slice, :, :],
+                    jaw[control_point_slice, :],
+                    leaf_pair_widths,
+                    grid_resolution,
+                    min_step_per_pixel,
+                    method,
+                )
+            )
+
+            if len(in_flight) >= max_chunks_in_flight:
+                yield from in_flight.popleft().result()
+
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+
+def _estimate_control_point_ram(
+    mlc,
+    jaw,
+    leaf_pair_widths,
+    number_of_mlc_grid_points,
+    grid_resolution,
+    min_step_per_pixel,
+    method,
+):
+    """Estimate the peak bytes needed to calculate the most demanding
+    control point.
+
+    For the sampled method the dominant arrays within
+    ``_calc_blocked_by_device`` are of shape ``time_steps x leaves x grid``,
+    with roughly six of these alive at once. For the analytic method the
+    dominant arrays are of shape ``jaw grid x mlc grid x evaluation times``,
+    with roughly eight of these alive at once.
+    """
+    if method == "analytic":
+        number_of_jaw_grid_points = np.sum(leaf_pair_widths) / grid_resolution + 2
+
+        return (
+            number_of_jaw_grid_points
+            * number_of_mlc_grid_points
+            * (2 * __NUMBER_OF_BREAKPOINTS - 1)
+            * 8
+            * 8
+        )
+
+    maximum_travel = np.max(
+        [
+            np.max(np.abs(np.diff(mlc, axis=0)), initial=0),
+            np.max(np.abs(np.diff(jaw, axis=0)), initial=0),
+        ]
+    )
+    time_steps = np.max(
+        [np.ceil(maximum_travel / grid_resolution) * min_step_per_pixel, 10]
+    )
+
+    return time_steps * len(leaf_pair_widths) * number_of_mlc_grid_points * 8 * 6
 
 
 def calc_single_control_point(
@@ -266,9 +440,13 @@ def calc_single_control_point(
     leaf_pair_widths=__DEFAULT_LEAF_PAIR_WIDTHS,
     grid_resolution=__DEFAULT_GRID_RESOLUTION,
     min_step_per_pixel=__DEFAULT_MIN_STEP_PER_PIXEL,
+    method=__DEFAULT_METHOD,
 ):
     """Calculate the MU Density for a single control point.
 
+    See `pymedphys.mudensity.calc_mu_density`_ for a description of the
+    ``method`` parameter.
+
     Examples
     --------
     >>> import numpy as np
@@ -305,9 +483,18 @@ def calc_single_control_point(
            [0.  , 0.14, 0.86, 1.  , 0.86, 0.14, 0.  ],
            [0.14, 0.86, 1.  , 1.  , 1.  , 0.86, 0.14],
            [0.03, 0.17, 0.2 , 0.2 , 0.2 , 0.17, 0.03]])
+    >>>
+    >>> grid, mu_density = calc_single_control_point(
+    ...     mlc, jaw, leaf_pair_widths=leaf_pair_widths, method="analytic")
+    >>> np.round(mu_density, 2)
+    array([[0.  , 0.06, 0.44, 0.5 , 0.44, 0.06, 0.  ],
+           [0.  , 0.12, 0.88, 1.  , 0.88, 0.12, 0.  ],
+           [0.12, 0.88, 1.  , 1.  , 1.  , 0.88, 0.12],
+           [0.02, 0.17, 0.2 , 0.2 , 0.2 , 0.17, 0.02]])
     """
 
     leaf_pair_widths = np.array(leaf_pair_widths)
+    _check_method(method)
     leaf_division = leaf_pair_widths / grid_resolution
 
     if not np.all(leaf_division.astype(int) == leaf_division):
@@ -335,13 +522,18 @@ def calc_single_control_point(
         },
     }
 
-    time_steps = _calc_time_steps(positions, grid_resolution, min_step_per_pixel)
-    blocked_by_device = _calc_blocked_by_device(
-        grid, positions, grid_resolution, time_steps
-    )
-    device_open = _calc_device_open(blocked_by_device)
-    mlc_open, jaw_open = _remap_mlc_and_jaw(device_open, grid_leaf_map)
-    open_fraction = _calc_open_fraction(mlc_open, jaw_open)
+    if method == "analytic":
+        open_fraction = _calc_open_fraction_analytic(
+            grid, positions, grid_leaf_map, grid_resolution
+        )
+    else:
+        time_steps = _calc_time_steps(positions, grid_resolution, min_step_per_pixel)
+        blocked_by_device = _calc_blocked_by_device(
+            grid, positions, grid_resolution, time_steps
+        )
+        device_open = _calc_device_open(blocked_by_device)
+        mlc_open, jaw_open = _remap_mlc_and_jaw(device_open, grid_leaf_map)
+        open_fraction = _calc_open_fraction(mlc_open, jaw_open)
 
     mu_density = open_fraction * delivered_mu
 
@@ -353,6 +545,7 @@ def single_mlc_pair(
     right_mlc,
     grid_resolution=__DEFAULT_GRID_RESOLUTION,
     min_step_per_pixel=__DEFAULT_MIN_STEP_PER_PIXEL,
+    method=__DEFAULT_METHOD,
 ):
     """Calculate the MU Density of a single leaf pair.
 
@@ -391,6 +584,7 @@ def single_mlc_pair(
         leaf_pair_widths=leaf_pair_widths,
         grid_resolution=grid_resolution,
         min_step_per_pixel=min_step_per_pixel,
+        method=method,
     )
 
     return grid["mlc"], mu_density[0, :]
@@ -404,6 +598,9 @@ def calc_mu_density_return_grid(
     max_leaf_gap=__DEFAULT_MAX_LEAF_GAP,
     leaf_pair_widths=__DEFAULT_LEAF_PAIR_WIDTHS,
     min_step_per_pixel=__DEFAULT_MIN_STEP_PER_PIXEL,
+    workers=__DEFAULT_WORKERS,
+    ram_available=__DEFAULT_RAM,
+    method=__DEFAULT_METHOD,
 ):
     """DEPRECATED. This is a temporary helper function to provide the old
     api.
@@ -418,6 +615,9 @@ def calc_mu_density_return_grid(
         max_leaf_gap=max_leaf_gap,
         leaf_pair_widths=leaf_pair_widths,
         min_step_per_pixel=min_step_per_pixel,
+        workers=workers,
+        ram_available=ram_available,
+        method=method,
     )
 
     full_grid = get_grid(max_leaf_gap, grid_resolution, leaf_pair_widths)
@@ -600,6 +800,101 @@ def _calc_open_fraction(mlc_open, jaw_open):
     return open_fraction
 
 
+def _check_method(method):
+    if method not in __METHODS:
+        raise ValueError("method must be one of {}, not {!r}".format(__METHODS, method))
+
+
+def _calc_ramp_coefficients(grid, start, end, multiplier, grid_resolution):
+    """Express the fraction of each pixel blocked by a device edge as
+    ``clip(intercept + slope * t, 0, 1)`` where ``t`` runs from 0 to 1 over
+    the control point. Axis 0 is the device, axis 1 is the grid.
+    """
+    intercept = 0.5 - multiplier * (grid[None, :] - start[:, None]) / grid_resolution
+    slope = np.broadcast_to(
+        multiplier * (end - start)[:, None] / grid_resolution, intercept.shape
+    )
+
+    return intercept, slope
+
+
+def _calc_ramp_breakpoints(intercept, slope):
+    """The times at which a blocked fraction ramp reaches 0 and 1. Ramps
+    that do not move are given breakpoints at ``t = 0``.
+    """
+    moving = slope != 0
+    safe_slope = np.where(moving, slope, 1)
+
+    reaches_open = np.where(moving, -intercept / safe_slope, 0)
+    reaches_blocked = np.where(moving, (1 - intercept) / safe_slope, 0)
+
+    return np.clip(reaches_open, 0, 1), np.clip(reaches_blocked, 0, 1)
+
+
+def _evaluate_ramp(intercept, slope, t):
+    return np.clip(intercept[..., None] + slope[..., None] * t, 0, 1)
+
+
+def _calc_open_fraction_analytic(grid, positions, grid_leaf_map, grid_resolution):
+    """Integrate the open fraction of each pixel over a control point.
+
+    Within a control point each device edge travels linearly in time, so
+    the fraction of a pixel it blocks is a clipped linear function of time.
+    The open fraction, ``(1 - left - right) * (1 - bottom - top)``, is then
+    piecewise quadratic in time with its pieces separated by the times at
+    which any of the four ramps saturate. Simpson's rule is exact for
+    quadratics, so applying it over each piece gives the exact integral.
+    """
+    ramps = []
+    for device, edge_positions in positions.items():
+        for multiplier, (start, end) in edge_positions.items():
+            intercept, slope = _calc_ramp_coefficients(
+                grid[device], start, end, multiplier, grid_resolution
+            )
+
+            if device == "mlc":
+                intercept = intercept[grid_leaf_map, :]
+                slope = slope[grid_leaf_map, :]
+            else:
+                intercept = intercept[0, :, None]
+                slope = slope[0, :, None]
+
+            ramps.append((intercept, slope))
+
+    shape = (len(grid["jaw"]), len(grid["mlc"]))
+    ramps = [
+        (np.broadcast_to(intercept, shape), np.broadcast_to(slope, shape))
+        for intercept, slope in ramps
+    ]
+
+    breakpoints = [np.zeros(shape), np.ones(shape)]
+    for intercept, slope in ramps:
+        breakpoints += _calc_ramp_breakpoints(intercept, slope)
+
+    breakpoints = np.sort(np.stack(breakpoints, axis=-1), axis=-1)
+    midpoints = (breakpoints[..., 1:] + breakpoints[..., :-1]) / 2
+    widths = np.diff(breakpoints, axis=-1)
+
+    t = np.concatenate([breakpoints, midpoints], axis=-1)
+    (left, right, bottom, top) = [
+        _evaluate_ramp(intercept, slope, t) for intercept, slope in ramps
+    ]
+    open_t = (1 - left - right) * (1 - bottom - top)
+
+    number_of_breakpoints = breakpoints.shape[-1]
+    at_breakpoints = open_t[..., :number_of_breakpoints]
+    at_midpoints = open_t[..., number_of_breakpoints:]
+
+    open_fraction = np.sum(
+        widths
+        / 6
+        * (at_breakpoints[..., :-1] + 4 * at_midpoints + at_breakpoints[..., 1:]),
+        axis=-1,
+    )
+
+    return open_fraction
+
+
 def _determine_leaf_centres(leaf_pair_widths):
     total_leaf_widths = np.sum(leaf_pair_widths)
     leaf_centres = (
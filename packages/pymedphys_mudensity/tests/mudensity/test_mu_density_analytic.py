@@ -0,0 +1,108 @@
+# Copyright (C) 2019 Cancer Care Associates
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+
+# pylint: disable=C0103,C1801
+
+
+"""Compare the analytic MU Density method to the time step sampled method.
+"""
+
+import os
+
+import numpy as np
+
+from pymedphys_mudensity.mudensity import (
+    calc_mu_density,
+    calc_single_control_point,
+    single_mlc_pair,
+)
+
+
+DATA_DIRECTORY = os.path.join(os.path.dirname(__file__), "data")
+DELIVERY_DATA_FILEPATH = os.path.abspath(
+    os.path.join(DATA_DIRECTORY, "mu_density_example_arrays.npz")
+)
+
+
+def test_single_control_point_is_exact():
+    mlc = np.array([[[1, 1], [2, 2]], [[2, 2], [3, 3]]])
+    jaw = np.array([[1.5, 1.2], [1.5, 1.2]])
+
+    _, mu_density = calc_single_control_point(
+        mlc, jaw, leaf_pair_widths=(2, 2), method="analytic"
+    )
+
+    assert np.allclose(
+        mu_density,
+        [
+            [0, 1 / 16, 7 / 16, 0.5, 7 / 16, 1 / 16, 0],
+            [0, 1 / 8, 7 / 8, 1, 7 / 8, 1 / 8, 0],
+            [1 / 8, 7 / 8, 1, 1, 1, 7 / 8, 1 / 8],
+            [0.025, 0.175, 0.2, 0.2, 0.2, 0.175, 0.025],
+        ],
+    )
+
+
+def test_stationary_and_large_travel():
+    _, mu_density = single_mlc_pair((-1, -1), (2.7, 2.7), 1, method="analytic")
+    assert np.allclose(mu_density, [0.5, 1, 1, 1, 0.2])
+
+    x, mu_density = single_mlc_pair((-400, 400), (400, 400), method="analytic")
+    linear = (x + 400) / 800
+    linear[-1] = 0.5
+    assert np.allclose(linear, mu_density, atol=0.001)
+
+
+def test_sampled_method_converges_to_analytic():
+    regress_test_arrays = np.load(DELIVERY_DATA_FILEPATH)
+
+    mu = regress_test_arrays["mu"]
+    mlc = regress_test_arrays["mlc"]
+    jaw = regress_test_arrays["jaw"]
+
+    assert np.allclose(
+        calc_mu_density(mu, mlc, jaw, method="analytic"),
+        regress_test_arrays["mu_density"],
+        atol=0.01,
+    )
+
+    analytic = calc_mu_density(mu, mlc, jaw, grid_resolution=2.5, method="analytic")
+
+    coarse_error = np.max(
+        np.abs(
+            calc_mu_density(mu, mlc, jaw, grid_resolution=2.5, min_step_per_pixel=10)
+            - analytic
+        )
+    )
+    fine_error = np.max(
+        np.abs(
+            calc_mu_density(mu, mlc, jaw, grid_resolution=2.5, min_step_per_pixel=100)
+            - analytic
+        )
+    )
+
+    assert coarse_error < 0.05
+    assert fine_error < coarse_error / 5
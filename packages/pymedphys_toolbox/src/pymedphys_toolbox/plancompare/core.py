@@ -32,7 +32,7 @@ import itertools
 import numpy as np
 import matplotlib.pyplot as plt
 
-from pymedphys_databases.msq import multi_mosaiq_connect, delivery_data_from_mosaiq
+from pymedphys_databases.msq import multi_mosaiq_connect, delivery_data_from_mosaiq_bulk
 
 
 def plot_mu_densities(labels, mu_density_results):
@@ -78,10 +78,22 @@ def compare_mosaiq_fields(servers, field_ids):
     unique_servers = list(set(servers))
 
     with multi_mosaiq_connect(unique_servers) as cursors:
-        deliveries = [
-            delivery_data_from_mosaiq(cursors[server], field_id)
-            for server, field_id in zip(servers, field_ids)
-        ]
+        deliveries_by_server = {
+            server: delivery_data_from_mosaiq_bulk(
+                cursors[server],
+                [
+                    field_id
+                    for field_server, field_id in zip(servers, field_ids)
+                    if field_server == server
+                ],
+            )
+            for server in unique_servers
+        }
+
+    deliveries = [
+        deliveries_by_server[server][field_id]
+        for server, field_id in zip(servers, field_ids)
+    ]
 
     mu_density_results = [delivery_data.mudensity() for delivery_data in deliveries]
 
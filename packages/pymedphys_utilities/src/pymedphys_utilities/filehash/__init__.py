@@ -28,4 +28,5 @@
 """
 
 
-from .core import hash_file
+from .core import hash_file, hash_files
+from .cache import FileHashCache
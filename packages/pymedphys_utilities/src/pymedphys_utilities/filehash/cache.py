@@ -0,0 +1,137 @@
+# Copyright (C) 2018 Cancer Care Associates
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+"""A persistent cache of file hashes.
+"""
+
+import os
+import sqlite3
+
+
+class FileHashCache:
+    """Remember the hash of each file until the file changes.
+
+    Entries are stored within an SQLite database keyed on the absolute
+    path of the file. A cached hash is only used while the size,
+    modification time and inode of the file are unchanged.
+
+    The cache is to be used from the thread that created it.
+
+    Args:
+        filepath: The path of the SQLite database to store the cache
+            within. It is created if it doesn't exist.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+
+        self._connection = sqlite3.connect(filepath)
+        with self._connection:
+            self._connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS file_hashes (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER,
+                    mtime_ns INTEGER,
+                    inode INTEGER,
+                    hash TEXT
+                )
+                """
+            )
+
+    def get(self, filepath):
+        """The cached hash of a file, or ``None`` if the file has changed
+        or was never hashed.
+        """
+        try:
+            key = file_key(filepath)
+        except FileNotFoundError:
+            return None
+
+        row = self._connection.execute(
+            "SELECT hash FROM file_hashes "
+            "WHERE path = ? AND size = ? AND mtime_ns = ? AND inode = ?",
+            key,
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        return row[0]
+
+    def add(self, filepath, filehash, commit=True, key=None):
+        """Record the hash of a file in its current state.
+
+        Also used to record where a file has been moved to, as moving a file
+        within a file system keeps its size, modification time and inode.
+
+        Args:
+            filepath: The path of the file.
+            filehash: The hash of the file.
+            commit: Whether or not to commit the entry immediately.
+            key: The ``file_key`` of the file taken before it was hashed.
+                If the file has changed since then the hash may belong to
+                an earlier state of the file, and it is not recorded.
+
+        Returns:
+            Whether or not the hash was recorded.
+        """
+        try:
+            current_key = file_key(filepath)
+        except FileNotFoundError:
+            return False
+
+        if key is not None and key != current_key:
+            return False
+
+        self._connection.execute(
+            "INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, inode, hash) "
+            "VALUES (?, ?, ?, ?, ?)",
+            current_key + (filehash,),
+        )
+
+        if commit:
+            self.commit()
+
+        return True
+
+    def commit(self):
+        self._connection.commit()
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.commit()
+        self.close()
+
+
+def file_key(filepath):
+    stat = os.stat(filepath)
+
+    return (os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns, stat.st_ino)
@@ -27,18 +27,101 @@
 """
 
 import hashlib
+import mmap
+from concurrent.futures import ThreadPoolExecutor
 
+from .cache import file_key
+
+BLOCKSIZE = 2 ** 20
+DEFAULT_WORKERS = 8
 
-def hash_file(filename, dot_feedback=False):
-    BLOCKSIZE = 65536
-    hasher = hashlib.sha1()
-    with open(filename, "rb") as afile:
-        buf = afile.read(BLOCKSIZE)
-        while len(buf) > 0:
-            hasher.update(buf)
-            buf = afile.read(BLOCKSIZE)
+
+def hash_file(filename, dot_feedback=False, cache=None):
+    """Determine the SHA1 hash of a file's contents.
+
+    If a ``FileHashCache`` is provided, the hash of a file that has not
+    changed since it was last hashed is returned without reading it. A file
+    that changes while it is being hashed is not cached.
+    """
+    if cache is not None:
+        filehash = cache.get(filename)
+        if filehash is None:
+            key = file_key(filename)
+            filehash = hash_file_contents(filename)
+            cache.add(filename, filehash, key=key)
+    else:
+        filehash = hash_file_contents(filename)
 
     if dot_feedback:
         print(".", end="", flush=True)
 
+    return filehash
+
+
+def hash_files(filepaths, workers=DEFAULT_WORKERS, cache=None, dot_feedback=False):
+    """Determine the SHA1 hashes of many files concurrently.
+
+    hashlib releases the GIL whilst hashing, so the files are read and
+    hashed over a pool of ``workers`` threads. Files found unchanged within
+    the optional ``FileHashCache`` are not read at all.
+
+    Returns:
+        A list of the hashes in the same order as ``filepaths``.
+    """
+    filepaths = list(filepaths)
+
+    if cache is not None:
+        filehashes = [cache.get(filepath) for filepath in filepaths]
+    else:
+        filehashes = [None] * len(filepaths)
+
+    to_be_hashed = [i for i, filehash in enumerate(filehashes) if filehash is None]
+
+    def hash_with_feedback(filepath):
+        # The file is stat'ed before it is read so that a file that changes
+        # whilst being hashed isn't cached against its new state.
+        key = file_key(filepath)
+        filehash = hash_file_contents(filepath)
+
+        if dot_feedback:
+            print(".", end="", flush=True)
+
+        return key, filehash
+
+    if workers > 1 and len(to_be_hashed) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            new_hashes = list(
+                executor.map(hash_with_feedback, [filepaths[i] for i in to_be_hashed])
+            )
+    else:
+        new_hashes = [hash_with_feedback(filepaths[i]) for i in to_be_hashed]
+
+    for i, (_, filehash) in zip(to_be_hashed, new_hashes):
+        filehashes[i] = filehash
+
+    if cache is not None:
+        for i, (key, filehash) in zip(to_be_hashed, new_hashes):
+            cache.add(filepaths[i], filehash, commit=False, key=key)
+        cache.commit()
+
+    return filehashes
+
+
+def hash_file_contents(filename):
+    """Hash a file, memory mapping it where possible so that the whole file
+    is hashed within a single call.
+    """
+    hasher = hashlib.sha1()
+    with open(filename, "rb") as afile:
+        try:
+            with mmap.mmap(afile.fileno(), 0, access=mmap.ACCESS_READ) as contents:
+                hasher.update(contents)
+        except (ValueError, OSError):
+            # Empty files and some special files can't be memory mapped
+            afile.seek(0)
+            buf = afile.read(BLOCKSIZE)
+            while len(buf) > 0:
+                hasher.update(buf)
+                buf = afile.read(BLOCKSIZE)
+
     return hasher.hexdigest()
@@ -32,13 +32,16 @@ Examples:
 
 from .config import (
     get_filepath,
+    get_data_directory,
     get_sql_servers,
     get_gantry_tolerance,
     get_cache_filepaths,
+    get_comparison_store_filepaths,
     get_mu_density_parameters,
     get_index,
     get_centre,
     get_sql_servers_list,
 )
+from .logfileindex import open_logfile_index, JsonLogfileIndex, SqliteLogfileIndex
 from .filesearch import wildcard_file_resolution
 from .filesystem import make_a_valid_directory_name
@@ -25,7 +25,10 @@
 
 
 import os
-import json
+
+from .logfileindex import open_logfile_index
+
+DEFAULT_COMPARISON_STORE = "comparisons.sqlite"
 
 
 def get_gantry_tolerance(index, file_hash, config):
@@ -53,6 +56,20 @@ def get_cache_filepaths(config):
     return comparison_storage_filepath, comparison_storage_scratch
 
 
+def get_comparison_store_filepaths(config):
+    comparisons_cache_config = config["mu_density"]["comparisons_cache"]
+
+    comparison_store_filepath = os.path.join(
+        get_data_directory(config),
+        comparisons_cache_config.get("store", DEFAULT_COMPARISON_STORE),
+    )
+    json_comparisons_filepath = os.path.join(
+        get_data_directory(config), comparisons_cache_config["primary"]
+    )
+
+    return comparison_store_filepath, json_comparisons_filepath
+
+
 def get_mu_density_parameters(config):
     mu_density_config = config["mu_density"]
     grid_resolution = mu_density_config["grid_resolution"]
@@ -62,9 +79,14 @@ def get_mu_density_parameters(config):
 
 
 def get_index(config):
-    index_filepath = os.path.join(get_data_directory(config), "index.json")
-    with open(index_filepath) as json_data_file:
-        index = json.load(json_data_file)
+    """Open the logfile index of the config.
+
+    The index needs to be closed once finished with, for example by using
+    it as a context manager.
+    """
+    index = open_logfile_index(
+        get_data_directory(config), backend=config.get("index_backend")
+    )
 
     return index
 
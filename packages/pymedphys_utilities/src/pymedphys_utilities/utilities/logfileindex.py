@@ -0,0 +1,434 @@
+# Copyright (C) 2019 Cancer Care Associates
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+"""Storage backends for the logfile index.
+
+The index maps the SHA1 hash of each indexed logfile to an entry of the
+form::
+
+    {
+        "filepath": ...,
+        "delivery_details": {"patient_id": ..., "field_id": ..., ...},
+        "logfile_header": {"machine": ..., "date": ..., ...},
+        "local_time": ...,
+    }
+
+Each backend is a mutable mapping from hash to entry. New entries are
+staged until ``commit`` is called, allowing a whole batch of logfiles to be
+written at once.
+"""
+
+import json
+import os
+import sqlite3
+from collections.abc import MutableMapping
+
+JSON_INDEX_FILENAME = "index.json"
+SQLITE_INDEX_FILENAME = "index.sqlite"
+
+DEFAULT_INDEX_BACKEND = "sqlite"
+
+DELIVERY_DETAILS_FIELDS = (
+    "patient_id",
+    "field_id",
+    "last_name",
+    "first_name",
+    "qa_mode",
+    "field_type",
+    "beam_completed",
+)
+BOOLEAN_DELIVERY_DETAILS_FIELDS = ("qa_mode", "beam_completed")
+
+HEADER_FIELDS = ("machine", "date", "timezone", "field_label", "field_name")
+
+ENTRY_FIELDS = ("filepath", "local_time", "delivery_details", "logfile_header")
+NESTED_ENTRY_FIELDS = (
+    ("delivery_details", DELIVERY_DETAILS_FIELDS),
+    ("logfile_header", HEADER_FIELDS),
+)
+
+
+class JsonLogfileIndex(MutableMapping):
+    """The original logfile index, held in memory and written out as a
+    whole to a json file on each commit.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+
+        try:
+            with open(filepath, "r") as json_data_file:
+                self._index = json.load(json_data_file)
+        except FileNotFoundError:
+            self._index = dict()
+
+    def __getitem__(self, filehash):
+        return self._index[filehash]
+
+    def __setitem__(self, filehash, entry):
+        self._index[filehash] = entry
+
+    def __delitem__(self, filehash):
+        del self._index[filehash]
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def commit(self):
+        extension_split = os.path.splitext(self.filepath)
+        temp_filepath = "{}_temp{}".format(extension_split[0], extension_split[1])
+
+        with open(temp_filepath, "w") as json_data_file:
+            json.dump(self._index, json_data_file, indent=2)
+
+        os.replace(temp_filepath, self.filepath)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        self.close()
+
+
+class SqliteLogfileIndex(MutableMapping):
+    """A logfile index stored within an SQLite database.
+
+    The files, delivery details and logfile headers are stored in separate
+    tables keyed by the logfile hash. The field id, patient id, machine and
+    local time are indexed so that they can be queried directly with
+    ``find``. Any other parts of an entry are kept as json alongside the
+    file, so that entries are returned exactly as they were stored. Changes
+    are made within a transaction and are only written once ``commit`` is
+    called.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+
+        self._connection = sqlite3.connect(filepath)
+        self._connection.execute("PRAGMA foreign_keys = ON")
+        self._create_tables()
+
+    def _create_tables(self):
+        delivery_details_columns = ", ".join(DELIVERY_DETAILS_FIELDS)
+        header_columns = ", ".join(HEADER_FIELDS)
+
+        with self._connection:
+            self._connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS files (
+                    hash TEXT PRIMARY KEY,
+                    filepath TEXT,
+                    local_time TEXT,
+                    extra TEXT
+                );
+                CREATE TABLE IF NOT EXISTS delivery_details (
+                    hash TEXT PRIMARY KEY REFERENCES files (hash) ON DELETE CASCADE,
+                    {delivery_details_columns}
+                );
+                CREATE TABLE IF NOT EXISTS headers (
+                    hash TEXT PRIMARY KEY REFERENCES files (hash) ON DELETE CASCADE,
+                    {header_columns}
+                );
+                CREATE INDEX IF NOT EXISTS files_local_time ON files (local_time);
+                CREATE INDEX IF NOT EXISTS delivery_details_field_id
+                    ON delivery_details (field_id);
+                CREATE INDEX IF NOT EXISTS delivery_details_patient_id
+                    ON delivery_details (patient_id);
+                CREATE INDEX IF NOT EXISTS headers_machine ON headers (machine);
+                """.format(
+                    delivery_details_columns=delivery_details_columns,
+                    header_columns=header_columns,
+                )
+            )
+
+            files_columns = [
+                row[1] for row in self._connection.execute("PRAGMA table_info(files)")
+            ]
+            if "extra" not in files_columns:
+                self._connection.execute("ALTER TABLE files ADD COLUMN extra TEXT")
+
+    def _select(self, where="", parameters=()):
+        columns = (
+            ["files.hash", "files.filepath", "files.local_time", "files.extra"]
+            + ["delivery_details.{}".format(field) for field in DELIVERY_DETAILS_FIELDS]
+            + ["headers.{}".format(field) for field in HEADER_FIELDS]
+        )
+
+        query = (
+            "SELECT {} FROM files "
+            "LEFT JOIN delivery_details ON delivery_details.hash = files.hash "
+            "LEFT JOIN headers ON headers.hash = files.hash {}".format(
+                ", ".join(columns), where
+            )
+        )
+
+        for row in self._connection.execute(query, parameters):
+            yield row[0], row_to_entry(row[1::])
+
+    def __getitem__(self, filehash):
+        for _, entry in self._select("WHERE files.hash = ?", (filehash,)):
+            return entry
+
+        raise KeyError(filehash)
+
+    def __setitem__(self, filehash, entry):
+        delivery_details = entry.get("delivery_details", {})
+        logfile_header = entry.get("logfile_header", {})
+
+        self._connection.execute("DELETE FROM files WHERE hash = ?", (filehash,))
+        extra = extra_entry_fields(entry)
+        self._connection.execute(
+            "INSERT INTO files (hash, filepath, local_time, extra) "
+            "VALUES (?, ?, ?, ?)",
+            (
+                filehash,
+                entry.get("filepath"),
+                entry.get("local_time"),
+                json.dumps(extra) if extra else None,
+            ),
+        )
+        self._connection.execute(
+            "INSERT INTO delivery_details (hash, {}) VALUES (?{})".format(
+                ", ".join(DELIVERY_DETAILS_FIELDS), ", ?" * len(DELIVERY_DETAILS_FIELDS)
+            ),
+            (filehash,)
+            + tuple(delivery_details.get(field) for field in DELIVERY_DETAILS_FIELDS),
+        )
+        self._connection.execute(
+            "INSERT INTO headers (hash, {}) VALUES (?{})".format(
+                ", ".join(HEADER_FIELDS), ", ?" * len(HEADER_FIELDS)
+            ),
+            (filehash,) + tuple(logfile_header.get(field) for field in HEADER_FIELDS),
+        )
+
+    def __delitem__(self, filehash):
+        if filehash not in self:
+            raise KeyError(filehash)
+
+        self._connection.execute("DELETE FROM files WHERE hash = ?", (filehash,))
+
+    def __contains__(self, filehash):
+        cursor = self._connection.execute(
+            "SELECT 1 FROM files WHERE hash = ?", (filehash,)
+        )
+
+        return cursor.fetchone() is not None
+
+    def __iter__(self):
+        for (filehash,) in self._connection.execute("SELECT hash FROM files"):
+            yield filehash
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def items(self):
+        """All of the entries, retrieved with a single query."""
+        return list(self._select())
+
+    def values(self):
+        return [entry for _, entry in self._select()]
+
+    def find(self, field_id=None, patient_id=None, machine=None, local_time=None):
+        """Find the entries matching all of the provided values.
+
+        ``local_time`` can either be a single time or a ``(start, end)``
+        pair, inclusive of both ends.
+        """
+        conditions = []
+        parameters = []
+
+        for column, value in (
+            ("delivery_details.field_id", field_id),
+            ("delivery_details.patient_id", patient_id),
+            ("headers.machine", machine),
+        ):
+            if value is not None:
+                conditions.append("{} = ?".format(column))
+                parameters.append(value)
+
+        if local_time is not None:
+            if isinstance(local_time, (tuple, list)):
+                conditions.append("files.local_time BETWEEN ? AND ?")
+                parameters += list(local_time)
+            else:
+                conditions.append("files.local_time = ?")
+                parameters.append(local_time)
+
+        where = ""
+        if conditions:
+            where = "WHERE " + " AND ".join(conditions)
+
+        return dict(self._select(where, tuple(parameters)))
+
+    def update_many(self, entries):
+        """Stage many ``(filehash, entry)`` pairs at once."""
+        for filehash, entry in entries:
+            self[filehash] = entry
+
+    def commit(self):
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        self.close()
+
+
+def extra_entry_fields(entry):
+    """The parts of an entry that are not held within the index columns."""
+    extra = {key: value for key, value in entry.items() if key not in ENTRY_FIELDS}
+
+    for key, fields in NESTED_ENTRY_FIELDS:
+        unknown = {
+            field: value
+            for field, value in entry.get(key, {}).items()
+            if field not in fields
+        }
+        if unknown:
+            extra[key] = unknown
+
+    return extra
+
+
+def row_to_entry(row):
+    filepath, local_time, extra = row[0:3]
+
+    delivery_details_values = row[3 : 3 + len(DELIVERY_DETAILS_FIELDS)]
+    header_values = row[3 + len(DELIVERY_DETAILS_FIELDS) : :]
+
+    delivery_details = dict(zip(DELIVERY_DETAILS_FIELDS, delivery_details_values))
+    for field in BOOLEAN_DELIVERY_DETAILS_FIELDS:
+        if delivery_details[field] is not None:
+            delivery_details[field] = bool(delivery_details[field])
+
+    entry = {
+        "filepath": filepath,
+        "delivery_details": delivery_details,
+        "logfile_header": dict(zip(HEADER_FIELDS, header_values)),
+        "local_time": local_time,
+    }
+
+    if extra is not None:
+        extra = json.loads(extra)
+        for key, _ in NESTED_ENTRY_FIELDS:
+            entry[key].update(extra.pop(key, {}))
+        entry.update(extra)
+
+    return entry
+
+
+LOGFILE_INDEX_BACKENDS = {
+    "sqlite": (SqliteLogfileIndex, SQLITE_INDEX_FILENAME),
+    "json": (JsonLogfileIndex, JSON_INDEX_FILENAME),
+}
+
+
+def open_logfile_index(data_directory, backend=None):
+    """Open the logfile index stored within a logfile data directory.
+
+    The first time the SQLite backend is opened within a directory that
+    holds an ``index.json`` the existing entries are migrated across. The
+    json file is left in place but is no longer updated. The migration is
+    written to a temporary file that only replaces the index once complete,
+    so that an interrupted migration is retried on the next open.
+
+    Args:
+        data_directory: The logfile data directory.
+        backend: Either ``"sqlite"`` or ``"json"``. Defaults to
+            ``"sqlite"``.
+    """
+    if backend is None:
+        backend = DEFAULT_INDEX_BACKEND
+
+    try:
+        index_class, filename = LOGFILE_INDEX_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(
+            "Unknown index backend {}. Expected one of {}".format(
+                backend, list(LOGFILE_INDEX_BACKENDS.keys())
+            )
+        )
+
+    filepath = os.path.join(data_directory, filename)
+    json_filepath = os.path.join(data_directory, JSON_INDEX_FILENAME)
+
+    needs_migration = (
+        index_class is SqliteLogfileIndex
+        and not os.path.exists(filepath)
+        and os.path.exists(json_filepath)
+    )
+
+    if needs_migration:
+        temp_filepath = "{}.migrating".format(filepath)
+        if os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
+
+        temp_index = index_class(temp_filepath)
+        try:
+            migrate_json_index(json_filepath, temp_index)
+        finally:
+            temp_index.close()
+
+        os.replace(temp_filepath, filepath)
+
+    return index_class(filepath)
+
+
+def migrate_json_index(json_filepath, index):
+    """Copy every entry of a json index into another index within a
+    single transaction.
+    """
+    with open(json_filepath, "r") as json_data_file:
+        json_index = json.load(json_data_file)
+
+    try:
+        for filehash, entry in json_index.items():
+            index[filehash] = entry
+    except BaseException:
+        if hasattr(index, "rollback"):
+            index.rollback()
+        raise
+
+    index.commit()
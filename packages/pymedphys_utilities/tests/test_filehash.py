@@ -0,0 +1,128 @@
+# Copyright (C) 2015-2018 Simon Biggs
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+
+"""Test the concurrent and cached file hashing."""
+
+import hashlib
+import os
+
+import pymedphys_utilities.filehash.core
+from pymedphys_utilities.filehash import FileHashCache, hash_file, hash_files
+
+
+def create_files(directory):
+    contents = [b"", b"a", os.urandom(3 * 2 ** 20 + 7)] + [
+        str(i).encode() * 100 for i in range(10)
+    ]
+
+    filepaths = []
+    for i, content in enumerate(contents):
+        filepath = os.path.join(str(directory), "{}.trf".format(i))
+        with open(filepath, "wb") as a_file:
+            a_file.write(content)
+        filepaths.append(filepath)
+
+    return filepaths, [hashlib.sha1(content).hexdigest() for content in contents]
+
+
+def test_hash_files_agrees_with_hashlib(tmp_path):
+    filepaths, expected = create_files(tmp_path)
+
+    assert hash_files(filepaths) == expected
+    assert hash_files(filepaths, workers=1) == expected
+    assert [hash_file(filepath) for filepath in filepaths] == expected
+
+
+def test_hash_cache(tmp_path, monkeypatch):
+    filepaths, expected = create_files(tmp_path)
+    cache_filepath = str(tmp_path / "filehash_cache.sqlite")
+
+    hashed = []
+    original_hash_file_contents = pymedphys_utilities.filehash.core.hash_file_contents
+
+    def counting_hash_file_contents(filepath):
+        hashed.append(filepath)
+        return original_hash_file_contents(filepath)
+
+    monkeypatch.setattr(
+        pymedphys_utilities.filehash.core,
+        "hash_file_contents",
+        counting_hash_file_contents,
+    )
+
+    with FileHashCache(cache_filepath) as cache:
+        assert hash_files(filepaths, cache=cache) == expected
+        assert len(hashed) == len(filepaths)
+
+    hashed.clear()
+    with FileHashCache(cache_filepath) as cache:
+        assert hash_files(filepaths, cache=cache) == expected
+        assert hash_file(filepaths[0], cache=cache) == expected[0]
+        assert hashed == []
+
+        with open(filepaths[1], "ab") as a_file:
+            a_file.write(b"b")
+        stat = os.stat(filepaths[2])
+        os.utime(filepaths[2], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+        expected[1] = hashlib.sha1(b"ab").hexdigest()
+        assert hash_files(filepaths, cache=cache) == expected
+        assert sorted(hashed) == sorted(filepaths[1:3])
+
+        moved_filepath = os.path.join(str(tmp_path), "moved.trf")
+        os.rename(filepaths[3], moved_filepath)
+        cache.add(moved_filepath, expected[3])
+
+        hashed.clear()
+        assert hash_file(moved_filepath, cache=cache) == expected[3]
+        assert hashed == []
+        assert cache.get(filepaths[3]) is None
+
+
+def test_files_changed_while_hashing_are_not_cached(tmp_path, monkeypatch):
+    filepaths, expected = create_files(tmp_path)
+    cache_filepath = str(tmp_path / "filehash_cache.sqlite")
+
+    original_hash_file_contents = pymedphys_utilities.filehash.core.hash_file_contents
+
+    def hash_then_append(filepath):
+        filehash = original_hash_file_contents(filepath)
+        if filepath in filepaths[0:2]:
+            with open(filepath, "ab") as a_file:
+                a_file.write(b"appended")
+
+        return filehash
+
+    monkeypatch.setattr(
+        pymedphys_utilities.filehash.core, "hash_file_contents", hash_then_append
+    )
+
+    with FileHashCache(cache_filepath) as cache:
+        assert hash_files(filepaths[1::], cache=cache) == expected[1::]
+        assert hash_file(filepaths[0], cache=cache) == expected[0]
+
+        assert cache.get(filepaths[0]) is None
+        assert cache.get(filepaths[1]) is None
+        assert cache.get(filepaths[2]) == expected[2]
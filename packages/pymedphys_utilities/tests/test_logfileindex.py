@@ -0,0 +1,196 @@
+# Copyright (C) 2015-2018 Simon Biggs
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version (the "AGPL-3.0+").
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License and the additional terms for more
+# details.
+
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# ADDITIONAL TERMS are also included as allowed by Section 7 of the GNU
+# Affero General Public License. These additional terms are Sections 1, 5,
+# 6, 7, 8, and 9 from the Apache License, Version 2.0 (the "Apache-2.0")
+# where all references to the definition "License" are instead defined to
+# mean the AGPL-3.0+.
+
+# You should have received a copy of the Apache-2.0 along with this
+# program. If not, see <http://www.apache.org/licenses/LICENSE-2.0>.
+
+
+"""Test the logfile index storage backends."""
+
+import json
+import os
+
+import pytest
+
+from pymedphys_utilities.utilities import (
+    get_index,
+    open_logfile_index,
+    JsonLogfileIndex,
+    SqliteLogfileIndex,
+)
+
+
+def create_entry(i):
+    return {
+        "filepath": os.path.join("centre", "patient_{}".format(i % 3), "a.trf"),
+        "delivery_details": {
+            "patient_id": "00{}".format(i % 3),
+            "field_id": 1000 + i % 5,
+            "last_name": "LAST",
+            "first_name": "First",
+            "qa_mode": i % 2 == 0,
+            "field_type": "VMAT",
+            "beam_completed": True,
+        },
+        "logfile_header": {
+            "machine": str(2619 + i % 2),
+            "date": "19/04/17 21:18:{:02d} Z".format(i),
+            "timezone": "+10:00",
+            "field_label": "1",
+            "field_name": "A field",
+        },
+        "local_time": "2019-04-17 07:{:02d}:00".format(i),
+    }
+
+
+JSON_INDEX = {"hash{}".format(i): create_entry(i) for i in range(20)}
+
+
+def test_migration_from_json(tmpdir):
+    data_directory = str(tmpdir)
+    with open(os.path.join(data_directory, "index.json"), "w") as json_file:
+        json.dump(JSON_INDEX, json_file)
+
+    with open_logfile_index(data_directory) as index:
+        assert isinstance(index, SqliteLogfileIndex)
+        assert len(index) == len(JSON_INDEX)
+        assert dict(index.items()) == JSON_INDEX
+        assert index["hash3"] == JSON_INDEX["hash3"]
+        assert "hash3" in index
+        assert "not a hash" not in index
+
+        with pytest.raises(KeyError):
+            index["not a hash"]  # pylint: disable=pointless-statement
+
+    # Migration only happens once, the json is not reread.
+    os.remove(os.path.join(data_directory, "index.json"))
+    with get_index({"linac_logfile_data_directory": data_directory}) as index:
+        assert set(index.keys()) == set(JSON_INDEX.keys())
+        assert index["hash10"]["delivery_details"]["qa_mode"] is True
+
+
+def test_unknown_fields_are_kept(tmpdir):
+    data_directory = str(tmpdir)
+
+    json_index = dict(JSON_INDEX)
+    entry = create_entry(20)
+    entry["delivery_details"]["site"] = "Prostate"
+    entry["logfile_header"]["version"] = 3
+    entry["notes"] = {"reviewed": True}
+    json_index["hash20"] = entry
+
+    with open(os.path.join(data_directory, "index.json"), "w") as json_file:
+        json.dump(json_index, json_file)
+
+    with open_logfile_index(data_directory) as index:
+        assert dict(index.items()) == json_index
+
+        del entry["notes"]
+        index["hash20"] = entry
+
+    with open_logfile_index(data_directory) as index:
+        assert index["hash20"] == entry
+        assert (
+            index.find(field_id=entry["delivery_details"]["field_id"])["hash20"]
+            == entry
+        )
+
+
+def test_interrupted_migration_is_retried(tmpdir, monkeypatch):
+    data_directory = str(tmpdir)
+    with open(os.path.join(data_directory, "index.json"), "w") as json_file:
+        json.dump(JSON_INDEX, json_file)
+
+    original_setitem = SqliteLogfileIndex.__setitem__
+
+    def interrupted_setitem(self, filehash, entry):
+        if filehash == "hash10":
+            raise RuntimeError("Interrupted")
+        original_setitem(self, filehash, entry)
+
+    monkeypatch.setattr(SqliteLogfileIndex, "__setitem__", interrupted_setitem)
+    with pytest.raises(RuntimeError):
+        open_logfile_index(data_directory)
+
+    assert not os.path.exists(os.path.join(data_directory, "index.sqlite"))
+
+    monkeypatch.setattr(SqliteLogfileIndex, "__setitem__", original_setitem)
+    with open_logfile_index(data_directory) as index:
+        assert dict(index.items()) == JSON_INDEX
+
+
+def test_queries(tmpdir):
+    with open_logfile_index(str(tmpdir)) as index:
+        index.update_many(JSON_INDEX.items())
+
+        expected = {
+            key: value
+            for key, value in JSON_INDEX.items()
+            if value["delivery_details"]["field_id"] == 1002
+            and value["logfile_header"]["machine"] == "2619"
+        }
+        assert index.find(field_id=1002, machine="2619") == expected
+
+        expected = {
+            key: value
+            for key, value in JSON_INDEX.items()
+            if value["delivery_details"]["patient_id"] == "001"
+            and "2019-04-17 07:05:00" <= value["local_time"] <= "2019-04-17 07:12:00"
+        }
+        assert (
+            index.find(
+                patient_id="001",
+                local_time=("2019-04-17 07:05:00", "2019-04-17 07:12:00"),
+            )
+            == expected
+        )
+
+
+def test_uncommitted_batch_is_discarded(tmpdir):
+    data_directory = str(tmpdir)
+
+    index = open_logfile_index(data_directory)
+    index["hash0"] = JSON_INDEX["hash0"]
+    index.commit()
+
+    index["hash1"] = JSON_INDEX["hash1"]
+    index["hash0"] = JSON_INDEX["hash2"]
+    del index["hash0"]
+    index.close()
+
+    with open_logfile_index(data_directory) as index:
+        assert dict(index.items()) == {"hash0": JSON_INDEX["hash0"]}
+
+
+def test_json_backend(tmpdir):
+    data_directory = str(tmpdir)
+
+    with open_logfile_index(data_directory, backend="json") as index:
+        assert isinstance(index, JsonLogfileIndex)
+        index.update(JSON_INDEX)
+
+    with open(os.path.join(data_directory, "index.json")) as json_file:
+        assert json.load(json_file) == JSON_INDEX
+
+    assert not os.path.exists(os.path.join(data_directory, "index.sqlite"))
+
+    with pytest.raises(ValueError):
+        open_logfile_index(data_directory, backend="not a backend")